@@ -0,0 +1,193 @@
+import re
+
+from netlist import Port, LogicGate, Net
+
+# Reader for the and-inverter graphs Yosys writes with write_aiger, in the
+# binary ("aig") and the ASCII ("aag") AIGER format. The graph is loaded
+# straight into LogicGates, Nets and Ports like the EDIF parser builds them:
+# every AND becomes an AND gate, every inverted literal one NOT gate shared by
+# all its readers, the constants GND/VCC cells and every latch a DFF whose D
+# pin is the next state literal. Nets are named n<variable> (n<variable>_inv
+# for inverted literals), so they are valid C++ identifiers.
+#
+# Ports come from the symbol table (write_aiger -symbols): the symbol "a[3]"
+# is bit 3 of port a. Inputs and outputs without a symbol are the bits of
+# the ports "in" and "out", in file order. Generated programs start every
+# flip flop at 0, so latches must be reset to 0 or left uninitialized.
+
+AIGER_EXTENSIONS = (".aig", ".aag")
+
+SYMBOL_RE = re.compile(r"^(.*)\[(\d+)\]$")
+
+
+def readVarint(data, offset):
+    # 7 bits per byte, least significant first; the high bit marks a
+    # following byte
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+def readLine(data, offset):
+    end = data.find(b"\n", offset)
+    if end == -1:
+        end = len(data)
+    return data[offset:end].decode("ascii", "replace").strip(), end + 1
+
+def portName(symbol):
+    # Yosys identifiers may hold characters that cannot appear in file names
+    # or port maps
+    return re.sub(r"[^A-Za-z0-9_]", "_", symbol)
+
+
+class AigerBuilder:
+    # turns AIGER literals into gates and nets, creating them on first use
+    def __init__(self):
+        self.gateList = []
+        self.netList = []
+        self.portList = []
+        self.nets = {} # literal -> net carrying it
+
+    def gate(self, function, id, inputs, literal):
+        # a gate of function reading the input literals and driving literal
+        newGate = LogicGate(function, id)
+        self.gateList.append(newGate)
+        for pin, inputLiteral in inputs:
+            net = self.net(inputLiteral)
+            net.setRight(newGate)
+            newGate.pins[pin] = net
+        net = self.net(literal)
+        net.setLeft(newGate)
+        newGate.pins["Y" if function != "DFF" else "Q"] = net
+        return newGate
+
+    def net(self, literal):
+        if literal in self.nets:
+            return self.nets[literal]
+        if literal < 2:
+            name = "const" + str(literal)
+        elif literal % 2 == 0:
+            name = "n" + str(literal // 2)
+        else:
+            name = "n" + str(literal // 2) + "_inv"
+        newNet = Net(name)
+        self.netList.append(newNet)
+        self.nets[literal] = newNet
+        if literal < 2:
+            self.gate("VCC" if literal else "GND", name + "_cell", [], literal)
+        elif literal % 2 == 1:
+            self.gate("NOT", "inv" + str(literal // 2), [("A", literal - 1)], literal)
+        return newNet
+
+    def ports(self, direction, literals, symbols, default):
+        # groups the bits of every symbol name into a port, in file order
+        bits = {} # port name -> {bit: literal}
+        unnamed = 0
+        for index, literal in enumerate(literals):
+            symbol = symbols.get(index)
+            if symbol is None:
+                name, bit = default, unnamed
+                unnamed += 1
+            else:
+                match = SYMBOL_RE.match(symbol)
+                if match:
+                    name, bit = portName(match.group(1)), int(match.group(2))
+                else:
+                    name, bit = portName(symbol), 0
+            bits.setdefault(name, {})[bit] = literal
+
+        for name, portBits in bits.items():
+            port = Port(name, direction, max(portBits) + 1)
+            for bit, literal in portBits.items():
+                port.nets[bit] = self.net(literal).name
+            # like the EDIF parser, skip inputs no logic reads (i.e. clocks)
+            if direction == "INPUT" and all(len(self.net(literal).right) == 0 for literal in portBits.values()):
+                continue
+            self.portList.append(port)
+
+
+def parseAiger(data):
+    # returns the input literals, latches (literal, next state), outputs,
+    # ANDs (literal, rhs0, rhs1) and the symbol table of an AIGER file
+    header, offset = readLine(data, 0)
+    fields = header.split()
+    if len(fields) < 6 or fields[0] not in ("aig", "aag"):
+        raise ValueError("not an AIGER file: " + header)
+    binary = fields[0] == "aig"
+    maxVar, inputCount, latchCount, outputCount, andCount = [int(field) for field in fields[1:6]]
+    if any(int(field) != 0 for field in fields[6:]):
+        raise ValueError("AIGER properties (bad states, constraints, justice, fairness) are not supported")
+
+    inputs = []
+    for index in range(inputCount):
+        if binary:
+            inputs.append(2 * (index + 1))
+        else:
+            line, offset = readLine(data, offset)
+            inputs.append(int(line))
+
+    latches = []
+    for index in range(latchCount):
+        line, offset = readLine(data, offset)
+        values = [int(value) for value in line.split()]
+        if binary:
+            values.insert(0, 2 * (inputCount + index + 1))
+        literal, nextState = values[0], values[1]
+        init = values[2] if len(values) > 2 else 0
+        if init not in (0, literal):
+            raise ValueError("latch " + str(literal) + " starts at 1, generated programs reset flip flops to 0")
+        latches.append((literal, nextState))
+
+    outputs = []
+    for index in range(outputCount):
+        line, offset = readLine(data, offset)
+        outputs.append(int(line))
+
+    ands = []
+    for index in range(andCount):
+        if binary:
+            literal = 2 * (inputCount + latchCount + index + 1)
+            delta, offset = readVarint(data, offset)
+            rhs0 = literal - delta
+            delta, offset = readVarint(data, offset)
+            ands.append((literal, rhs0, rhs0 - delta))
+        else:
+            line, offset = readLine(data, offset)
+            literal, rhs0, rhs1 = [int(value) for value in line.split()]
+            ands.append((literal, rhs0, rhs1))
+
+    symbols = {"i": {}, "l": {}, "o": {}}
+    while offset < len(data):
+        line, offset = readLine(data, offset)
+        if line == "c": # comments up to the end of the file
+            break
+        kind = line[:1]
+        if kind in symbols and " " in line:
+            index, name = line[1:].split(" ", 1)
+            symbols[kind][int(index)] = name.split()[0]
+
+    if maxVar < inputCount + latchCount + andCount:
+        raise ValueError("AIGER header declares " + str(maxVar) + " variables, the file uses more")
+    return inputs, latches, outputs, ands, symbols
+
+def readAiger(filename):
+    # parse an AIGER file and return (gateList, netList, portList)
+    aiger_file = open(filename, "rb")
+    inputs, latches, outputs, ands, symbols = parseAiger(aiger_file.read())
+    aiger_file.close()
+
+    builder = AigerBuilder()
+    for literal in inputs + outputs:
+        builder.net(literal)
+    for literal, nextState in latches:
+        builder.gate("DFF", "dff" + str(literal // 2), [("D", nextState)], literal)
+    for literal, rhs0, rhs1 in ands:
+        builder.gate("AND", "and" + str(literal // 2), [("A", rhs0), ("B", rhs1)], literal)
+    builder.ports("INPUT", inputs, symbols["i"], "in")
+    builder.ports("OUTPUT", outputs, symbols["o"], "out")
+    return builder.gateList, builder.netList, builder.portList
@@ -0,0 +1,68 @@
+from compact import CompactNetlist, collectNets, ffDependency, schedule, pinnedNets, allocate
+
+# The analysis passes run on the compact form of the netlist (see compact.py),
+# these wrappers hand gates and nets in and out.
+
+def scheduleGates(gateList):
+    # the combinational gates in evaluation order (see compact.schedule); also
+    # assigns gate.level
+    ir = CompactNetlist(gateList, collectNets(gateList))
+    order, levels = schedule(ir)
+    for index, gate in enumerate(gateList):
+        gate.level = levels[index]
+    return [gateList[gate] for gate in order]
+
+def groupByLevel(gateOrder):
+    # splits the scheduled gates into logic levels; gates within a level
+    # never depend on each other and can be evaluated concurrently
+    levels = []
+    for gate in gateOrder:
+        while len(levels) < gate.level:
+            levels.append([])
+        levels[gate.level - 1].append(gate)
+    return levels
+
+# approximate size of one ciphertext with the 110-bit parameters from keygen.c
+# (n = 630 mask coefficients plus the body, 32 bits each, and the variance)
+CIPHERTEXT_BYTES = 631 * 4 + 8
+
+def analyzeNetlist(gateList, netList, portList):
+    # runs the analysis passes and sets gate.dependsOnFF and gate.level for
+    # the code generators. Returns the number of loop-invariant gates, the
+    # gate order and allocateSlots(parallel, partition=None), which returns
+    # the ciphertext slot of every net of the netlist (or of the partition)
+    # and the slot count.
+    nets = collectNets(gateList, netList)
+    ir = CompactNetlist(gateList, nets)
+    dependsOnFF = ffDependency(ir)
+    order, levels = schedule(ir)
+    for index, gate in enumerate(gateList):
+        gate.dependsOnFF = bool(dependsOnFF[index])
+        gate.level = levels[index]
+    pinned = pinnedNets(ir, dependsOnFF, portList)
+    ids = {} # gate or net -> id, only needed for partitions
+
+    def allocateSlots(parallel, partition=None):
+        netSlots = {}
+        if partition is None:
+            slots, slotCount = allocate(ir, order, levels, pinned, parallel)
+            for index, net in enumerate(netList):
+                netSlots[net] = slots[index]
+        else:
+            if not ids:
+                for index, gate in enumerate(gateList):
+                    ids[gate] = index
+                for index, net in enumerate(nets):
+                    ids[net] = index
+            local = set(ids[gate] for gate in partition.gates)
+            localOrder = [gate for gate in order if gate in local]
+            localPinned = pinnedNets(ir, dependsOnFF, portList, local)
+            slots, slotCount = allocate(ir, localOrder, levels, localPinned, parallel,
+                                        [ids[net] for net in partition.nets])
+            for net in partition.nets:
+                netSlots[net] = slots[ids[net]]
+        return netSlots, slotCount
+
+    invariantCount = len(dependsOnFF) - sum(dependsOnFF)
+    gateOrder = [gateList[gate] for gate in order]
+    return invariantCount, gateOrder, allocateSlots
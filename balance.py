@@ -0,0 +1,239 @@
+import heapq
+
+from netlist import LogicGate, Net, isFlipFlop
+from analysis import scheduleGates
+from optimize import bootstrapCost, removeGate
+
+# Associative AND/OR/XOR trees are collected into "supergates" (the root and
+# every single-fanout gate of the same operation below it) and rebuilt as
+# balanced trees, combining the inputs that are ready earliest first. This
+# shortens the chain of bootstrapped gates that bounds the latency of the
+# parallel evaluation without changing the number of gates, unless shared
+# gates are duplicated.
+
+# root function -> (operation of the tree below it, functions that can be
+# absorbed into that tree)
+TREE_OPS = {
+    "AND": ("AND", ("AND", "AN2")), "AN2": ("AND", ("AND", "AN2")),
+    "NAND": ("AND", ("AND", "AN2")), "ND2": ("AND", ("AND", "AN2")),
+    "OR": ("OR", ("OR",)),
+    "NOR": ("OR", ("OR",)), "NR2": ("OR", ("OR",)),
+    "XOR": ("XOR", ("XOR", "XNOR")),
+    "XNOR": ("XOR", ("XOR", "XNOR")),
+}
+
+# shared gates are copied into at most this many tree inputs
+MAX_LEAVES = 16
+
+# inverted outputs: the root keeps them, inner XNORs flip the tree's parity
+INVERTED = ("NAND", "ND2", "NOR", "NR2", "XNOR")
+
+def updateArrival(gate, arrival):
+    # number of bootstrapped gates on the longest path into the gate's output
+    time = max([arrival.get(net, 0) for net in gate.inputNets] + [0]) + min(bootstrapCost(gate), 1)
+    for net in gate.outputNets:
+        arrival[net] = time
+
+def arrivalTimes(gateOrder):
+    arrival = {}
+    for gate in gateOrder:
+        updateArrival(gate, arrival)
+    return arrival
+
+def criticalGates(gateOrder):
+    # gates on a longest path, the only ones worth duplicating logic for
+    arrival = arrivalTimes(gateOrder)
+    required = {}
+    for net in arrival:
+        if len(net.right) == 0 or any(isFlipFlop(reader) for reader in net.right):
+            required[net] = max(list(arrival.values()) + [0])
+    critical = set()
+    for gate in reversed(gateOrder):
+        if len(gate.outputNets) == 0 or gate.outputNets[0] not in required:
+            continue
+        time = required[gate.outputNets[0]]
+        if time == arrival[gate.outputNets[0]]:
+            critical.add(gate)
+        time -= min(bootstrapCost(gate), 1)
+        for net in gate.inputNets:
+            required[net] = min(required.get(net, time), time)
+    return critical
+
+def bootstrapDepth(gateList):
+    arrival = arrivalTimes(scheduleGates(gateList))
+    return max(list(arrival.values()) + [0])
+
+def absorbable(net, functions, portNets, duplicate=False):
+    # net is computed by a gate that can be collected into the tree. Without
+    # duplicate, the gate must only feed the tree so it disappears with it.
+    if len(net.left) != 1 or (len(net.right) != 1 and not duplicate) or net.name in portNets:
+        return None
+    gate = net.left[0]
+    if isFlipFlop(gate) or gate.function not in functions:
+        return None
+    return gate
+
+def collectTree(root, portNets, duplicate=False):
+    # returns the inputs of the supergate rooted at root, the absorbed gates
+    # and the parity of absorbed inverted (XNOR) gates
+    functions = TREE_OPS[root.function][1]
+    leaves = []
+    inner = []
+    parity = 0
+    pending = list(root.inputNets)
+    while pending:
+        net = pending.pop()
+        gate = absorbable(net, functions, portNets, duplicate)
+        if gate is None or (duplicate and len(leaves) + len(pending) + 2 > MAX_LEAVES):
+            leaves.append(net)
+            continue
+        inner.append(gate)
+        if gate.function in INVERTED:
+            parity ^= 1
+        pending.extend(gate.inputNets)
+    return leaves, inner, parity
+
+def simplifyLeaves(op, leaves):
+    # AND/OR are idempotent, XOR inputs cancel in pairs
+    if op == "XOR":
+        counts = {}
+        for net in leaves:
+            counts[net] = counts.get(net, 0) + 1
+        return [net for net in counts if counts[net] % 2 == 1]
+    unique = []
+    for net in leaves:
+        if net not in unique:
+            unique.append(net)
+    return unique
+
+def addGate(function, inputNets, outputNet, gateList):
+    gate = LogicGate(function, outputNet.name)
+    gate.inputNets = list(inputNets)
+    gate.outputNets = [outputNet]
+    for net in inputNets:
+        net.right.append(gate)
+    outputNet.setLeft(gate)
+    gateList.append(gate)
+    return gate
+
+def planTree(leaves, arrival):
+    # pairs up the inputs that are ready earliest until two are left for the
+    # root. Nodes are numbered like the leaves, followed by one node per pair.
+    heap = [(arrival.get(net, 0), index) for index, net in enumerate(leaves)]
+    heapq.heapify(heap)
+    pairs = []
+    while len(heap) > 2:
+        timeA, nodeA = heapq.heappop(heap)
+        timeB, nodeB = heapq.heappop(heap)
+        pairs.append((nodeA, nodeB))
+        heapq.heappush(heap, (max(timeA, timeB) + 1, len(leaves) + len(pairs) - 1))
+    rootTime = max(time for time, node in heap) + 1
+    return pairs, [node for time, node in heap], rootTime
+
+def privateGates(root, inner):
+    # absorbed gates whose results are only used inside the tree
+    private = set([root])
+    changed = True
+    while changed:
+        changed = False
+        for gate in inner:
+            if gate not in private and all(reader in private for reader in gate.outputNets[0].right):
+                private.add(gate)
+                changed = True
+    private.remove(root)
+    return private
+
+def saveNetlist(gateList, netList):
+    # connections of every gate and net, to undo a rebuild that did not pay off
+    gates = [(gate, gate.function, list(gate.inputNets), list(gate.outputNets)) for gate in gateList]
+    nets = [(net, list(net.left), list(net.right)) for net in netList]
+    return gates, nets
+
+def restoreNetlist(saved, netDict):
+    gates, nets = saved
+    for gate, function, inputNets, outputNets in gates:
+        gate.function = function
+        gate.inputNets = inputNets
+        gate.outputNets = outputNets
+    known = set()
+    for net, left, right in nets:
+        net.left = left
+        net.right = right
+        known.add(net)
+    for name in list(netDict):
+        if netDict[name] not in known:
+            del netDict[name]
+
+def balanceNetlist(gateList, netList, portList, netDict, duplicate=False):
+    # rebuilds every supergate whose root can be computed earlier as a
+    # balanced tree; returns the new gate and net lists. With duplicate,
+    # gates shared with other logic are then copied into the critical trees
+    # that use them, trading extra gates for a shorter critical path. The
+    # copies are only kept if the depth of the whole circuit drops, a tree
+    # that gets faster next to an equally deep path gains nothing.
+    gateList, netList = rebuildTrees(gateList, netList, portList, netDict, False)
+    if not duplicate:
+        return gateList, netList
+    depth = bootstrapDepth(gateList)
+    saved = saveNetlist(gateList, netList)
+    duplicatedGates, duplicatedNets = rebuildTrees(gateList, netList, portList, netDict, True)
+    if bootstrapDepth(duplicatedGates) < depth:
+        return duplicatedGates, duplicatedNets
+    restoreNetlist(saved, netDict)
+    return gateList, netList
+
+def rebuildTrees(gateList, netList, portList, netDict, duplicate):
+    # one pass of balanceNetlist over the gates in schedule order
+    portNets = set()
+    for port in portList:
+        portNets.update(port.nets)
+
+    gateList = list(gateList)
+    netList = list(netList)
+    gateOrder = scheduleGates(gateList)
+    critical = criticalGates(gateOrder)
+    arrival = {}
+
+    for root in gateOrder:
+        updateArrival(root, arrival) # inputs may have been rebalanced already
+        if len(root.outputNets) != 1 or root.function not in TREE_OPS:
+            continue
+        output = root.outputNets[0]
+        reader = output.right[0] if len(output.right) == 1 else None
+        if reader is not None and reader.function in TREE_OPS \
+                and absorbable(output, TREE_OPS[reader.function][1], portNets) is not None:
+            continue # the tree is rebuilt from its root
+
+        op = TREE_OPS[root.function][0]
+        leaves, inner, parity = collectTree(root, portNets, duplicate and root in critical)
+        leaves = simplifyLeaves(op, leaves)
+        if len(inner) == 0 or len(leaves) < 2:
+            continue
+        pairs, rootOperands, rootTime = planTree(leaves, arrival)
+        if rootTime >= arrival[output]:
+            continue
+
+        for gate in privateGates(root, inner):
+            removeGate(gate)
+        nodes = list(leaves)
+        for nodeA, nodeB in pairs:
+            net = Net(output.name + "_bal" + str(len(nodes)))
+            netList.append(net)
+            netDict[net.name] = net
+            addGate(op, [nodes[nodeA], nodes[nodeB]], net, gateList)
+            arrival[net] = max(arrival.get(nodes[nodeA], 0), arrival.get(nodes[nodeB], 0)) + 1
+            nodes.append(net)
+
+        for net in root.inputNets:
+            if root in net.right:
+                net.right.remove(root)
+        if op == "XOR" and parity:
+            root.function = "XNOR" if root.function == "XOR" else "XOR"
+        root.inputNets = [nodes[node] for node in rootOperands]
+        for net in root.inputNets:
+            net.right.append(root)
+        arrival[output] = rootTime
+
+    gateList = [gate for gate in gateList if gate.outputNets]
+    netList = [net for net in netList if net.left or net.right or net.name in portNets]
+    return gateList, netList
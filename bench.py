@@ -0,0 +1,245 @@
+import argparse
+import contextlib
+import glob
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+# Benchmark harness for the generator: runs gen_circuit_secure.py on every
+# bundled ISCAS netlist and compares parse/analysis/emission times, peak
+# memory, gate and bootstrap counts, depth and generated code size with a
+# stored baseline (a separate one when rebalancing). Every circuit is also
+# simulated (simulate.py) before and after optimization over CHECK_TIMESTEPS
+# clock cycles, so that rewrites that break sequential circuits show up
+# although they shrink them.
+#
+#   python3 bench.py [CIRCUIT ...] [--timesteps T] [--parallel] [--rebalance]
+#                    [--duplicate] [--baseline FILE] [--update] [--output FILE]
+#
+# CIRCUIT filters by name (c6288, s27, ...). Netlists are the EDIF .txt files;
+# Verilog-only circuits are synthesized with Yosys first if it is installed
+# and skipped otherwise. Every circuit runs in a fresh process. Times come
+# from one generation; the peak memory is what a second generation allocates
+# (tracemalloc), so it leaves out the interpreter and the imported modules
+# and the tracing does not slow down the timed run. The exit status is 1 if a result regressed, if
+# optimization changed the outputs of a circuit or if rebalancing made a
+# circuit deeper or added gates without making it shallower.
+
+BENCHMARK_DIRS = ("ISCAS_85", "ISCAS_89")
+BASELINE_FILE = "bench_baseline.json"
+REBALANCE_BASELINE_FILE = "bench_baseline_rebalance.json"
+
+# times and memory may grow by this fraction before counting as a regression;
+# differences below MIN_SECONDS are noise
+TOLERANCE = 0.25
+MIN_SECONDS = 0.05
+TIME_METRICS = ("parse_seconds", "analysis_seconds", "emission_seconds")
+MEMORY_METRICS = ("peak_memory_kb",)
+# deterministic results, any increase is a regression
+COUNT_METRICS = ("gates", "bootstraps", "free_gates", "depth", "code_bytes")
+
+# random vectors and clock cycles of the functional check, enough cycles for
+# flip flop state to reach the outputs
+CHECK_VECTORS = 256
+CHECK_TIMESTEPS = 3
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def synthesize(verilog, workDir):
+    # EDIF netlist of a Verilog circuit, synthesized like the README describes
+    if shutil.which("yosys") is None:
+        return None
+    edif = os.path.join(workDir, os.path.splitext(os.path.basename(verilog))[0] + ".edif")
+    script = "read_verilog " + verilog + "; proc; flatten; aigmap -nand; write_edif " + edif
+    if subprocess.run(["yosys", "-q", "-p", script], capture_output=True).returncode != 0:
+        return None
+    return edif
+
+def findCircuits(names, workDir):
+    # (name, EDIF netlist or None) of every bundled circuit, in directory order
+    circuits = []
+    for directory in BENCHMARK_DIRS:
+        sources = {}
+        for path in glob.glob(os.path.join(ROOT, directory, "*")):
+            name, extension = os.path.splitext(os.path.basename(path))
+            if extension in (".txt", ".v"):
+                sources.setdefault(name, {})[extension] = path
+        for name in sorted(sources, key=lambda name: (len(name), name)):
+            if names and name not in names:
+                continue
+            if ".txt" in sources[name]:
+                circuits.append((name, sources[name][".txt"]))
+            else:
+                circuits.append((name, synthesize(sources[name][".v"], workDir)))
+    return circuits
+
+def measure(netlist, options):
+    # runs the generator in this process, which must be a fresh one
+    from gen_circuit_secure import DEFAULT_OPTIONS, generateCircuit
+    generatorOptions = dict(DEFAULT_OPTIONS)
+    generatorOptions.update(options)
+    stats = {}
+    workDir = tempfile.mkdtemp()
+    os.chdir(workDir)
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        generateCircuit(netlist, os.path.join(workDir, "circuit.cpp"), generatorOptions, stats)
+        tracemalloc.start()
+        generateCircuit(netlist, os.path.join(workDir, "circuit.cpp"), generatorOptions)
+        peakMemory = tracemalloc.get_traced_memory()[1] // 1024
+        tracemalloc.stop()
+    shutil.rmtree(workDir)
+    from simulate import checkNetlist
+    rebalance = generatorOptions["rebalance"]
+    mismatches = checkNetlist(netlist, max(generatorOptions["timesteps"], CHECK_TIMESTEPS), CHECK_VECTORS, 1,
+                              rebalance, rebalance and generatorOptions["duplicate"])
+    estimate = stats["estimate"]
+    return {
+        "parse_seconds": stats["parse_seconds"],
+        "analysis_seconds": stats["analysis_seconds"],
+        "emission_seconds": stats["emission_seconds"],
+        "peak_memory_kb": peakMemory,
+        "gates": stats["gates"],
+        "bootstraps": estimate["bootstraps"],
+        "free_gates": estimate["free_gates"],
+        "depth": estimate["depth"]["total"],
+        "code_bytes": estimate["code_bytes"],
+        "mismatches": mismatches,
+        "rebalance": stats.get("rebalance"),
+    }
+
+def runCircuit(netlist, options):
+    command = [sys.executable, os.path.abspath(__file__), "--run", netlist, "--options", json.dumps(options)]
+    result = subprocess.run(command, capture_output=True, text=True)
+    if result.returncode != 0:
+        return None, result.stderr.strip().split("\n")[-1]
+    return json.loads(result.stdout.strip().split("\n")[-1]), None
+
+def compareResults(results, baseline, tolerance):
+    # regressions and improvements against the baseline, as printable lines
+    regressions = []
+    improvements = []
+    for name in results:
+        # wrong outputs are a regression whatever the baseline says
+        if results[name]["mismatches"]:
+            regressions.append(name + " outputs differ from the unoptimized netlist for " +
+                               str(results[name]["mismatches"]) + " of " + str(CHECK_VECTORS) + " vectors")
+        rebalance = results[name]["rebalance"]
+        if rebalance is not None:
+            # balancing must pay for itself in depth
+            if rebalance["depth_after"] > rebalance["depth_before"]:
+                regressions.append(name + " rebalancing raised the depth from " + str(rebalance["depth_before"]) +
+                                   " to " + str(rebalance["depth_after"]))
+            elif rebalance["depth_after"] == rebalance["depth_before"] and \
+                    results[name]["gates"] > rebalance["gates_before"]:
+                added = results[name]["gates"] - rebalance["gates_before"]
+                regressions.append(name + " rebalancing added " + str(added) + " gates without reducing the depth")
+        if name not in baseline:
+            continue
+        for metric in TIME_METRICS + MEMORY_METRICS + COUNT_METRICS:
+            old = baseline[name].get(metric)
+            new = results[name][metric]
+            if old is None or new == old:
+                continue
+            line = name + " " + metric + ": " + str(round(old, 3)) + " -> " + str(round(new, 3))
+            if metric in COUNT_METRICS:
+                worse = new > old
+                better = new < old
+            else:
+                slack = max(old * tolerance, MIN_SECONDS if metric in TIME_METRICS else 0)
+                worse = new > old + slack
+                better = new < old - slack
+            if worse:
+                regressions.append(line)
+            elif better:
+                improvements.append(line)
+    return regressions, improvements
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the generator on the bundled ISCAS circuits.")
+    parser.add_argument("circuits", nargs="*", help="circuit names to run (default: all)")
+    parser.add_argument("--timesteps", type=int, default=1)
+    parser.add_argument("--parallel", action="store_true")
+    parser.add_argument("--rebalance", action="store_true")
+    parser.add_argument("--duplicate", action="store_true", help="duplicate shared gates when rebalancing")
+    parser.add_argument("--baseline", help="baseline file (default: " + BASELINE_FILE + ", " + REBALANCE_BASELINE_FILE +
+                        " with --rebalance)")
+    parser.add_argument("--update", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    parser.add_argument("--run", help=argparse.SUPPRESS)
+    parser.add_argument("--options", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run:
+        sys.path.insert(0, ROOT)
+        print(json.dumps(measure(args.run, json.loads(args.options))))
+        return
+
+    options = {"timesteps": args.timesteps, "parallel": args.parallel, "rebalance": args.rebalance}
+    if args.duplicate:
+        options["duplicate"] = True
+    if args.baseline is None:
+        args.baseline = os.path.join(ROOT, REBALANCE_BASELINE_FILE if args.rebalance else BASELINE_FILE)
+    workDir = tempfile.mkdtemp()
+    results = {}
+    print("%-8s %8s %8s %8s %9s %7s %7s %6s %9s" % ("circuit", "parse", "analyze", "emit", "peak", "gates",
+                                                     "boots", "depth", "code"))
+    for name, netlist in findCircuits(args.circuits, workDir):
+        if netlist is None:
+            print("%-8s skipped, Yosys is needed to synthesize it" % name)
+            continue
+        result, error = runCircuit(netlist, options)
+        if result is None:
+            print("%-8s failed: %s" % (name, error))
+            continue
+        results[name] = result
+        print("%-8s %7.2fs %7.2fs %7.2fs %7dKB %7d %7d %6d %7dKB" % (name, result["parse_seconds"],
+              result["analysis_seconds"], result["emission_seconds"], result["peak_memory_kb"],
+              result["gates"], result["bootstraps"], result["depth"], result["code_bytes"] // 1024))
+    shutil.rmtree(workDir)
+
+    if args.output:
+        output_file = open(args.output, "w")
+        json.dump({"options": options, "circuits": results}, output_file, indent=2, sort_keys=True)
+        output_file.close()
+
+    if args.update:
+        stored = {"options": options, "circuits": {}}
+        if os.path.exists(args.baseline):
+            baseline_file = open(args.baseline, "r")
+            stored = json.load(baseline_file)
+            baseline_file.close()
+            if stored["options"] != options:
+                stored = {"options": options, "circuits": {}}
+        stored["circuits"].update(results)
+        baseline_file = open(args.baseline, "w")
+        json.dump(stored, baseline_file, indent=2, sort_keys=True)
+        baseline_file.write("\n")
+        baseline_file.close()
+        print("Stored", len(results), "results in", args.baseline)
+        return
+
+    if not os.path.exists(args.baseline):
+        print("No baseline to compare with, run with --update to store one.")
+        return
+    baseline_file = open(args.baseline, "r")
+    baseline = json.load(baseline_file)
+    baseline_file.close()
+    if baseline["options"] != options:
+        print("The baseline was measured with other options:", json.dumps(baseline["options"], sort_keys=True))
+        return
+    regressions, improvements = compareResults(results, baseline["circuits"], args.tolerance)
+    for line in improvements:
+        print("improved:", line)
+    for line in regressions:
+        print("REGRESSED:", line)
+    print(len(regressions), "regressions,", len(improvements), "improvements against", args.baseline)
+    if regressions:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+// Measures how long every TFHE gate takes on this machine, for the runtime
+// prediction of gen_circuit_secure.py. It reads super_secret.key (see
+// keygen.c) and writes gate_costs.json next to it:
+//
+//    ./benchmark [REPETITIONS]
+//
+//   {"seconds": {"AND": <seconds per gate>, ...}, "threads": <OpenMP threads>,
+//    "speedup": <throughput of independent gates on all threads relative to one>}
+//
+// Built with OpenMP, it also evaluates a batch of independent gates on all
+// threads, like a level of the parallel mode, to measure the speedup.
+#include <iostream>
+#include <tfhe/tfhe.h>
+#include <tfhe/tfhe_io.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+#include <chrono>
+#include <string>
+#include <vector>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+using namespace std;
+
+// same names as the opcodes of codegen.py
+const char* GATE_NAMES[] = {"AND", "OR", "NOT", "NAND", "NOR", "XOR", "XNOR", "ZERO", "ONE",
+                            "ANDNY", "ANDYN", "ORNY", "ORYN", "MUX", "COPY"};
+const int GATE_COUNT = 15;
+
+void evalGate(int op, LweSample* out, const LweSample* a, const LweSample* b, const LweSample* c,
+              const TFheGateBootstrappingCloudKeySet* bk) {
+   switch (op) {
+      case 0: bootsAND(out, a, b, bk); break;
+      case 1: bootsOR(out, a, b, bk); break;
+      case 2: bootsNOT(out, a, bk); break;
+      case 3: bootsNAND(out, a, b, bk); break;
+      case 4: bootsNOR(out, a, b, bk); break;
+      case 5: bootsXOR(out, a, b, bk); break;
+      case 6: bootsXNOR(out, a, b, bk); break;
+      case 7: bootsCONSTANT(out, 0, bk); break;
+      case 8: bootsCONSTANT(out, 1, bk); break;
+      case 9: bootsANDNY(out, a, b, bk); break;
+      case 10: bootsANDYN(out, a, b, bk); break;
+      case 11: bootsORNY(out, a, b, bk); break;
+      case 12: bootsORYN(out, a, b, bk); break;
+      case 13: bootsMUX(out, a, b, c, bk); break;
+      case 14: bootsCOPY(out, a, bk); break;
+   }
+}
+
+double secondsSince(chrono::steady_clock::time_point start) {
+   return chrono::duration<double>(chrono::steady_clock::now() - start).count();
+}
+
+int main(int argc, char** argv) {
+   int repetitions = argc > 1 ? atoi(argv[1]) : 20;
+   if (repetitions < 1) {
+      repetitions = 1;
+   }
+
+   FILE* secret_key = fopen("super_secret.key", "rb");
+   if (secret_key == NULL) {
+      fprintf(stderr, "cannot open super_secret.key, run keygen first\n");
+      return 1;
+   }
+   TFheGateBootstrappingSecretKeySet* key = new_tfheGateBootstrappingSecretKeySet_fromFile(secret_key);
+   fclose(secret_key);
+   const TFheGateBootstrappingParameterSet* params = key->params;
+   const TFheGateBootstrappingCloudKeySet* bk = &key->cloud;
+
+   LweSample* inputs = new_gate_bootstrapping_ciphertext_array(3, params);
+   LweSample* output = new_gate_bootstrapping_ciphertext(params);
+   for (int i = 0; i < 3; i++) {
+      bootsSymEncrypt(&inputs[i], i % 2, key);
+   }
+
+   double seconds[GATE_COUNT];
+   for (int op = 0; op < GATE_COUNT; op++) {
+      evalGate(op, output, &inputs[0], &inputs[1], &inputs[2], bk); // warm up
+      chrono::steady_clock::time_point start = chrono::steady_clock::now();
+      for (int i = 0; i < repetitions; i++) {
+         evalGate(op, output, &inputs[0], &inputs[1], &inputs[2], bk);
+      }
+      seconds[op] = secondsSince(start) / repetitions;
+      printf("%-6s %.6f s\n", GATE_NAMES[op], seconds[op]);
+   }
+
+   int threads = 1;
+   double speedup = 1.0;
+#ifdef _OPENMP
+   threads = omp_get_max_threads();
+   int count = threads * repetitions;
+   LweSample* outputs = new_gate_bootstrapping_ciphertext_array(count, params);
+   chrono::steady_clock::time_point start = chrono::steady_clock::now();
+   #pragma omp parallel for schedule(dynamic, 1)
+   for (int i = 0; i < count; i++) {
+      bootsAND(&outputs[i], &inputs[0], &inputs[1], bk);
+   }
+   speedup = seconds[0] * count / secondsSince(start);
+   delete_gate_bootstrapping_ciphertext_array(count, outputs);
+   printf("%d threads evaluate independent gates %.1f times faster than one\n", threads, speedup);
+#endif
+
+   FILE* cost_file = fopen("gate_costs.json", "w");
+   if (cost_file == NULL) {
+      fprintf(stderr, "cannot write gate_costs.json\n");
+      return 1;
+   }
+   fprintf(cost_file, "{\"seconds\": {");
+   for (int op = 0; op < GATE_COUNT; op++) {
+      fprintf(cost_file, "%s\"%s\": %.9f", op > 0 ? ", " : "", GATE_NAMES[op], seconds[op]);
+   }
+   fprintf(cost_file, "}, \"threads\": %d, \"speedup\": %.3f}\n", threads, speedup);
+   fclose(cost_file);
+
+   delete_gate_bootstrapping_ciphertext(output);
+   delete_gate_bootstrapping_ciphertext_array(3, inputs);
+   delete_gate_bootstrapping_secret_keyset(key);
+   return 0;
+}
@@ -0,0 +1,58 @@
+import struct
+
+from codegen import gateOpcodeIndex
+
+# Compact circuit description read by evaluator.cpp. All integers are
+# little-endian uint32 unless noted otherwise.
+#
+#   header:     "RMEO", version, slot count, default cycle count, port count,
+#               flip flop count, invariant gate count, changing gate count
+#   port:       direction (uint8, 0 = input, 1 = output), width,
+#               name length (uint16), name, then for every bit:
+#               slot, net name length (uint16), net name
+#   flip flop:  Q slot, D slot
+#   gate:       opcode, logic level, output slot, 3 operand slots (NO_OPERAND if unused)
+#
+# Invariant gates are evaluated once, changing gates (the ones depending on a
+# flip flop) every clock cycle. Both lists are sorted by logic level and gates
+# of the same level may be evaluated concurrently.
+
+MAGIC = b"RMEO"
+VERSION = 1
+NO_OPERAND = 0xFFFFFFFF
+
+def packName(name):
+    data = name.encode()
+    return struct.pack("<H", len(data)) + data
+
+def packGate(gate, slots):
+    operands = [slots[net] for net in gate.inputNets]
+    while len(operands) < 3:
+        operands.append(NO_OPERAND)
+    return struct.pack("<6I", gateOpcodeIndex(gate), gate.level, slots[gate.outputNets[0]], *operands)
+
+def writeCircuit(filename, gateOrder, flipFlops, portList, netDict, slots, slotCount, timeSteps):
+    # slots must come from allocateSlots(parallel=True), as returned by
+    # analysis.analyzeNetlist(), because the evaluator runs the gates of a
+    # level concurrently
+    invariant = [gate for gate in gateOrder if not gate.dependsOnFF]
+    changing = [gate for gate in gateOrder if gate.dependsOnFF]
+
+    data = [struct.pack("<4s7I", MAGIC, VERSION, slotCount, timeSteps, len(portList),
+                        len(flipFlops), len(invariant), len(changing))]
+
+    for port in portList:
+        direction = 1 if "OUTPUT" in port.direction else 0
+        data.append(struct.pack("<BI", direction, port.length) + packName(port.name))
+        for name in port.nets:
+            data.append(struct.pack("<I", slots[netDict[name]]) + packName(name))
+
+    for gate in flipFlops:
+        data.append(struct.pack("<2I", slots[gate.outputNets[0]], slots[gate.inputNets[0]]))
+
+    for gate in invariant + changing:
+        data.append(packGate(gate, slots))
+
+    circuit_file = open(filename, "wb")
+    circuit_file.write(b"".join(data))
+    circuit_file.close()
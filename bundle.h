@@ -0,0 +1,208 @@
+// Ciphertext bundles hold all input (or output) ciphertexts of a circuit in a
+// single file, so wide ports do not turn into thousands of small files. They
+// are written by input.cpp and the generated programs and read by the
+// generated programs and the evaluator. Generated programs embed a copy of
+// this file.
+//
+// Reading maps the file into memory and points the mask of every input
+// ciphertext at its record, so loading costs page faults instead of a copy
+// or a parse per bit.
+//
+//   header:   "RMCB", version (uint32), LWE dimension n (uint32),
+//             entry count (uint32), payload offset (uint64)
+//   entry:    port name length (uint16), port name, bit (uint32),
+//             offset of the ciphertext in the file (uint64)
+//   payload:  starts at a page boundary, every ciphertext is stored as its
+//             n mask coefficients and its body (int32), followed by its
+//             variance (double) at the next multiple of 8 bytes
+//
+// Numbers are stored in the byte order of the machine (little-endian on
+// the x86 machines TFHE runs on).
+#include <stdio.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <map>
+#include <string>
+#include <vector>
+
+const uint32_t BUNDLE_VERSION = 1;
+const uint64_t BUNDLE_ALIGNMENT = 4096;
+
+struct CiphertextBundle {
+   int32_t n;
+   std::map<std::string, uint64_t> offsets; // "port[bit]" -> offset of the ciphertext
+   const char* data; // the mapped file
+   size_t size;
+   std::vector<LweSample*> samples; // ciphertexts whose masks point into the file
+   std::vector<int32_t*> masks; // their own masks, restored by releaseBundle()
+};
+
+struct BundleWriter {
+   std::vector<std::string> ports;
+   std::vector<uint32_t> bits;
+   std::vector<const LweSample*> samples;
+};
+
+static std::string bundleKey(const std::string& port, uint32_t bit) {
+   return port + "[" + std::to_string(bit) + "]";
+}
+
+static size_t bundleRecordSize(int32_t n) {
+   return (4 * (size_t) n + 4 + 7) / 8 * 8 + sizeof(double);
+}
+
+static void bundleError(const char* message, const std::string& detail) {
+   fprintf(stderr, "%s%s\n", message, detail.c_str());
+   exit(1);
+}
+
+// parses the header of a bundle whose first size bytes are at data
+static void parseBundleHeader(const char* data, size_t size, CiphertextBundle& bundle, const std::string& filename) {
+   uint32_t version, count;
+   uint64_t payload;
+   if (size < 24 || memcmp(data, "RMCB", 4) != 0) {
+      bundleError("not a ciphertext bundle: ", filename);
+   }
+   memcpy(&version, data + 4, 4);
+   memcpy(&bundle.n, data + 8, 4);
+   memcpy(&count, data + 12, 4);
+   memcpy(&payload, data + 16, 8);
+   if (version != BUNDLE_VERSION || payload > size) {
+      bundleError("unsupported or truncated ciphertext bundle: ", filename);
+   }
+
+   size_t position = 24;
+   for (uint32_t i = 0; i < count; i++) {
+      uint16_t length;
+      uint32_t bit;
+      uint64_t offset;
+      if (position + 2 > payload) {
+         bundleError("truncated ciphertext bundle: ", filename);
+      }
+      memcpy(&length, data + position, 2);
+      if (position + 2 + length + 12 > payload) {
+         bundleError("truncated ciphertext bundle: ", filename);
+      }
+      std::string port(data + position + 2, length);
+      memcpy(&bit, data + position + 2 + length, 4);
+      memcpy(&offset, data + position + 6 + length, 8);
+      if (offset + bundleRecordSize(bundle.n) > size) {
+         bundleError("truncated ciphertext bundle: ", filename);
+      }
+      bundle.offsets[bundleKey(port, bit)] = offset;
+      position += 14 + length;
+   }
+}
+
+// maps a bundle into memory, pages are only read when a ciphertext is used
+static void mapBundle(const char* filename, CiphertextBundle& bundle) {
+   int descriptor = open(filename, O_RDONLY);
+   struct stat status;
+   if (descriptor < 0 || fstat(descriptor, &status) != 0) {
+      bundleError("cannot open ", filename);
+   }
+   bundle.size = status.st_size;
+   // private and writable, so an accidental write never reaches the file
+   void* data = mmap(NULL, bundle.size, PROT_READ | PROT_WRITE, MAP_PRIVATE, descriptor, 0);
+   close(descriptor);
+   if (data == MAP_FAILED) {
+      bundleError("cannot map ", filename);
+   }
+   bundle.data = (const char*) data;
+   parseBundleHeader(bundle.data, bundle.size, bundle, filename);
+}
+
+static const char* findInBundle(const CiphertextBundle& bundle, const std::string& port, uint32_t bit, const TFheGateBootstrappingParameterSet* params) {
+   std::map<std::string, uint64_t>::const_iterator entry = bundle.offsets.find(bundleKey(port, bit));
+   if (entry == bundle.offsets.end()) {
+      bundleError("ciphertext bundle has no ", bundleKey(port, bit));
+   }
+   if (bundle.n != params->in_out_params->n) {
+      bundleError("ciphertext bundle does not match the key parameters for ", bundleKey(port, bit));
+   }
+   return bundle.data + entry->second;
+}
+
+// points the mask of sample at the ciphertext of a port bit in the mapped file
+static void pointToBundle(CiphertextBundle& bundle, const std::string& port, uint32_t bit, LweSample* sample, const TFheGateBootstrappingParameterSet* params) {
+   const char* record = findInBundle(bundle, port, bit, params);
+   bundle.samples.push_back(sample);
+   bundle.masks.push_back(sample->a);
+   sample->a = (int32_t*) record;
+   memcpy(&sample->b, record + 4 * (size_t) bundle.n, 4);
+   memcpy(&sample->current_variance, record + bundleRecordSize(bundle.n) - sizeof(double), sizeof(double));
+}
+
+// gives the ciphertexts their own masks back and unmaps the file; must be
+// called before the ciphertexts are deleted
+static void releaseBundle(CiphertextBundle& bundle) {
+   for (size_t i = 0; i < bundle.samples.size(); i++) {
+      bundle.samples[i]->a = bundle.masks[i];
+   }
+   bundle.samples.clear();
+   bundle.masks.clear();
+   munmap((void*) bundle.data, bundle.size);
+}
+
+static void addToBundle(BundleWriter& writer, const std::string& port, uint32_t bit, const LweSample* sample) {
+   writer.ports.push_back(port);
+   writer.bits.push_back(bit);
+   writer.samples.push_back(sample);
+}
+
+// header of a bundle holding the given port bits, padded to the first record.
+// Record i starts at the returned size plus i * bundleRecordSize(n).
+static std::vector<char> bundleHeader(const std::vector<std::string>& ports, const std::vector<uint32_t>& bits, int32_t n) {
+   uint32_t count = ports.size();
+   size_t headerSize = 24;
+   for (size_t i = 0; i < count; i++) {
+      headerSize += 14 + ports[i].size();
+   }
+   uint64_t payload = (headerSize + BUNDLE_ALIGNMENT - 1) / BUNDLE_ALIGNMENT * BUNDLE_ALIGNMENT;
+   std::vector<char> header(payload, 0);
+
+   memcpy(&header[0], "RMCB", 4);
+   memcpy(&header[4], &BUNDLE_VERSION, 4);
+   memcpy(&header[8], &n, 4);
+   memcpy(&header[12], &count, 4);
+   memcpy(&header[16], &payload, 8);
+   size_t position = 24;
+   for (size_t i = 0; i < count; i++) {
+      uint16_t length = ports[i].size();
+      uint64_t offset = payload + i * bundleRecordSize(n);
+      memcpy(&header[position], &length, 2);
+      memcpy(&header[position + 2], ports[i].data(), length);
+      memcpy(&header[position + 2 + length], &bits[i], 4);
+      memcpy(&header[position + 6 + length], &offset, 8);
+      position += 14 + length;
+   }
+   return header;
+}
+
+static void storeRecord(char* record, const LweSample* sample, int32_t n) {
+   memcpy(record, sample->a, 4 * (size_t) n);
+   memcpy(record + 4 * (size_t) n, &sample->b, 4);
+   memcpy(record + bundleRecordSize(n) - sizeof(double), &sample->current_variance, sizeof(double));
+}
+
+// writes the header and every ciphertext with a single fwrite
+static void writeBundle(const BundleWriter& writer, const char* filename, const TFheGateBootstrappingParameterSet* params) {
+   int32_t n = params->in_out_params->n;
+   std::vector<char> data = bundleHeader(writer.ports, writer.bits, n);
+   size_t payload = data.size();
+   data.resize(payload + writer.samples.size() * bundleRecordSize(n), 0);
+   for (size_t i = 0; i < writer.samples.size(); i++) {
+      storeRecord(&data[payload + i * bundleRecordSize(n)], writer.samples[i], n);
+   }
+
+   FILE* bundle_file = fopen(filename, "wb");
+   if (bundle_file == NULL || fwrite(data.data(), 1, data.size(), bundle_file) != data.size()) {
+      bundleError("cannot write ", filename);
+   }
+   fclose(bundle_file);
+}
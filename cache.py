@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+# Content-addressed cache of generated circuits. An entry is keyed by the
+# hash of the EDIF netlist, the generator options and the generator's own
+# sources, so editing any of them never returns stale code. It holds the
+# generated files (and the compiled program, once built) under fixed role
+# names. The least recently used entries are evicted once the cache grows
+# beyond CACHE_LIMIT bytes.
+#
+#   python3 cache.py                 list the entries, most recently used first
+#   python3 cache.py prune [<MB>]    evict entries until the cache fits in MB
+#   python3 cache.py clear           remove every entry
+
+CACHE_DIR = os.environ.get("ROMEO_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "romeo"))
+CACHE_LIMIT = int(os.environ.get("ROMEO_CACHE_LIMIT_MB", "2048")) * 1024 * 1024
+ENTRY_FILE = "entry.json"
+
+GENERATOR_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def hashFile(digest, filename):
+    data_file = open(filename, "rb")
+    for block in iter(lambda: data_file.read(1 << 20), b""):
+        digest.update(block)
+    data_file.close()
+
+def cacheKey(inputFile, options):
+    # hash of the netlist, the options and every generator source
+    digest = hashlib.sha256()
+    hashFile(digest, inputFile)
+    digest.update(json.dumps(options, sort_keys=True).encode())
+    for name in sorted(os.listdir(GENERATOR_DIR)):
+        if name.endswith(".py") or name.endswith(".h"):
+            digest.update(name.encode())
+            hashFile(digest, os.path.join(GENERATOR_DIR, name))
+    return digest.hexdigest()
+
+def entrySize(path):
+    size = 0
+    for name in os.listdir(path):
+        size += os.path.getsize(os.path.join(path, name))
+    return size
+
+def listEntries():
+    # (last use, key, size, description) of every entry, most recent first
+    entries = []
+    if not os.path.isdir(CACHE_DIR):
+        return entries
+    for key in os.listdir(CACHE_DIR):
+        path = os.path.join(CACHE_DIR, key)
+        if not os.path.isfile(os.path.join(path, ENTRY_FILE)):
+            continue
+        entry_file = open(os.path.join(path, ENTRY_FILE), "r")
+        description = json.load(entry_file)
+        entry_file.close()
+        entries.append((os.path.getmtime(path), key, entrySize(path), description))
+    entries.sort(reverse=True)
+    return entries
+
+def lookup(key, roles):
+    # returns the entry directory if it holds every role, marking it as used
+    path = os.path.join(CACHE_DIR, key)
+    for role in roles:
+        if not os.path.isfile(os.path.join(path, role)):
+            return None
+    os.utime(path)
+    return path
+
+def restore(path, files):
+    # copies the cached roles to their destinations (role -> filename)
+    for role in files:
+        shutil.copy2(os.path.join(path, role), files[role])
+
+def store(key, files, description):
+    # adds the files (role -> filename) to the entry for key, replacing the
+    # roles it already had, and evicts old entries if the cache is too big
+    path = os.path.join(CACHE_DIR, key)
+    staging = path + ".tmp" + str(os.getpid())
+    shutil.rmtree(staging, ignore_errors=True)
+    if os.path.isdir(path):
+        shutil.copytree(path, staging)
+    else:
+        os.makedirs(staging)
+    for role in files:
+        shutil.copy2(files[role], os.path.join(staging, role))
+    entry_file = open(os.path.join(staging, ENTRY_FILE), "w")
+    json.dump(description, entry_file, sort_keys=True)
+    entry_file.close()
+
+    # the entry appears at once, readers never see it half written
+    shutil.rmtree(path, ignore_errors=True)
+    os.rename(staging, path)
+    prune(CACHE_LIMIT, key)
+
+def prune(limit, keep=None):
+    # evicts the least recently used entries until the cache fits in limit
+    # bytes; returns the number of evicted entries
+    entries = listEntries()
+    total = sum(size for used, key, size, description in entries)
+    evicted = 0
+    for used, key, size, description in reversed(entries):
+        if total <= limit:
+            break
+        if key == keep:
+            continue
+        shutil.rmtree(os.path.join(CACHE_DIR, key), ignore_errors=True)
+        total -= size
+        evicted += 1
+    return evicted
+
+def main():
+    command = sys.argv[1] if len(sys.argv) > 1 else "list"
+    if command == "list":
+        entries = listEntries()
+        for used, key, size, description in entries:
+            print(key[:16], time.strftime("%Y-%m-%d %H:%M", time.localtime(used)), str(size // 1024) + " KB",
+                  description["netlist"], json.dumps(description["options"], sort_keys=True))
+        total = sum(size for used, key, size, description in entries)
+        print(len(entries), "entries,", total // 1024, "KB of", CACHE_LIMIT // 1024, "KB in", CACHE_DIR)
+    elif command == "prune":
+        limit = int(sys.argv[2]) * 1024 * 1024 if len(sys.argv) > 2 else CACHE_LIMIT
+        print("Evicted", prune(limit), "entries.")
+    elif command == "clear":
+        print("Evicted", prune(0), "entries.")
+    else:
+        print("usage: python3 cache.py [list | prune [<MB>] | clear]")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+import os
+
+from netlist import CELL_OPS, OPCODES
+from analysis import groupByLevel
+
+# TFHE statement of every operation, {out}, {a}, {b} and {c} are ciphertext
+# pointers
+OP_STATEMENTS = {
+    "AND": "bootsAND({out}, {a}, {b}, bk);",
+    "OR": "bootsOR({out}, {a}, {b}, bk);",
+    "NOT": "bootsNOT({out}, {a}, bk);",
+    "NAND": "bootsNAND({out}, {a}, {b}, bk);",
+    "NOR": "bootsNOR({out}, {a}, {b}, bk);",
+    "XOR": "bootsXOR({out}, {a}, {b}, bk);",
+    "XNOR": "bootsXNOR({out}, {a}, {b}, bk);",
+    "ZERO": "bootsCONSTANT({out}, 0, bk);",
+    "ONE": "bootsCONSTANT({out}, 1, bk);",
+    "ANDNY": "bootsANDNY({out}, {a}, {b}, bk);", # not a and b
+    "ANDYN": "bootsANDYN({out}, {a}, {b}, bk);", # a and not b
+    "ORNY": "bootsORNY({out}, {a}, {b}, bk);", # not a or b
+    "ORYN": "bootsORYN({out}, {a}, {b}, bk);", # a or not b
+    "MUX": "bootsMUX({out}, {a}, {b}, {c}, bk);", # a ? b : c
+    "COPY": "bootsCOPY({out}, {a}, bk);",
+}
+
+def netRef(net):
+    # pointer to the ciphertext carried by a net
+    return "&" + net.name + "[0]"
+
+def gateOp(gate):
+    if gate.function not in CELL_OPS:
+        raise ValueError("unsupported cell " + gate.function + " (" + gate.id + ")")
+    return CELL_OPS[gate.function]
+
+def formatStatement(op, out, operands):
+    # fills in the TFHE statement of op, unused operands are passed as NULL
+    operands = operands + ["NULL"] * (3 - len(operands))
+    return OP_STATEMENTS[op].format(out=out, a=operands[0], b=operands[1], c=operands[2])
+
+def gateCall(gate):
+    # TFHE statement that evaluates a logic gate
+    return formatStatement(gateOp(gate), netRef(gate.outputNets[0]), [netRef(net) for net in gate.inputNets])
+
+def flipFlopReset(gate):
+    # flip flops start at 0
+    return "bootsCONSTANT(" + netRef(gate.outputNets[0]) + ", 0, bk);"
+
+def flipFlopUpdate(flipFlops):
+    # statements that latch every D input into its flip flop at a clock edge.
+    # A D input that is itself a flip flop output is first saved in the
+    # flip flop's next_state ciphertext, so it is not overwritten before it
+    # has been read.
+    stateNets = set()
+    for gate in flipFlops:
+        stateNets.update(gate.outputNets)
+
+    saves = []
+    copies = []
+    for gate in flipFlops:
+        gate.next_state = ""
+        source = netRef(gate.inputNets[0])
+        if gate.inputNets[0] in stateNets:
+            gate.next_state = gate.id + "_next"
+            saves.append("bootsCOPY(" + gate.next_state + ", " + source + ", bk);")
+            source = gate.next_state
+        copies.append("bootsCOPY(" + netRef(gate.outputNets[0]) + ", " + source + ", bk);")
+    return saves + copies
+
+def gateOpcode(gate):
+    # enum value used by the level tables of the parallel mode
+    return "GATE_" + gateOp(gate)
+
+def gateOpcodeIndex(gate):
+    # numeric opcode used by the binary circuit format
+    return OPCODES.index(gateOp(gate))
+
+def parallelTypes():
+    # gate table types of the parallel mode
+    code = "enum GateOp {\n"
+    for op in OPCODES:
+        code += "   GATE_" + op + ",\n"
+    code += "};\n\n"
+    code += "struct Gate {\n"
+    code += "   GateOp op;\n"
+    code += "   LweSample* out;\n"
+    code += "   const LweSample* a;\n"
+    code += "   const LweSample* b;\n"
+    code += "   const LweSample* c;\n"
+    code += "};\n\n"
+    return code
+
+def parallelHelpers(profile=False, types=True):
+    # C++ that evaluates a table of independent gates on all OpenMP threads.
+    # The thread count is taken from OMP_NUM_THREADS at runtime. With profile,
+    # every gate is timed (profile.h has to come first). Without types, the
+    # gate table types come from a header.
+    code = parallelTypes() if types else ""
+    code += "void evalGate(const Gate& gate, const TFheGateBootstrappingCloudKeySet* bk) {\n"
+    code += "   switch (gate.op) {\n"
+    for op in OPCODES:
+        code += "      case GATE_" + op + ": " + formatStatement(op, "gate.out", ["gate.a", "gate.b", "gate.c"]) + " break;\n"
+    code += "   }\n"
+    code += "}\n\n"
+    code += "// gates within a level are independent, so any thread can evaluate any of them\n"
+    code += "void evalLevel(const Gate* gates, int count, const TFheGateBootstrappingCloudKeySet* bk) {\n"
+    code += "   #pragma omp parallel for schedule(dynamic, 1)\n"
+    code += "   for (int i = 0; i < count; i++) {\n"
+    if profile:
+        code += "      double start = profileClock();\n"
+        code += "      evalGate(gates[i], bk);\n"
+        code += "      profileGate(gates[i].op, 0, start);\n"
+    else:
+        code += "      evalGate(gates[i], bk);\n"
+    code += "   }\n"
+    code += "}\n\n"
+    return code
+
+def levelTable(name, gates):
+    # static description of one logic level for evalLevel()
+    table = "   Gate " + name + "[] = {\n"
+    for gate in gates:
+        operands = [net.name for net in gate.inputNets]
+        operands = operands + ["NULL"] * (3 - len(operands))
+        table += "      {" + gateOpcode(gate) + ", " + gate.outputNets[0].name + ", " + ", ".join(operands) + "},\n"
+    return table + "   };\n"
+
+def bundleHelpers():
+    # C++ that reads and writes ciphertext bundles, copied from bundle.h so
+    # that generated programs stay self-contained
+    bundle_file = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "bundle.h"), "r")
+    code = bundle_file.read()
+    bundle_file.close()
+    return code + "\n"
+
+def profileHelpers():
+    # C++ timers and gate counters of profiled programs, copied from profile.h
+    # like the bundle helpers
+    profile_file = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "profile.h"), "r")
+    code = profile_file.read()
+    profile_file.close()
+    return code + "\n"
+
+# the timers other translation units call, defined by profile.h
+PROFILE_DECLARATIONS = "double profileClock();\n" + \
+    "void profileGate(int op, int level, double start);\n" + \
+    "void profileLevel(int level, int count, double start);\n"
+
+def profileStart(phase):
+    return "   double " + phase + "_start = profileClock();\n"
+
+def profileStop(phase):
+    return '   profilePhase("' + phase + '", ' + phase + "_start);\n"
+
+def profiledGate(gate, statement):
+    # times a single gate and counts it for its opcode and level
+    return "{ double start = profileClock(); " + statement + " profileGate(" + str(gateOpcodeIndex(gate)) + ", " + \
+        str(gate.level) + ", start); }"
+
+def exchangeHelpers():
+    # C++ that sends and receives ciphertexts between partition programs,
+    # copied from exchange.h like the bundle helpers
+    exchange_file = open(os.path.join(os.path.dirname(os.path.abspath(__file__)), "exchange.h"), "r")
+    code = exchange_file.read()
+    exchange_file.close()
+    return code + "\n"
+
+def openExchange(partition):
+    code = "\n   ExchangeNetwork network;\n"
+    code += "   int peers[] = {" + ", ".join(str(peer) for peer in partition.peers + [-1]) + "};\n"
+    code += '   openExchange(network, "partitions.txt", ' + str(partition.index) + ", peers, " + str(len(partition.peers)) + ", " \
+        + str(partition.incoming) + ", params);\n"
+    return code
+
+def closeExchange():
+    return "   closeExchange(network);\n"
+
+def sendStatements(partition, nets):
+    # sends the nets read by other partitions right after they are computed
+    statements = []
+    for net in nets:
+        for peer in partition.sendTo.get(net, []):
+            statements.append("sendCiphertext(network, " + str(peer) + ", " + str(partition.netIds[net]) + ", " + netRef(net) + ");")
+    return statements
+
+def receiveStatements(partition, nets, received, wanted):
+    # receives the remote nets among nets that have not been received in the
+    # current clock cycle (or before the loop) yet
+    statements = []
+    for net in nets:
+        if net in partition.remoteNets and net not in received and wanted(net):
+            received.add(net)
+            statements.append("receiveCiphertext(network, " + str(partition.netIds[net]) + ", " + netRef(net) + ");")
+    return statements
+
+def dependsOnFF(net):
+    return len(net.left) > 0 and net.left[0].dependsOnFF
+
+def importInputs(portList, bundle=False, source='"inputs.bundle"', nets=None):
+    # loads the encrypted input ports, from inputs/<net>.ctxt or by mapping
+    # the bundle named by the C++ expression source. If nets is given, only
+    # the inputs named in it are loaded.
+    code = ""
+    if bundle:
+        code += "\n   CiphertextBundle input_bundle;\n"
+        code += "   mapBundle(" + source + ", input_bundle);\n"
+    for port in portList:
+        if "INPUT" in port.direction:
+            code += "\n"
+            for i in reversed(range(port.length)):
+                net = port.nets[i]
+                if nets is not None and net not in nets:
+                    continue
+                if bundle:
+                    code += '   pointToBundle(input_bundle, "' + port.name + '", ' + str(i) + ", &" + net + "[0], params);\n"
+                else:
+                    code += "   FILE* " + net + '_file = fopen("inputs/' + net + '.ctxt", "rb");\n'
+                    code += "   import_gate_bootstrapping_ciphertext_fromFile(" + net + "_file, &" + net + "[0], params);\n"
+                    code += "   fclose(" + net + "_file);\n"
+    return code
+
+def exportOutputs(portList, bundle=False, target='"outputs.bundle"'):
+    # stores the encrypted output ports in outputs/<net>.ctxt or in the
+    # bundle named by the C++ expression target
+    code = "\n"
+    if bundle:
+        code += "   BundleWriter output_bundle;\n"
+    for port in portList:
+        if "OUTPUT" in port.direction:
+            for i in range(port.length):
+                net = port.nets[i]
+                if bundle:
+                    code += '   addToBundle(output_bundle, "' + port.name + '", ' + str(i) + ", &" + net + "[0]);\n"
+                else:
+                    code += "   FILE* " + net + '_file = fopen("outputs/' + net + '.ctxt","wb");\n'
+                    code += "   export_gate_bootstrapping_ciphertext_toFile(" + net + "_file, &" + net + "[0], params);\n"
+                    code += "   fclose(" + net + "_file);\n"
+    if bundle:
+        code += "   writeBundle(output_bundle, " + target + ", params);\n"
+    return code + "\n"
+
+def releaseInputs(bundle=False):
+    # the input ciphertexts borrow their masks from the mapped bundle until
+    # they are deleted
+    if bundle:
+        return "   releaseBundle(input_bundle);\n"
+    return ""
+
+def batchFunction():
+    # the circuit is evaluated by a function so that one process can run it
+    # on many input bundles, each thread reusing its own ciphertext array
+    code = "void evaluateCircuit(LweSample* ciphertexts, const char* input_file, const char* output_file, int cycles,\n"
+    code += "                     const TFheGateBootstrappingCloudKeySet* bk) {\n\n"
+    code += "   const TFheGateBootstrappingParameterSet* params = bk->params;\n\n"
+    return code
+
+def batchMain(slotCount, timeSteps, runtimeLoop, profile=False):
+    # loads the cloud key once and evaluates every input bundle named on the
+    # command line, concurrently when compiled with OpenMP. The outputs of
+    # the k-th bundle are written to outputs_<k>.bundle.
+    code = "int main(int argc, char** argv) {\n\n"
+    if profile:
+        code += profileStart("key_load")
+    code += '   FILE* cloud_key = fopen("clouds.key", "rb");\n'
+    code += "   TFheGateBootstrappingCloudKeySet* bk = new_tfheGateBootstrappingCloudKeySet_fromFile(cloud_key);\n"
+    code += "   fclose(cloud_key);\n"
+    if profile:
+        code += profileStop("key_load")
+    code += "\n   const TFheGateBootstrappingParameterSet* params = bk->params;\n\n"
+    code += "   int first = 1;\n"
+    code += "   int cycles = " + str(timeSteps) + ";\n"
+    if runtimeLoop:
+        code += "   // an optional leading number overrides the cycle count\n"
+        code += "   if (argc > 1 && strspn(argv[1], \"0123456789\") == strlen(argv[1])) {\n"
+        code += "      cycles = atoi(argv[1]);\n"
+        code += "      first = 2;\n"
+        code += "   }\n"
+    code += "\n   // a single bundle keeps the cores for the gates of the parallel mode\n"
+    code += "   #pragma omp parallel if (argc - first > 1)\n"
+    code += "   {\n"
+    code += "      LweSample* ciphertexts = new_gate_bootstrapping_ciphertext_array(" + str(slotCount) + ", params);\n"
+    code += "      #pragma omp for schedule(dynamic, 1)\n"
+    code += "      for (int k = first; k < argc; k++) {\n"
+    code += '         string output_file = "outputs_" + to_string(k - first) + ".bundle";\n'
+    code += "         evaluateCircuit(ciphertexts, argv[k], output_file.c_str(), cycles, bk);\n"
+    code += "      }\n"
+    code += "      delete_gate_bootstrapping_ciphertext_array(" + str(slotCount) + ", ciphertexts);\n"
+    code += "   }\n\n"
+    code += "   delete_gate_bootstrapping_cloud_keyset(bk);\n"
+    if profile:
+        code += '   writeProfile("profile.json");\n'
+    code += "   return 0;\n"
+    code += "}\n"
+    return code
+
+def declareCiphertexts(netList, slots, slotCount, allocate=True):
+    # one array holds every ciphertext; nets with disjoint lifetimes share a
+    # slot. Without allocate, the array is passed in by the caller.
+    code = ""
+    if allocate:
+        code += "   LweSample* ciphertexts = new_gate_bootstrapping_ciphertext_array(" + str(slotCount) + ", params);\n"
+    for net in netList:
+        code += "   LweSample* " + net.name + " = &ciphertexts[" + str(slots[net]) + "];\n"
+    return code
+
+def deleteCiphertexts(slotCount):
+    return "   delete_gate_bootstrapping_ciphertext_array(" + str(slotCount) + ", ciphertexts);\n"
+
+def evaluationStatements(tfhe_file, gateOrder, select, parallel, suffix, partition=None, received=None, wanted=None,
+                         profile=False, tables=None):
+    # statements evaluating the selected gates in schedule order. In parallel
+    # mode the level tables are written to tfhe_file (or added to the tables
+    # dict by name) and evalLevel() calls are returned instead. For a
+    # partition, remote inputs are received before the gates (or level)
+    # reading them and results other partitions read are sent right after.
+    # With profile, every gate (or level) is timed.
+    gates = [gate for gate in gateOrder if select(gate)]
+    if parallel:
+        groups = list(enumerate(groupByLevel(gates)))
+    else:
+        groups = [(index, [gate]) for index, gate in enumerate(gates)]
+
+    statements = []
+    for index, group in groups:
+        if len(group) == 0:
+            continue
+        if partition is not None:
+            statements += receiveStatements(partition, [net for gate in group for net in gate.inputNets], received, wanted)
+        if parallel:
+            name = "level" + str(index) + suffix
+            if tables is not None:
+                tables[name] = levelTable(name, group)
+            else:
+                tfhe_file.write(levelTable(name, group))
+            statement = "evalLevel(" + name + ", " + str(len(group)) + ", bk);"
+            if profile:
+                statement = "{ double start = profileClock(); " + statement + " profileLevel(" + \
+                    str(group[0].level) + ", " + str(len(group)) + ", start); }"
+            statements.append(statement)
+        elif profile:
+            statements.append(profiledGate(group[0], gateCall(group[0])))
+        else:
+            statements.append(gateCall(group[0]))
+        if partition is not None:
+            statements += sendStatements(partition, [net for gate in group for net in gate.outputNets])
+    return statements
+
+def writeEvaluation(tfhe_file, gateOrder, flipFlops, timeSteps, parallel=False, runtimeLoop=False, cyclesDeclared=False,
+                    partition=None, profile=False, units=None):
+    # emits the evaluation of every clock cycle, either unrolled timeSteps
+    # times or as a loop whose cycle count can be given on the command line.
+    # With cyclesDeclared, the loop uses an existing cycles variable instead.
+    # With profile, gates, the hoisted gates and every clock cycle are timed.
+    # With units (see units.py), the gates are evaluated by functions in
+    # other translation units and only the calls are written to tfhe_file.
+    tables = units.tables if units is not None else None
+    # For a partition, every net another partition reads is sent once per
+    # clock cycle it changes in (once in total if it never changes) and
+    # received the same number of times, so both sides stay in step.
+    anyNet = lambda net: True
+    invariantNet = lambda net: not dependsOnFF(net)
+    tfhe_file.write('\n')
+    if runtimeLoop:
+        # loop-invariant gates only depend on the inputs, so they are hoisted
+        # out of the loop and the remaining gates are emitted once
+        receivedOnce = set()
+        invariant = evaluationStatements(tfhe_file, gateOrder, lambda gate: not gate.dependsOnFF, parallel, "_inv",
+                                         partition, receivedOnce, invariantNet, profile, tables)
+        received = set()
+        changing = evaluationStatements(tfhe_file, gateOrder, lambda gate: gate.dependsOnFF, parallel, "_ff",
+                                        partition, received, dependsOnFF, profile, tables)
+        if partition is not None:
+            # remote values that never change are received once, before the loop
+            invariant += receiveStatements(partition, partition.nets, receivedOnce, invariantNet)
+            changing += receiveStatements(partition, partition.endNets, received, dependsOnFF)
+    else:
+        invariant = []
+        changing = []
+        received = set()
+        first = evaluationStatements(tfhe_file, gateOrder, lambda gate: True, parallel, "", partition, received, anyNet,
+                                     profile, tables)
+        if partition is not None:
+            first += receiveStatements(partition, partition.endNets, received, anyNet)
+        if timeSteps > 1:
+            received = set()
+            changing = evaluationStatements(tfhe_file, gateOrder, lambda gate: gate.dependsOnFF, parallel, "_ff",
+                                            partition, received, dependsOnFF, profile, tables)
+            if partition is not None:
+                changing += receiveStatements(partition, partition.endNets, received, dependsOnFF)
+
+    if units is not None:
+        invariant = units.split(invariant)
+        changing = units.split(changing)
+        if not runtimeLoop:
+            first = units.split(first)
+
+    update = flipFlopUpdate(flipFlops)
+    states = [net for gate in flipFlops for net in gate.outputNets]
+    if partition is not None:
+        update += sendStatements(partition, states)
+    nextStates = [gate.next_state for gate in flipFlops if gate.next_state != ""]
+    for name in nextStates:
+        tfhe_file.write("   LweSample* " + name + " = new_gate_bootstrapping_ciphertext_array(1, params);\n")
+
+    for gate in flipFlops:
+        tfhe_file.write("   " + flipFlopReset(gate) + "\n")
+    if partition is not None:
+        for statement in sendStatements(partition, states):
+            tfhe_file.write("   " + statement + "\n")
+
+    if runtimeLoop:
+        if profile:
+            tfhe_file.write(profileStart("loop_invariant"))
+        for statement in invariant:
+            tfhe_file.write("   " + statement + "\n")
+        if profile:
+            tfhe_file.write(profileStop("loop_invariant"))
+        if not cyclesDeclared:
+            tfhe_file.write("\n   int cycles = " + str(timeSteps) + ";\n")
+            tfhe_file.write("   if (argc > 1) {\n")
+            tfhe_file.write("      cycles = atoi(argv[1]);\n")
+            tfhe_file.write("   }\n")
+        tfhe_file.write("   for (int clock = 0; clock < cycles; clock++) {\n")
+        if profile:
+            tfhe_file.write("      double cycle_start = profileClock();\n")
+        if len(update) > 0:
+            tfhe_file.write("      if (clock > 0) {\n")
+            for statement in update:
+                tfhe_file.write("         " + statement + "\n")
+            tfhe_file.write("      }\n")
+        for statement in changing:
+            tfhe_file.write("      " + statement + "\n")
+        if profile:
+            tfhe_file.write("      profileCycle(clock, cycle_start);\n")
+        tfhe_file.write("   }\n")
+    else:
+        if profile:
+            tfhe_file.write("   double cycle_start;\n")
+        for clock in range(timeSteps):
+            statements = first
+            if clock > 0: # exclude redundant gates
+                statements = update + changing
+            if profile:
+                tfhe_file.write("   cycle_start = profileClock();\n")
+            for statement in statements:
+                tfhe_file.write("   " + statement + "\n")
+            if profile:
+                tfhe_file.write("   profileCycle(" + str(clock) + ", cycle_start);\n")
+
+    for name in nextStates:
+        tfhe_file.write("   delete_gate_bootstrapping_ciphertext_array(1, " + name + ");\n")
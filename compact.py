@@ -0,0 +1,300 @@
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+from netlist import CELL_OPS, OPCODES, isFlipFlop
+
+# Compact form of a netlist for the analysis passes. Gates and nets are
+# numbered, names live in a name table, every gate has an opcode and the
+# connections are stored CSR style in arrays of integers: the input nets of
+# gate g are
+#
+#   fanin[faninStart[g]:faninStart[g + 1]]
+#
+# and likewise the output nets of a gate (outputs), the gates driving a net
+# (drivers) and the gates reading it (fanout). This needs a fraction of the
+# memory of the LogicGate and Net objects, and the passes below touch no
+# attribute dictionaries and compare no strings. The passes return arrays
+# indexed by gate or net id; the wrappers in analysis.py translate them back
+# to gates and nets. Rewriting passes (optimize, remap, balance) edit the
+# objects and schedule them through the same wrappers.
+#
+#   python3 compact.py NETLIST ...    compares the memory and analysis time
+#                                     of the objects and the compact form and
+#                                     reports the peak memory of generating
+#                                     the circuit
+
+# opcode of flip flops, the other opcodes are indices into OPCODES
+FLIP_FLOP = len(OPCODES)
+# opcode of cells without a TFHE operation, rewriting passes still see them
+UNKNOWN_CELL = -1
+
+class CompactNetlist:
+    __slots__ = ("gateNames", "netNames", "netIds", "opcodes", "faninStart", "fanin", "outputStart", "outputs",
+                 "driverStart", "drivers", "fanoutStart", "fanout")
+
+    def __init__(self, gateList, netList):
+        # netList must hold every net the gates are connected to (see
+        # collectNets); drivers and readers outside gateList are left out
+        self.gateNames = [gate.id for gate in gateList] # name table of the gates
+        self.netNames = [net.name for net in netList] # name table of the nets
+        self.netIds = {} # net name -> id
+        for index, name in enumerate(self.netNames):
+            self.netIds[name] = index
+        gateIds = {}
+        for index, gate in enumerate(gateList):
+            gateIds[gate] = index
+        netIds = {}
+        for index, net in enumerate(netList):
+            netIds[net] = index
+
+        self.opcodes = array("b", [gateOpcode(gate) for gate in gateList])
+        self.faninStart, self.fanin = packLists([[netIds[net] for net in gate.inputNets] for gate in gateList])
+        self.outputStart, self.outputs = packLists([[netIds[net] for net in gate.outputNets] for gate in gateList])
+        self.driverStart, self.drivers = packLists([[gateIds[gate] for gate in net.left if gate in gateIds]
+                                                    for net in netList])
+        self.fanoutStart, self.fanout = packLists([[gateIds[gate] for gate in net.right if gate in gateIds]
+                                                   for net in netList])
+
+    def gateCount(self):
+        return len(self.opcodes)
+
+    def netCount(self):
+        return len(self.driverStart) - 1
+
+def gateOpcode(gate):
+    if isFlipFlop(gate):
+        return FLIP_FLOP
+    if gate.function not in CELL_OPS:
+        return UNKNOWN_CELL
+    return OPCODES.index(CELL_OPS[gate.function])
+
+def collectNets(gateList, netList=()):
+    # netList followed by the nets of the gates that are not in it, so that
+    # net ids below len(netList) are the positions in netList
+    nets = list(netList)
+    known = set(nets)
+    for gate in gateList:
+        for net in gate.inputNets + gate.outputNets:
+            if net not in known:
+                known.add(net)
+                nets.append(net)
+    return nets
+
+def packLists(lists):
+    # CSR form of a list of integer lists: row starts and concatenated rows
+    start = array("i", [0])
+    values = array("i")
+    for row in lists:
+        values.extend(row)
+        start.append(len(values))
+    return start, values
+
+def ffDependency(ir):
+    # 1 for every gate whose value can change between clock cycles, i.e. the
+    # gates reachable from a flip flop through their fan-out. Each gate and
+    # net is visited once, so this is O(V+E) and needs no recursion.
+    dependsOnFF = bytearray(ir.gateCount())
+    pending = [gate for gate in range(ir.gateCount()) if ir.opcodes[gate] == FLIP_FLOP]
+    for gate in pending:
+        dependsOnFF[gate] = 1
+    outputStart, outputs, fanoutStart, fanout = ir.outputStart, ir.outputs, ir.fanoutStart, ir.fanout
+    while pending:
+        gate = pending.pop()
+        for net in outputs[outputStart[gate]:outputStart[gate + 1]]:
+            for nextGate in fanout[fanoutStart[net]:fanoutStart[net + 1]]:
+                if not dependsOnFF[nextGate]:
+                    dependsOnFF[nextGate] = 1
+                    pending.append(nextGate)
+    return dependsOnFF
+
+def schedule(ir):
+    # orders the combinational gates once with Kahn's algorithm so that every
+    # gate comes after the gates driving its inputs. Flip flop outputs hold the
+    # previous cycle's state, so flip flops act as sources and edges into them
+    # are ignored. Returns the gate ids in order and the level of every gate:
+    # flip flops and gates fed only by inputs/flip flops are at levels 0 and
+    # 1, every other gate is one level above its deepest predecessor.
+    opcodes, driverStart, drivers = ir.opcodes, ir.driverStart, ir.drivers
+    faninStart, fanin, outputStart, outputs, fanoutStart, fanout = \
+        ir.faninStart, ir.fanin, ir.outputStart, ir.outputs, ir.fanoutStart, ir.fanout
+    count = ir.gateCount()
+    levels = array("i", bytes(4 * count))
+    inDegree = array("i", bytes(4 * count))
+    combinational = 0
+    order = array("i")
+    for gate in range(count):
+        if opcodes[gate] == FLIP_FLOP:
+            continue
+        combinational += 1
+        for net in fanin[faninStart[gate]:faninStart[gate + 1]]:
+            for prevGate in drivers[driverStart[net]:driverStart[net + 1]]:
+                if opcodes[prevGate] != FLIP_FLOP:
+                    inDegree[gate] += 1
+        if inDegree[gate] == 0:
+            levels[gate] = 1
+            order.append(gate)
+
+    index = 0
+    while index < len(order):
+        gate = order[index]
+        index += 1
+        for net in outputs[outputStart[gate]:outputStart[gate + 1]]:
+            for nextGate in fanout[fanoutStart[net]:fanoutStart[net + 1]]:
+                if opcodes[nextGate] == FLIP_FLOP:
+                    continue
+                if levels[nextGate] < levels[gate] + 1:
+                    levels[nextGate] = levels[gate] + 1
+                inDegree[nextGate] -= 1
+                if inDegree[nextGate] == 0:
+                    order.append(nextGate)
+
+    if len(order) != combinational:
+        raise ValueError("netlist contains a combinational loop")
+    return order, levels
+
+def pinnedNets(ir, dependsOnFF, portList, gates=None):
+    # 1 for every net whose ciphertext has to survive a whole clock cycle or
+    # the whole run: ports, flip flop state and loop-invariant values read in
+    # later cycles. Only the gate ids in gates are looked at, all by default.
+    pinned = bytearray(ir.netCount())
+    for port in portList:
+        for name in port.nets:
+            if name in ir.netIds:
+                pinned[ir.netIds[name]] = 1
+    if gates is None:
+        gates = range(ir.gateCount())
+    for gate in gates:
+        inputs = ir.fanin[ir.faninStart[gate]:ir.faninStart[gate + 1]]
+        outputs = ir.outputs[ir.outputStart[gate]:ir.outputStart[gate + 1]]
+        if ir.opcodes[gate] == FLIP_FLOP:
+            for net in inputs + outputs:
+                pinned[net] = 1
+        elif not dependsOnFF[gate]:
+            for net in outputs:
+                for nextGate in ir.fanout[ir.fanoutStart[net]:ir.fanoutStart[net + 1]]:
+                    if dependsOnFF[nextGate]:
+                        pinned[net] = 1
+    return pinned
+
+def allocate(ir, order, levels, pinned, parallel=False, nets=None):
+    # liveness based register allocation: a net occupies a ciphertext slot
+    # from the gate that writes it until its last reader has run, after which
+    # the slot is handed to a later net. In parallel mode the gates of a level
+    # run concurrently, so liveness is tracked per level instead of per gate.
+    # Pinned nets and the nets in nets (all by default) no gate of order
+    # writes keep their own slot. Returns the slot of every net id (-1 for
+    # nets left out) and the number of slots.
+    faninStart, fanin, outputStart, outputs = ir.faninStart, ir.fanin, ir.outputStart, ir.outputs
+    lastRead = array("i", [-1]) * ir.netCount()
+    for index, gate in enumerate(order):
+        position = levels[gate] if parallel else index
+        for net in fanin[faninStart[gate]:faninStart[gate + 1]]:
+            lastRead[net] = position
+
+    slots = array("i", [-1]) * ir.netCount()
+    slotCount = 0
+    freeSlots = []
+    live = [] # (release position, net) of nets currently holding a slot
+    scanned = -1
+    for index, gate in enumerate(order):
+        position = levels[gate] if parallel else index
+        # nets are released after their last reader, never at the position
+        # that wrote them, so the gates of a level free their slots only once
+        if position != scanned:
+            scanned = position
+            stillLive = []
+            for release, net in live:
+                if release < position:
+                    freeSlots.append(slots[net])
+                else:
+                    stillLive.append((release, net))
+            live = stillLive
+
+        for net in outputs[outputStart[gate]:outputStart[gate + 1]]:
+            if pinned[net] or slots[net] != -1:
+                continue
+            if freeSlots:
+                slots[net] = freeSlots.pop()
+            else:
+                slots[net] = slotCount
+                slotCount += 1
+            live.append((lastRead[net] if lastRead[net] != -1 else position, net))
+
+    if nets is None:
+        nets = range(ir.netCount())
+    for net in nets:
+        if slots[net] == -1:
+            slots[net] = slotCount
+            slotCount += 1
+    return slots, slotCount
+
+def objectBytes(gateList, netList):
+    # size of the gate and net objects and of the lists they own; names are
+    # left out since the compact form shares them
+    total = 0
+    for gate in gateList:
+        for item in (gate, gate.inputNets, gate.outputNets):
+            total += sys.getsizeof(item)
+    for net in netList:
+        for item in (net, net.left, net.right):
+            total += sys.getsizeof(item)
+    return total
+
+def compactBytes(ir):
+    total = sys.getsizeof(ir)
+    for name in CompactNetlist.__slots__:
+        total += sys.getsizeof(getattr(ir, name))
+    return total
+
+def measure(inputFile):
+    # memory and analysis time of the objects and the compact form of the
+    # optimized netlist, and the peak memory of generating the circuit
+    from netlist import linkNetlist
+    from edif_parser import readNetlist
+    from optimize import optimizeNetlist
+    from remap import remapNetlist
+    from analysis import analyzeNetlist
+    from gen_circuit_secure import DEFAULT_OPTIONS, generateCircuit
+    gateList, netList, portList = readNetlist(inputFile)
+    gateDict, netDict, portDict = linkNetlist(gateList, netList, portList)
+    gateList, netList, removedBootstraps = optimizeNetlist(gateList, netList, portList, netDict)
+    gateList, netList, bootstrapsBefore, bootstrapsAfter = remapNetlist(gateList, netList, portList, netDict)
+
+    ir = CompactNetlist(gateList, collectNets(gateList, netList))
+    start = time.perf_counter()
+    analyzeNetlist(gateList, netList, portList)[2](True)
+    analysisSeconds = time.perf_counter() - start
+
+    options = dict(DEFAULT_OPTIONS)
+    options["parallel"] = True
+    workDir = tempfile.mkdtemp()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        generateCircuit(os.path.abspath(inputFile), os.path.join(workDir, "circuit.cpp"), options)
+    peakBytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    os.remove(os.path.join(workDir, "circuit.cpp"))
+    os.rmdir(workDir)
+    return objectBytes(gateList, netList), compactBytes(ir), peakBytes, analysisSeconds, ir
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: python3 compact.py NETLIST ...")
+        sys.exit(1)
+    print("%-20s %7s %7s %11s %11s %9s %11s" % ("netlist", "gates", "nets", "objects KB", "compact KB", "peak KB",
+                                              "analysis ms"))
+    for inputFile in sys.argv[1:]:
+        objectSize, compactSize, peakSize, analysisSeconds, ir = measure(inputFile)
+        print("%-20s %7d %7d %11.1f %11.1f %9.1f %11.1f" % (os.path.basename(inputFile), ir.gateCount(),
+              ir.netCount(), objectSize / 1024, compactSize / 1024, peakSize / 1024, analysisSeconds * 1000))
+    print("objects/compact: size of the optimized netlist without the names both share; peak: traced peak of")
+    print("generating the parallel circuit; analysis: flip flop dependency, schedule and parallel slot allocation")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+import os
+import re
+import sys
+
+from netlist import Port, LogicGate, Net, isFlipFlop
+from aiger_parser import AIGER_EXTENSIONS, readAiger
+
+# EDIF is a plain S-expression language: parentheses, quoted strings and atoms
+TOKEN_RE = re.compile(r'\(|\)|"[^"]*"|[^\s()"]+')
+
+OUTPUT_PINS = ("Y", "Q") # cell pins that drive a net
+CLOCK_PINS = ("CLK", "C") # flip flop pins that are not data inputs
+CONSTANT_CELLS = ("GND", "VCC") # tie cells emitted by Yosys, their only pin is an output
+
+
+class EdifCell:
+    # a cell definition from either the LIB (primitives) or DESIGN library
+    def __init__(self, name, function, library):
+        self.name = name # identifier used by cellRef
+        self.function = function # operation derived from the original name
+        self.library = library # name of the enclosing library
+        self.ports = [] # (name, direction, width) for each interface port
+        self.instances = {} # instance identifier -> referenced cell identifier
+        self.nets = [] # (net identifier, [(pin, bit, instance or None), ...])
+
+
+def tokenize(text):
+    # split EDIF source into parentheses, strings and atoms, one at a time so
+    # the whole token list is never held in memory. Keywords and identifiers
+    # repeat all over a netlist, interning keeps one copy of each.
+    for match in TOKEN_RE.finditer(text):
+        yield sys.intern(match.group())
+
+def parseSExpr(tokens):
+    # build nested lists from the token stream without recursion
+    stack = [[]]
+    for token in tokens:
+        if token == "(":
+            stack.append([])
+        elif token == ")":
+            expr = stack.pop()
+            stack[-1].append(expr)
+        elif token[0] == '"':
+            stack[-1].append(token[1:-1])
+        else:
+            stack[-1].append(token)
+
+    if len(stack) != 1:
+        raise ValueError("unbalanced parentheses in EDIF netlist")
+    return stack[0]
+
+def getName(expr):
+    # returns (identifier, original name) for plain and renamed objects
+    if isinstance(expr, list) and expr[0] == "rename":
+        return expr[1], expr[2]
+    return expr, expr
+
+def getCellFunction(name):
+    # "$_NAND_" -> "NAND", "$and" -> "AND", "$dff" -> "DFF"
+    return "".join([i for i in name if i.isalpha()]).upper()
+
+def children(expr, keyword):
+    # sub expressions of expr that start with keyword
+    return [i for i in expr if isinstance(i, list) and i[0] == keyword]
+
+def parsePortRef(expr):
+    # (portRef A (instanceRef id00012)) or (portRef (member P 21))
+    pin = expr[1]
+    bit = 0
+    instance = None
+    if isinstance(pin, list): # member of an array port
+        bit = int(pin[2])
+        pin = pin[1]
+    for instanceRef in children(expr, "instanceRef"):
+        instance = instanceRef[1]
+    return pin, bit, instance
+
+def parseCell(expr, library):
+    cellId, cellName = getName(expr[1])
+    cell = EdifCell(cellId, getCellFunction(cellName), library)
+
+    for view in children(expr, "view"):
+        for interface in children(view, "interface"):
+            for port in children(interface, "port"):
+                width = 1
+                portName = port[1]
+                if isinstance(portName, list) and portName[0] == "array":
+                    width = int(portName[2])
+                    portName = portName[1]
+                portId = getName(portName)[0]
+                direction = children(port, "direction")[0][1]
+                cell.ports.append((portId, direction, width))
+
+        for contents in children(view, "contents"):
+            for instance in children(contents, "instance"):
+                instanceId = getName(instance[1])[0]
+                for viewRef in children(instance, "viewRef"):
+                    for cellRef in children(viewRef, "cellRef"):
+                        cell.instances[instanceId] = cellRef[1]
+
+            for net in children(contents, "net"):
+                netId = getName(net[1])[0]
+                refs = []
+                for joined in children(net, "joined"):
+                    for portRef in children(joined, "portRef"):
+                        refs.append(parsePortRef(portRef))
+                cell.nets.append((netId, refs))
+
+    return cell
+
+def parseEdif(text):
+    # returns the cells of every library and the identifier of the top cell
+    edif = parseSExpr(tokenize(text))[0]
+    cells = {}
+    topCell = None
+
+    for library in edif:
+        if not isinstance(library, list):
+            continue
+        if library[0] == "external" or library[0] == "library":
+            for cellExpr in children(library, "cell"):
+                cell = parseCell(cellExpr, library[1])
+                cells[cell.name] = cell
+        elif library[0] == "design":
+            topCell = children(library, "cellRef")[0][1]
+
+    # some ISCAS netlists name the flip flop wrapper as the design, so fall
+    # back to the last non flip flop cell in the design library
+    if topCell is None or "DFF" in cells[topCell].function:
+        for cell in cells.values():
+            if (cell.instances or cell.nets) and "DFF" not in cell.function:
+                topCell = cell.name
+
+    return cells, topCell
+
+
+class NetlistBuilder:
+    # flattens the top cell into LogicGates, Nets and Ports
+    def __init__(self, cells):
+        self.cells = cells
+        self.gateList = []
+        self.netList = []
+        self.portList = []
+
+    def isPrimitive(self, cell):
+        # cells from LIB and flip flop wrappers (i.e. the ISCAS "dff" module) become gates
+        return (not cell.instances and not cell.nets) or "DFF" in cell.function
+
+    def build(self, cell, prefix="", binding=None):
+        # binding maps (port, bit) of this cell to nets of the enclosing cell
+        gates = {}
+        submodules = {}
+        for instanceId, cellRef in cell.instances.items():
+            subCell = self.cells[cellRef]
+            if self.isPrimitive(subCell):
+                newGate = LogicGate(subCell.function, prefix + instanceId)
+                gates[instanceId] = newGate
+                self.gateList.append(newGate)
+            else:
+                submodules[instanceId] = {}
+
+        ports = {}
+        if binding is None: # top level cell defines the circuit's ports
+            for portId, direction, width in cell.ports:
+                ports[portId] = Port(portId, direction, width)
+
+        portNets = []
+        for netId, refs in cell.nets:
+            newNet = None
+            if binding is not None:
+                for pin, bit, instance in refs:
+                    if instance is None and (pin, bit) in binding:
+                        newNet = binding[(pin, bit)]
+                        break
+            if newNet is None:
+                newNet = Net(prefix + netId)
+                self.netList.append(newNet)
+
+            for pin, bit, instance in refs:
+                if instance is None:
+                    if pin in ports:
+                        ports[pin].nets[bit] = newNet.name
+                        portNets.append((ports[pin], newNet))
+                elif instance in gates:
+                    gate = gates[instance]
+                    if pin.upper() in OUTPUT_PINS or gate.function in CONSTANT_CELLS:
+                        newNet.setLeft(gate)
+                    elif isFlipFlop(gate) and pin.upper() in CLOCK_PINS:
+                        continue
+                    else:
+                        newNet.setRight(gate)
+                    gate.pins[pin.upper()] = newNet
+                elif instance in submodules:
+                    submodules[instance][(pin, bit)] = newNet
+
+        for instanceId, subBinding in submodules.items():
+            subCell = self.cells[cell.instances[instanceId]]
+            self.build(subCell, prefix + instanceId + "_", subBinding)
+
+        # skip input ports that are not connected to any logic (i.e. VDD, GND, clocks)
+        usedPorts = set()
+        for port, net in portNets:
+            if len(net.right) > 0:
+                usedPorts.add(port.name)
+        for port in ports.values():
+            if "OUTPUT" in port.direction or port.name in usedPorts:
+                self.portList.append(port)
+
+def readNetlist(filename):
+    # parse an EDIF file and return (gateList, netList, portList); AIGER
+    # files (.aig, .aag) go to the AIGER reader
+    if os.path.splitext(filename)[1].lower() in AIGER_EXTENSIONS:
+        return readAiger(filename)
+    edif_file = open(filename, "r")
+    cells, topCell = parseEdif(edif_file.read())
+    edif_file.close()
+
+    builder = NetlistBuilder(cells)
+    builder.build(cells[topCell])
+    return builder.gateList, builder.netList, builder.portList
@@ -0,0 +1,415 @@
+// Prebuilt batch encryption of input vectors. It reads the port map written by
+// gen_circuit_secure.py and a CSV or JSON file of input vectors, and encrypts
+// every vector into a ciphertext bundle with super_secret.key:
+//
+//    ./encrypt <CIRCUIT>.ports <VECTORS>.csv|.json [OUTPUT_PREFIX] [JOBS]
+//
+// A single vector is written to <OUTPUT_PREFIX>.bundle, several vectors to
+// <OUTPUT_PREFIX>_0.bundle, <OUTPUT_PREFIX>_1.bundle, ... The prefix defaults
+// to "inputs", so a single vector is ready for the generated programs.
+//
+// CSV files start with a row of input port names, every other row is one
+// vector. JSON files hold an array of objects mapping port names to values.
+// Values are binary strings with the most significant bit first (like the
+// prompts of gen_circuit_verif.py) or hexadecimal strings starting with 0x;
+// JSON values may also be non-negative integers.
+//
+// The work is split over JOBS processes (one per core by default). Every
+// process seeds its own random generator, because TFHE's generator is
+// global state, and writes its ciphertexts straight into the memory mapped
+// bundles.
+#include <iostream>
+#include <tfhe/tfhe.h>
+#include <tfhe/tfhe_io.h>
+#include <stdio.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <ctype.h>
+#include <fcntl.h>
+#include <unistd.h>
+#include <sys/mman.h>
+#include <sys/wait.h>
+#include <string>
+#include <vector>
+
+using namespace std;
+
+#include "bundle.h"
+
+struct InputPort {
+   string name;
+   uint32_t width;
+};
+
+// one bit of one vector
+struct Task {
+   char* record;
+   int value;
+};
+
+static void fail(const string& message) {
+   fprintf(stderr, "%s\n", message.c_str());
+   exit(1);
+}
+
+static string readFile(const char* filename) {
+   FILE* file = fopen(filename, "rb");
+   if (file == NULL) {
+      fail(string("cannot open ") + filename);
+   }
+   string text;
+   char buffer[65536];
+   size_t count;
+   while ((count = fread(buffer, 1, sizeof(buffer), file)) > 0) {
+      text.append(buffer, count);
+   }
+   fclose(file);
+   return text;
+}
+
+static string trim(const string& text) {
+   size_t start = 0, end = text.size();
+   while (start < end && isspace((unsigned char) text[start])) {
+      start++;
+   }
+   while (end > start && isspace((unsigned char) text[end - 1])) {
+      end--;
+   }
+   return text.substr(start, end - start);
+}
+
+static vector<string> split(const string& text, char separator) {
+   vector<string> fields;
+   size_t start = 0;
+   while (true) {
+      size_t end = text.find(separator, start);
+      if (end == string::npos) {
+         fields.push_back(text.substr(start));
+         return fields;
+      }
+      fields.push_back(text.substr(start, end - start));
+      start = end + 1;
+   }
+}
+
+// "input <name> <width>" lines; outputs and comments are skipped
+static vector<InputPort> readPortMap(const char* filename) {
+   vector<InputPort> ports;
+   vector<string> lines = split(readFile(filename), '\n');
+   for (size_t i = 0; i < lines.size(); i++) {
+      string line = trim(lines[i]);
+      if (line.empty() || line[0] == '#') {
+         continue;
+      }
+      char direction[16], name[1024];
+      unsigned width;
+      if (sscanf(line.c_str(), "%15s %1023s %u", direction, name, &width) != 3) {
+         fail("malformed port map line: " + line);
+      }
+      if (strcmp(direction, "input") == 0) {
+         InputPort port = {name, width};
+         ports.push_back(port);
+      }
+   }
+   return ports;
+}
+
+// bits of a value, least significant first
+static vector<int> parseBits(const string& value, uint32_t width, const string& port) {
+   vector<int> bits(width, 0);
+   if (value.size() > 2 && value[0] == '0' && (value[1] == 'x' || value[1] == 'X')) {
+      for (size_t i = 0; i < value.size() - 2; i++) {
+         char digit = value[value.size() - 1 - i];
+         if (!isxdigit((unsigned char) digit)) {
+            fail("invalid hexadecimal value for " + port + ": " + value);
+         }
+         int nibble = isdigit((unsigned char) digit) ? digit - '0' : tolower(digit) - 'a' + 10;
+         for (int j = 0; j < 4; j++) {
+            if (4 * i + j < width) {
+               bits[4 * i + j] = (nibble >> j) & 1;
+            } else if ((nibble >> j) & 1) {
+               fail("value too wide for " + port + ": " + value);
+            }
+         }
+      }
+      return bits;
+   }
+
+   if (value.size() != width) {
+      fail("expected " + to_string(width) + " binary digits for " + port + ", got " + value);
+   }
+   for (uint32_t i = 0; i < width; i++) {
+      char digit = value[width - 1 - i];
+      if (digit != '0' && digit != '1') {
+         fail("invalid binary value for " + port + ": " + value);
+      }
+      bits[i] = digit - '0';
+   }
+   return bits;
+}
+
+// rows of port name -> value
+typedef vector<pair<string, string> > Row;
+
+static vector<Row> readCsv(const string& text) {
+   vector<Row> rows;
+   vector<string> lines = split(text, '\n');
+   vector<string> header;
+   for (size_t i = 0; i < lines.size(); i++) {
+      string line = trim(lines[i]);
+      if (line.empty()) {
+         continue;
+      }
+      vector<string> fields = split(line, ',');
+      if (header.empty()) {
+         for (size_t j = 0; j < fields.size(); j++) {
+            header.push_back(trim(fields[j]));
+         }
+         continue;
+      }
+      if (fields.size() != header.size()) {
+         fail("wrong number of columns in line " + to_string(i + 1));
+      }
+      Row row;
+      for (size_t j = 0; j < fields.size(); j++) {
+         row.push_back(make_pair(header[j], trim(fields[j])));
+      }
+      rows.push_back(row);
+   }
+   return rows;
+}
+
+// just enough JSON for an array of flat objects with string or integer values
+struct JsonReader {
+   const string& text;
+   size_t position;
+
+   JsonReader(const string& input) : text(input), position(0) {}
+
+   void skipSpace() {
+      while (position < text.size() && isspace((unsigned char) text[position])) {
+         position++;
+      }
+   }
+
+   bool accept(char c) {
+      skipSpace();
+      if (position < text.size() && text[position] == c) {
+         position++;
+         return true;
+      }
+      return false;
+   }
+
+   void expect(char c) {
+      if (!accept(c)) {
+         fail(string("malformed JSON: expected '") + c + "' at offset " + to_string(position));
+      }
+   }
+
+   string readString() {
+      expect('"');
+      string value;
+      while (position < text.size() && text[position] != '"') {
+         if (text[position] == '\\') {
+            position++;
+         }
+         value += text[position++];
+      }
+      expect('"');
+      return value;
+   }
+
+   // integers are converted to binary strings of the port's width later
+   string readValue() {
+      skipSpace();
+      if (position < text.size() && text[position] == '"') {
+         return readString();
+      }
+      size_t start = position;
+      while (position < text.size() && isdigit((unsigned char) text[position])) {
+         position++;
+      }
+      if (start == position) {
+         fail("malformed JSON: expected a string or integer at offset " + to_string(position));
+      }
+      return "#" + text.substr(start, position - start);
+   }
+
+   vector<Row> readRows() {
+      vector<Row> rows;
+      expect('[');
+      if (accept(']')) {
+         return rows;
+      }
+      do {
+         Row row;
+         expect('{');
+         if (!accept('}')) {
+            do {
+               string name = readString();
+               expect(':');
+               row.push_back(make_pair(name, readValue()));
+            } while (accept(','));
+            expect('}');
+         }
+         rows.push_back(row);
+      } while (accept(','));
+      expect(']');
+      return rows;
+   }
+};
+
+static string integerToBinary(const string& digits, uint32_t width, const string& port) {
+   unsigned long long value = strtoull(digits.c_str(), NULL, 10);
+   string binary(width, '0');
+   for (uint32_t i = 0; i < width && i < 64; i++) {
+      binary[width - 1 - i] = (value >> i) & 1 ? '1' : '0';
+   }
+   if (width < 64 && (value >> width) != 0) {
+      fail("value too wide for " + port + ": " + digits);
+   }
+   return binary;
+}
+
+static void seedRandomGenerator() {
+   uint32_t seed[4];
+   FILE* random = fopen("/dev/urandom", "rb");
+   if (random == NULL || fread(seed, sizeof(seed[0]), 4, random) != 4) {
+      fail("cannot read /dev/urandom");
+   }
+   fclose(random);
+   tfhe_random_generator_setSeed(seed, 4);
+}
+
+int main(int argc, char** argv) {
+   if (argc < 3) {
+      fprintf(stderr, "usage: %s <circuit.ports> <vectors.csv|vectors.json> [output prefix] [jobs]\n", argv[0]);
+      return 1;
+   }
+   string prefix = argc > 3 ? argv[3] : "inputs";
+   long jobs = argc > 4 ? atol(argv[4]) : sysconf(_SC_NPROCESSORS_ONLN);
+   if (jobs < 1) {
+      jobs = 1;
+   }
+
+   vector<InputPort> ports = readPortMap(argv[1]);
+   string text = readFile(argv[2]);
+   string filename = argv[2];
+   vector<Row> rows;
+   if (filename.size() > 5 && filename.substr(filename.size() - 5) == ".json") {
+      JsonReader reader(text);
+      rows = reader.readRows();
+   } else {
+      rows = readCsv(text);
+   }
+
+   FILE* secret_key = fopen("super_secret.key", "rb");
+   if (secret_key == NULL) {
+      fail("cannot open super_secret.key");
+   }
+   TFheGateBootstrappingSecretKeySet* key = new_tfheGateBootstrappingSecretKeySet_fromFile(secret_key);
+   fclose(secret_key);
+   const TFheGateBootstrappingParameterSet* params = key->params;
+   int32_t n = params->in_out_params->n;
+
+   vector<string> names;
+   vector<uint32_t> bits;
+   for (size_t i = 0; i < ports.size(); i++) {
+      for (uint32_t j = 0; j < ports[i].width; j++) {
+         names.push_back(ports[i].name);
+         bits.push_back(j);
+      }
+   }
+   vector<char> header = bundleHeader(names, bits, n);
+   size_t bundleSize = header.size() + names.size() * bundleRecordSize(n);
+
+   // every bundle is created at its final size and mapped shared, so the
+   // worker processes can fill in the records directly
+   vector<Task> tasks;
+   vector<char*> mappings;
+   for (size_t k = 0; k < rows.size(); k++) {
+      string output = rows.size() == 1 ? prefix + ".bundle" : prefix + "_" + to_string(k) + ".bundle";
+      int descriptor = open(output.c_str(), O_RDWR | O_CREAT | O_TRUNC, 0644);
+      if (descriptor < 0 || ftruncate(descriptor, bundleSize) != 0) {
+         fail("cannot create " + output);
+      }
+      char* data = (char*) mmap(NULL, bundleSize, PROT_READ | PROT_WRITE, MAP_SHARED, descriptor, 0);
+      close(descriptor);
+      if (data == MAP_FAILED) {
+         fail("cannot map " + output);
+      }
+      memcpy(data, header.data(), header.size());
+      mappings.push_back(data);
+
+      char* record = data + header.size();
+      for (size_t i = 0; i < ports.size(); i++) {
+         string value;
+         bool found = false;
+         for (size_t j = 0; j < rows[k].size(); j++) {
+            if (rows[k][j].first == ports[i].name) {
+               value = rows[k][j].second;
+               found = true;
+            }
+         }
+         if (!found) {
+            fail("vector " + to_string(k) + " has no value for " + ports[i].name);
+         }
+         if (!value.empty() && value[0] == '#') {
+            value = integerToBinary(value.substr(1), ports[i].width, ports[i].name);
+         }
+         vector<int> portBits = parseBits(value, ports[i].width, ports[i].name);
+         for (uint32_t j = 0; j < ports[i].width; j++) {
+            Task task = {record, portBits[j]};
+            tasks.push_back(task);
+            record += bundleRecordSize(n);
+         }
+      }
+   }
+
+   // contiguous slices of the tasks, one per process
+   if ((size_t) jobs > tasks.size()) {
+      jobs = tasks.size() > 0 ? tasks.size() : 1;
+   }
+   vector<pid_t> workers;
+   for (long job = 0; job < jobs; job++) {
+      pid_t pid = jobs == 1 ? 0 : fork();
+      if (pid < 0) {
+         fail("cannot start worker process");
+      }
+      if (pid > 0) {
+         workers.push_back(pid);
+         continue;
+      }
+
+      seedRandomGenerator();
+      LweSample* ciphertext = new_gate_bootstrapping_ciphertext(params);
+      for (size_t i = tasks.size() * job / jobs; i < tasks.size() * (job + 1) / jobs; i++) {
+         bootsSymEncrypt(ciphertext, tasks[i].value, key);
+         storeRecord(tasks[i].record, ciphertext, n);
+      }
+      delete_gate_bootstrapping_ciphertext(ciphertext);
+      if (jobs > 1) {
+         _exit(0);
+      }
+   }
+
+   int failed = 0;
+   for (size_t i = 0; i < workers.size(); i++) {
+      int status;
+      if (waitpid(workers[i], &status, 0) < 0 || !WIFEXITED(status) || WEXITSTATUS(status) != 0) {
+         failed = 1;
+      }
+   }
+   for (size_t k = 0; k < mappings.size(); k++) {
+      munmap(mappings[k], bundleSize);
+   }
+   if (failed) {
+      fail("a worker process failed");
+   }
+
+   printf("Encrypted %zu vectors (%zu bits) in %ld jobs.\n", rows.size(), tasks.size(), jobs);
+   delete_gate_bootstrapping_secret_keyset(key);
+   return 0;
+}
@@ -0,0 +1,129 @@
+import json
+import os
+
+from analysis import groupByLevel, CIPHERTEXT_BYTES
+from balance import arrivalTimes
+from netlist import CELL_OPS, OPCODES
+
+# Static cost of evaluating a generated circuit: gate counts over all clock
+# cycles, bootstrap depth, memory and a predicted runtime. Gate costs come
+# from gate_costs.json, written by the benchmark program (benchmark.cpp) on
+# the machine that will run the circuit; without it, typical costs of the
+# spqlios-fma TFHE build are assumed.
+
+COST_FILE = "gate_costs.json"
+
+# seconds per gate without a calibration; MUX bootstraps twice
+BOOTSTRAP_SECONDS = 0.013
+FREE_OPS = ("NOT", "COPY", "ZERO", "ONE")
+DEFAULT_COSTS = {}
+for op in OPCODES:
+    DEFAULT_COSTS[op] = 0.00001 if op in FREE_OPS else BOOTSTRAP_SECONDS
+DEFAULT_COSTS["MUX"] = 2 * BOOTSTRAP_SECONDS
+
+def loadGateCosts(filename=COST_FILE):
+    # seconds per gate, the speedup of independent gates on all cores and
+    # whether the numbers were measured
+    threads = os.cpu_count() or 1
+    if not os.path.exists(filename):
+        return dict(DEFAULT_COSTS), threads, False
+    cost_file = open(filename, "r")
+    calibration = json.load(cost_file)
+    cost_file.close()
+    costs = dict(DEFAULT_COSTS)
+    costs.update(calibration["seconds"])
+    return costs, calibration.get("speedup", 1.0), True
+
+def levelSeconds(gates, costs, speedup):
+    # a level's gates are spread over the threads; a level never takes less
+    # than its slowest gate
+    total = sum(costs[CELL_OPS[gate.function]] for gate in gates)
+    return max([total / speedup] + [costs[CELL_OPS[gate.function]] for gate in gates])
+
+def predictSeconds(sections, costs, parallel, speedup):
+    # sections: (gates in schedule order, number of evaluations)
+    seconds = 0.0
+    for gates, repeat in sections:
+        if parallel:
+            seconds += repeat * sum(levelSeconds(level, costs, speedup) for level in groupByLevel(gates) if level)
+        else:
+            seconds += repeat * sum(costs[CELL_OPS[gate.function]] for gate in gates)
+    return seconds
+
+def estimateCost(gateOrder, flipFlops, timeSteps, slotCount, parallel, runtimeLoop, codeBytes, costFile=COST_FILE):
+    # the generated program evaluates every gate in the first clock cycle
+    # (or the invariant gates once before the loop) and the gates depending
+    # on a flip flop in every cycle; flip flops are copied between cycles
+    costs, speedup, calibrated = loadGateCosts(costFile)
+    invariant = [gate for gate in gateOrder if not gate.dependsOnFF]
+    changing = [gate for gate in gateOrder if gate.dependsOnFF]
+    if runtimeLoop:
+        sections = [(invariant, 1), (changing, timeSteps)]
+    else:
+        sections = [(gateOrder, 1), (changing, timeSteps - 1)]
+
+    gates = {}
+    for gate in gateOrder:
+        op = CELL_OPS[gate.function]
+        if op not in gates:
+            gates[op] = {"bootstrapped": op not in FREE_OPS, "per_cycle": 0, "invariant": 0, "evaluations": 0}
+        gates[op]["per_cycle" if gate.dependsOnFF else "invariant"] += 1
+    for op in gates:
+        gates[op]["evaluations"] = gates[op]["invariant"] + gates[op]["per_cycle"] * timeSteps
+    copies = len(flipFlops) * max(timeSteps - 1, 0)
+
+    bootstraps = sum(gates[op]["evaluations"] * (2 if op == "MUX" else 1) for op in gates if gates[op]["bootstrapped"])
+    free = sum(gates[op]["evaluations"] for op in gates if not gates[op]["bootstrapped"]) + copies
+
+    arrival = arrivalTimes(gateOrder)
+    firstDepth = max([arrival[net] for gate in gateOrder for net in gate.outputNets] + [0])
+    cycleDepth = max([arrival[net] for gate in changing for net in gate.outputNets] + [0])
+
+    seconds = predictSeconds(sections, costs, parallel, speedup) + copies * costs["COPY"]
+    return {
+        "timesteps": timeSteps,
+        "gates": gates,
+        "bootstraps": bootstraps,
+        "free_gates": free,
+        "flip_flop_copies": copies,
+        "depth": {
+            "first_cycle": firstDepth,
+            "per_cycle": cycleDepth,
+            "total": firstDepth + cycleDepth * max(timeSteps - 1, 0),
+        },
+        "logic_levels": len(groupByLevel(gateOrder)),
+        "peak_ciphertexts": slotCount,
+        "ciphertext_bytes": slotCount * CIPHERTEXT_BYTES,
+        "code_bytes": codeBytes,
+        "predicted_seconds": seconds,
+        "parallel_speedup": speedup if parallel else 1.0,
+        "calibrated": calibrated,
+    }
+
+def printEstimate(estimate):
+    print("Cost estimate over", estimate["timesteps"], "timesteps:")
+    for op in sorted(estimate["gates"]):
+        counts = estimate["gates"][op]
+        kind = "bootstrapped" if counts["bootstrapped"] else "free"
+        print("  ", op, kind, counts["evaluations"], "evaluations (" + str(counts["invariant"]), "once,",
+              counts["per_cycle"], "per cycle)")
+    print("   Bootstraps:", estimate["bootstraps"], "free gates:", estimate["free_gates"],
+          "(including", estimate["flip_flop_copies"], "flip flop copies)")
+    print("   Bootstrap depth:", estimate["depth"]["total"], "(" + str(estimate["depth"]["first_cycle"]),
+          "in the first cycle,", estimate["depth"]["per_cycle"], "per later cycle)")
+    print("   Peak live ciphertexts:", estimate["peak_ciphertexts"], "(" + str(estimate["ciphertext_bytes"] // 1024), "KB)")
+    print("   Generated code:", estimate["code_bytes"] // 1024, "KB")
+    source = "calibrated" if estimate["calibrated"] else "uncalibrated, run ./benchmark to calibrate"
+    print("   Predicted runtime:", round(estimate["predicted_seconds"], 1), "s (" + source + ")")
+
+def writeEstimate(filename, estimate):
+    estimate_file = open(filename, "w")
+    json.dump(estimate, estimate_file, indent=2, sort_keys=True)
+    estimate_file.write("\n")
+    estimate_file.close()
+
+def readEstimate(filename):
+    estimate_file = open(filename, "r")
+    estimate = json.load(estimate_file)
+    estimate_file.close()
+    return estimate
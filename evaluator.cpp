@@ -0,0 +1,299 @@
+// Generic evaluator for circuits written by gen_circuit_secure.py in the binary
+// circuit format (see binary_circuit.py). It is compiled once and runs any
+// circuit without generating or compiling C++ code:
+//
+//    ./evaluator <CIRCUIT>.bin [NUMBER_OF_CYCLES]
+//
+// Inputs are read from inputs/<net>.ctxt, outputs are written to
+// outputs/<net>.ctxt and the cloud key is read from clouds.key, exactly like
+// the generated programs. If an inputs.bundle file exists, it is mapped into
+// memory and used for the inputs instead, and the outputs are written to
+// outputs.bundle.
+#include <iostream>
+#include <tfhe/tfhe.h>
+#include <tfhe/tfhe_io.h>
+#include <stdio.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <string>
+#include <vector>
+
+using namespace std;
+
+#include "bundle.h"
+
+// must match OPCODES in codegen.py
+enum GateOp {
+   GATE_AND,
+   GATE_OR,
+   GATE_NOT,
+   GATE_NAND,
+   GATE_NOR,
+   GATE_XOR,
+   GATE_XNOR,
+   GATE_ZERO,
+   GATE_ONE,
+   GATE_ANDNY,
+   GATE_ANDYN,
+   GATE_ORNY,
+   GATE_ORYN,
+   GATE_MUX,
+   GATE_COPY,
+};
+
+const uint32_t NO_OPERAND = 0xFFFFFFFF;
+
+struct Gate {
+   uint32_t op;
+   uint32_t level;
+   uint32_t out;
+   uint32_t in[3];
+};
+
+struct PortBit {
+   uint32_t slot;
+   string net;
+};
+
+struct Port {
+   bool isOutput;
+   string name;
+   vector<PortBit> bits;
+};
+
+struct Circuit {
+   uint32_t slotCount;
+   uint32_t cycles;
+   vector<Port> ports;
+   vector<uint32_t> flipFlopQ;
+   vector<uint32_t> flipFlopD;
+   vector<Gate> invariant;
+   vector<Gate> changing;
+};
+
+static void readBytes(FILE* file, void* data, size_t size) {
+   if (fread(data, 1, size, file) != size) {
+      fprintf(stderr, "truncated circuit file\n");
+      exit(1);
+   }
+}
+
+static uint32_t readU32(FILE* file) {
+   uint8_t bytes[4];
+   readBytes(file, bytes, 4);
+   return bytes[0] | (bytes[1] << 8) | (bytes[2] << 16) | ((uint32_t) bytes[3] << 24);
+}
+
+static string readName(FILE* file) {
+   uint8_t bytes[2];
+   readBytes(file, bytes, 2);
+   string name(bytes[0] | (bytes[1] << 8), '\0');
+   if (!name.empty()) {
+      readBytes(file, &name[0], name.size());
+   }
+   return name;
+}
+
+static void readGates(FILE* file, vector<Gate>& gates, uint32_t count) {
+   gates.resize(count);
+   for (uint32_t i = 0; i < count; i++) {
+      gates[i].op = readU32(file);
+      gates[i].level = readU32(file);
+      gates[i].out = readU32(file);
+      for (int j = 0; j < 3; j++) {
+         gates[i].in[j] = readU32(file);
+      }
+   }
+}
+
+static Circuit readCircuit(const char* filename) {
+   FILE* file = fopen(filename, "rb");
+   if (file == NULL) {
+      fprintf(stderr, "cannot open %s\n", filename);
+      exit(1);
+   }
+
+   char magic[4];
+   readBytes(file, magic, 4);
+   if (memcmp(magic, "RMEO", 4) != 0 || readU32(file) != 1) {
+      fprintf(stderr, "%s is not a version 1 Romeo circuit\n", filename);
+      exit(1);
+   }
+
+   Circuit circuit;
+   circuit.slotCount = readU32(file);
+   circuit.cycles = readU32(file);
+   uint32_t portCount = readU32(file);
+   uint32_t flipFlopCount = readU32(file);
+   uint32_t invariantCount = readU32(file);
+   uint32_t changingCount = readU32(file);
+
+   circuit.ports.resize(portCount);
+   for (uint32_t i = 0; i < portCount; i++) {
+      uint8_t direction;
+      readBytes(file, &direction, 1);
+      circuit.ports[i].isOutput = direction == 1;
+      uint32_t width = readU32(file);
+      circuit.ports[i].name = readName(file);
+      circuit.ports[i].bits.resize(width);
+      for (uint32_t j = 0; j < width; j++) {
+         circuit.ports[i].bits[j].slot = readU32(file);
+         circuit.ports[i].bits[j].net = readName(file);
+      }
+   }
+
+   for (uint32_t i = 0; i < flipFlopCount; i++) {
+      circuit.flipFlopQ.push_back(readU32(file));
+      circuit.flipFlopD.push_back(readU32(file));
+   }
+
+   readGates(file, circuit.invariant, invariantCount);
+   readGates(file, circuit.changing, changingCount);
+   fclose(file);
+   return circuit;
+}
+
+static void evalGate(const Gate& gate, LweSample* ciphertexts, const TFheGateBootstrappingCloudKeySet* bk) {
+   LweSample* out = &ciphertexts[gate.out];
+   const LweSample* a = gate.in[0] == NO_OPERAND ? NULL : &ciphertexts[gate.in[0]];
+   const LweSample* b = gate.in[1] == NO_OPERAND ? NULL : &ciphertexts[gate.in[1]];
+   const LweSample* c = gate.in[2] == NO_OPERAND ? NULL : &ciphertexts[gate.in[2]];
+   switch (gate.op) {
+      case GATE_AND: bootsAND(out, a, b, bk); break;
+      case GATE_OR: bootsOR(out, a, b, bk); break;
+      case GATE_NOT: bootsNOT(out, a, bk); break;
+      case GATE_NAND: bootsNAND(out, a, b, bk); break;
+      case GATE_NOR: bootsNOR(out, a, b, bk); break;
+      case GATE_XOR: bootsXOR(out, a, b, bk); break;
+      case GATE_XNOR: bootsXNOR(out, a, b, bk); break;
+      case GATE_ZERO: bootsCONSTANT(out, 0, bk); break;
+      case GATE_ONE: bootsCONSTANT(out, 1, bk); break;
+      case GATE_ANDNY: bootsANDNY(out, a, b, bk); break;
+      case GATE_ANDYN: bootsANDYN(out, a, b, bk); break;
+      case GATE_ORNY: bootsORNY(out, a, b, bk); break;
+      case GATE_ORYN: bootsORYN(out, a, b, bk); break;
+      case GATE_MUX: bootsMUX(out, a, b, c, bk); break;
+      case GATE_COPY: bootsCOPY(out, a, bk); break;
+      default:
+         fprintf(stderr, "unknown opcode %u\n", gate.op);
+         exit(1);
+   }
+}
+
+// gates are sorted by level and gates of one level are independent
+static void evalGates(const vector<Gate>& gates, LweSample* ciphertexts, const TFheGateBootstrappingCloudKeySet* bk) {
+   size_t start = 0;
+   while (start < gates.size()) {
+      size_t end = start;
+      while (end < gates.size() && gates[end].level == gates[start].level) {
+         end++;
+      }
+      #pragma omp parallel for schedule(dynamic, 1)
+      for (long i = (long) start; i < (long) end; i++) {
+         evalGate(gates[i], ciphertexts, bk);
+      }
+      start = end;
+   }
+}
+
+int main(int argc, char** argv) {
+   if (argc < 2) {
+      fprintf(stderr, "usage: %s <circuit.bin> [cycles]\n", argv[0]);
+      return 1;
+   }
+
+   Circuit circuit = readCircuit(argv[1]);
+   uint32_t cycles = circuit.cycles;
+   if (argc > 2) {
+      cycles = atoi(argv[2]);
+   }
+
+   FILE* cloud_key = fopen("clouds.key", "rb");
+   TFheGateBootstrappingCloudKeySet* bk = new_tfheGateBootstrappingCloudKeySet_fromFile(cloud_key);
+   fclose(cloud_key);
+
+   const TFheGateBootstrappingParameterSet* params = bk->params;
+
+   LweSample* ciphertexts = new_gate_bootstrapping_ciphertext_array(circuit.slotCount, params);
+   size_t flipFlopCount = circuit.flipFlopQ.size();
+   LweSample* nextState = new_gate_bootstrapping_ciphertext_array(flipFlopCount + 1, params);
+
+   FILE* bundle_file = fopen("inputs.bundle", "rb");
+   bool bundled = bundle_file != NULL;
+   if (bundled) {
+      fclose(bundle_file);
+   }
+
+   CiphertextBundle input_bundle;
+   if (bundled) {
+      mapBundle("inputs.bundle", input_bundle);
+   }
+   for (size_t i = 0; i < circuit.ports.size(); i++) {
+      if (circuit.ports[i].isOutput) {
+         continue;
+      }
+      for (size_t j = 0; j < circuit.ports[i].bits.size(); j++) {
+         const PortBit& bit = circuit.ports[i].bits[j];
+         if (bundled) {
+            pointToBundle(input_bundle, circuit.ports[i].name, j, &ciphertexts[bit.slot], params);
+            continue;
+         }
+         string path = "inputs/" + bit.net + ".ctxt";
+         FILE* input_file = fopen(path.c_str(), "rb");
+         if (input_file == NULL) {
+            fprintf(stderr, "cannot open %s\n", path.c_str());
+            return 1;
+         }
+         import_gate_bootstrapping_ciphertext_fromFile(input_file, &ciphertexts[bit.slot], params);
+         fclose(input_file);
+      }
+   }
+
+   for (size_t i = 0; i < flipFlopCount; i++) {
+      bootsCONSTANT(&ciphertexts[circuit.flipFlopQ[i]], 0, bk);
+   }
+   evalGates(circuit.invariant, ciphertexts, bk);
+
+   for (uint32_t clock = 0; clock < cycles; clock++) {
+      if (clock > 0) {
+         // latch every D input before any Q is overwritten
+         for (size_t i = 0; i < flipFlopCount; i++) {
+            bootsCOPY(&nextState[i], &ciphertexts[circuit.flipFlopD[i]], bk);
+         }
+         for (size_t i = 0; i < flipFlopCount; i++) {
+            bootsCOPY(&ciphertexts[circuit.flipFlopQ[i]], &nextState[i], bk);
+         }
+      }
+      evalGates(circuit.changing, ciphertexts, bk);
+   }
+
+   BundleWriter output_bundle;
+   for (size_t i = 0; i < circuit.ports.size(); i++) {
+      if (!circuit.ports[i].isOutput) {
+         continue;
+      }
+      for (size_t j = 0; j < circuit.ports[i].bits.size(); j++) {
+         const PortBit& bit = circuit.ports[i].bits[j];
+         if (bundled) {
+            addToBundle(output_bundle, circuit.ports[i].name, j, &ciphertexts[bit.slot]);
+            continue;
+         }
+         string path = "outputs/" + bit.net + ".ctxt";
+         FILE* output_file = fopen(path.c_str(), "wb");
+         export_gate_bootstrapping_ciphertext_toFile(output_file, &ciphertexts[bit.slot], params);
+         fclose(output_file);
+      }
+   }
+   if (bundled) {
+      writeBundle(output_bundle, "outputs.bundle", params);
+   }
+
+   if (bundled) {
+      releaseBundle(input_bundle);
+   }
+   delete_gate_bootstrapping_ciphertext_array(flipFlopCount + 1, nextState);
+   delete_gate_bootstrapping_ciphertext_array(circuit.slotCount, ciphertexts);
+   delete_gate_bootstrapping_cloud_keyset(bk);
+   return 0;
+}
@@ -0,0 +1,271 @@
+// Ciphertext exchange between the programs of a partitioned circuit. Every
+// partition listens on its endpoint from partitions.txt and connects to the
+// partitions that read the nets it computes. A net is sent as soon as it has
+// been computed and received right before it is first needed; a thread per
+// incoming connection queues arriving ciphertexts, so sends never wait for
+// the reader. Generated partition programs embed a copy of this file.
+//
+//   partitions.txt:  one endpoint per partition, in partition order, either
+//                    host:port (TCP) or unix:path (Unix domain socket);
+//                    empty lines and lines starting with # are skipped
+//   message:         net id (uint32), the n mask coefficients and the body
+//                    (int32), the variance (double)
+//
+// Numbers are sent in the byte order of the machine, so all partitions must
+// run on machines of the same byte order.
+#include <stdio.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <unistd.h>
+#include <netdb.h>
+#include <netinet/in.h>
+#include <netinet/tcp.h>
+#include <sys/socket.h>
+#include <sys/un.h>
+#include <condition_variable>
+#include <deque>
+#include <map>
+#include <mutex>
+#include <string>
+#include <thread>
+#include <vector>
+
+const int EXCHANGE_CONNECT_ATTEMPTS = 600; // 100 ms apart, partitions can be started in any order
+
+struct ExchangeNetwork {
+   int32_t n;
+   int listener;
+   std::string unixPath; // removed when the exchange is closed
+   std::map<int, int> sockets; // partition -> connection the nets it reads are sent on
+   std::vector<int> connections; // connections the nets read here arrive on
+   std::vector<std::thread> receivers;
+   std::map<uint32_t, std::deque<std::vector<char> > > pending; // net id -> received, not yet used
+   int open; // incoming connections that have not been closed yet
+   std::mutex lock;
+   std::condition_variable arrived;
+};
+
+static void exchangeError(const char* message, const std::string& detail) {
+   fprintf(stderr, "%s%s\n", message, detail.c_str());
+   exit(1);
+}
+
+static size_t exchangeMessageSize(int32_t n) {
+   return 4 + 4 * (size_t) n + 4 + sizeof(double);
+}
+
+static std::vector<std::string> readEndpoints(const char* filename) {
+   std::vector<std::string> endpoints;
+   FILE* endpoint_file = fopen(filename, "r");
+   if (endpoint_file == NULL) {
+      exchangeError("cannot open ", filename);
+   }
+   char line[4096];
+   while (fgets(line, sizeof(line), endpoint_file) != NULL) {
+      std::string endpoint(line);
+      endpoint.erase(endpoint.find_last_not_of(" \t\r\n") + 1);
+      endpoint.erase(0, endpoint.find_first_not_of(" \t"));
+      if (endpoint.size() > 0 && endpoint[0] != '#') {
+         endpoints.push_back(endpoint);
+      }
+   }
+   fclose(endpoint_file);
+   return endpoints;
+}
+
+// opens a socket listening on (listen) or connected to an endpoint; returns -1
+// if the connection cannot be made yet
+static int openEndpoint(const std::string& endpoint, bool listen) {
+   if (endpoint.compare(0, 5, "unix:") == 0) {
+      struct sockaddr_un address;
+      memset(&address, 0, sizeof(address));
+      address.sun_family = AF_UNIX;
+      if (endpoint.size() - 5 >= sizeof(address.sun_path)) {
+         exchangeError("socket path too long: ", endpoint);
+      }
+      strcpy(address.sun_path, endpoint.c_str() + 5);
+      int descriptor = socket(AF_UNIX, SOCK_STREAM, 0);
+      if (listen) {
+         unlink(address.sun_path);
+         if (bind(descriptor, (struct sockaddr*) &address, sizeof(address)) != 0 || ::listen(descriptor, SOMAXCONN) != 0) {
+            exchangeError("cannot listen on ", endpoint);
+         }
+      } else if (connect(descriptor, (struct sockaddr*) &address, sizeof(address)) != 0) {
+         close(descriptor);
+         return -1;
+      }
+      return descriptor;
+   }
+
+   size_t colon = endpoint.rfind(':');
+   if (colon == std::string::npos) {
+      exchangeError("endpoint is neither host:port nor unix:path: ", endpoint);
+   }
+   std::string host = endpoint.substr(0, colon);
+   std::string port = endpoint.substr(colon + 1);
+   struct addrinfo hints;
+   struct addrinfo* addresses;
+   memset(&hints, 0, sizeof(hints));
+   hints.ai_family = AF_UNSPEC;
+   hints.ai_socktype = SOCK_STREAM;
+   hints.ai_flags = listen ? AI_PASSIVE : 0;
+   if (getaddrinfo(host.empty() || host == "*" ? NULL : host.c_str(), port.c_str(), &hints, &addresses) != 0) {
+      exchangeError("cannot resolve ", endpoint);
+   }
+   int descriptor = -1;
+   for (struct addrinfo* address = addresses; address != NULL && descriptor < 0; address = address->ai_next) {
+      descriptor = socket(address->ai_family, address->ai_socktype, address->ai_protocol);
+      if (descriptor < 0) {
+         continue;
+      }
+      int enable = 1;
+      if (listen) {
+         setsockopt(descriptor, SOL_SOCKET, SO_REUSEADDR, &enable, sizeof(enable));
+         if (bind(descriptor, address->ai_addr, address->ai_addrlen) != 0 || ::listen(descriptor, SOMAXCONN) != 0) {
+            close(descriptor);
+            descriptor = -1;
+         }
+      } else if (connect(descriptor, address->ai_addr, address->ai_addrlen) != 0) {
+         close(descriptor);
+         descriptor = -1;
+      } else {
+         // ciphertexts are sent one by one and are needed right away
+         setsockopt(descriptor, IPPROTO_TCP, TCP_NODELAY, &enable, sizeof(enable));
+      }
+   }
+   freeaddrinfo(addresses);
+   if (listen && descriptor < 0) {
+      exchangeError("cannot listen on ", endpoint);
+   }
+   return descriptor;
+}
+
+static bool readFully(int descriptor, char* data, size_t size) {
+   while (size > 0) {
+      ssize_t count = read(descriptor, data, size);
+      if (count <= 0) {
+         return false;
+      }
+      data += count;
+      size -= count;
+   }
+   return true;
+}
+
+static void writeFully(int descriptor, const char* data, size_t size) {
+   while (size > 0) {
+      ssize_t count = write(descriptor, data, size);
+      if (count <= 0) {
+         exchangeError("lost the connection to a partition", "");
+      }
+      data += count;
+      size -= count;
+   }
+}
+
+// queues the ciphertexts arriving on one connection until it is closed
+static void receiveLoop(ExchangeNetwork* network, int connection) {
+   std::vector<char> message(exchangeMessageSize(network->n));
+   while (readFully(connection, message.data(), message.size())) {
+      uint32_t id;
+      memcpy(&id, message.data(), 4);
+      std::lock_guard<std::mutex> guard(network->lock);
+      network->pending[id].push_back(message);
+      network->arrived.notify_all();
+   }
+   std::lock_guard<std::mutex> guard(network->lock);
+   network->open--;
+   network->arrived.notify_all();
+}
+
+// connects partition to the peers it sends to and accepts the incoming
+// connections of the partitions sending to it
+static void openExchange(ExchangeNetwork& network, const char* filename, int partition, const int* peers, int peerCount,
+                         int incoming, const TFheGateBootstrappingParameterSet* params) {
+   std::vector<std::string> endpoints = readEndpoints(filename);
+   for (int i = 0; i < peerCount; i++) {
+      if (peers[i] >= (int) endpoints.size()) {
+         exchangeError("not enough endpoints in ", filename);
+      }
+   }
+   if (partition >= (int) endpoints.size()) {
+      exchangeError("not enough endpoints in ", filename);
+   }
+   network.n = params->in_out_params->n;
+   network.open = incoming;
+   network.listener = openEndpoint(endpoints[partition], true);
+   if (endpoints[partition].compare(0, 5, "unix:") == 0) {
+      network.unixPath = endpoints[partition].substr(5);
+   }
+
+   // a peer only has to be listening for the connection to succeed, so
+   // connecting before accepting cannot deadlock
+   for (int i = 0; i < peerCount; i++) {
+      int descriptor = -1;
+      for (int attempt = 0; attempt < EXCHANGE_CONNECT_ATTEMPTS && descriptor < 0; attempt++) {
+         descriptor = openEndpoint(endpoints[peers[i]], false);
+         if (descriptor < 0) {
+            usleep(100000);
+         }
+      }
+      if (descriptor < 0) {
+         exchangeError("cannot connect to ", endpoints[peers[i]]);
+      }
+      network.sockets[peers[i]] = descriptor;
+   }
+
+   for (int i = 0; i < incoming; i++) {
+      int connection = accept(network.listener, NULL, NULL);
+      if (connection < 0) {
+         exchangeError("cannot accept a connection on ", endpoints[partition]);
+      }
+      network.connections.push_back(connection);
+      network.receivers.push_back(std::thread(receiveLoop, &network, connection));
+   }
+}
+
+static void sendCiphertext(ExchangeNetwork& network, int partition, uint32_t id, const LweSample* sample) {
+   std::vector<char> message(exchangeMessageSize(network.n));
+   memcpy(&message[0], &id, 4);
+   memcpy(&message[4], sample->a, 4 * (size_t) network.n);
+   memcpy(&message[4 + 4 * (size_t) network.n], &sample->b, 4);
+   memcpy(&message[8 + 4 * (size_t) network.n], &sample->current_variance, sizeof(double));
+   writeFully(network.sockets[partition], message.data(), message.size());
+}
+
+// waits for the next ciphertext of a net computed by another partition
+static void receiveCiphertext(ExchangeNetwork& network, uint32_t id, LweSample* sample) {
+   std::unique_lock<std::mutex> guard(network.lock);
+   std::deque<std::vector<char> >& queue = network.pending[id];
+   network.arrived.wait(guard, [&] { return !queue.empty() || network.open == 0; });
+   if (queue.empty()) {
+      exchangeError("a partition closed its connection before sending net ", std::to_string(id));
+   }
+   std::vector<char> message;
+   message.swap(queue.front());
+   queue.pop_front();
+   guard.unlock();
+   memcpy(sample->a, &message[4], 4 * (size_t) network.n);
+   memcpy(&sample->b, &message[4 + 4 * (size_t) network.n], 4);
+   memcpy(&sample->current_variance, &message[8 + 4 * (size_t) network.n], sizeof(double));
+}
+
+// closes the outgoing connections and waits until every partition sending
+// to this one has closed its connection as well
+static void closeExchange(ExchangeNetwork& network) {
+   for (std::map<int, int>::iterator peer = network.sockets.begin(); peer != network.sockets.end(); ++peer) {
+      shutdown(peer->second, SHUT_WR);
+   }
+   for (size_t i = 0; i < network.receivers.size(); i++) {
+      network.receivers[i].join();
+      close(network.connections[i]);
+   }
+   for (std::map<int, int>::iterator peer = network.sockets.begin(); peer != network.sockets.end(); ++peer) {
+      close(peer->second);
+   }
+   close(network.listener);
+   if (!network.unixPath.empty()) {
+      unlink(network.unixPath.c_str());
+   }
+}
@@ -1,66 +1,26 @@
+import argparse
+import contextlib
+import multiprocessing
+import os
 import subprocess
 import sys
-
-class Port:
-    # Defines input and output ports
-    def __init__(self, name, direction, length):
-        self.name = name
-        self.direction = direction # input or output
-        self.length = length # number of wires/bits
-        self.nets = [""] * self.length # wires in the port
-
-    def mapNet(self, net): # associate wires with ports
-        for i in nets:
-            if self.nets[i] == "":
-                self.nets[i] = net.name
-
-    def printPort(self): # debugging function
-        print("\nPort ID: " + self.name)
-        print("Direction: " + self.direction)
-        print("# of Wires: " + str(self.length))
-        index = 0
-        for i in self.nets:
-            if i != "":
-                print(str(index) + ": " + i)
-            index = index + 1
-
-class LogicGate:
-    def __init__(self, function, id):
-        self.function = function # operation (i.e. XOR, AND, ...)
-        self.id = id # identifier assigned by Yosys
-        self.inputNets = [] # input wires (usually 2, but 1 for NOT, and 3 for MUX)
-        self.outputNets = [] # output wires (usually 1)
-        self.dependsOn = [] # gates immediately preceding the current gate
-        self.dependsOnFF = False # used to determine if evaluation needs to repeat each clock cycle
-        self.isEncrypted = False # used to check if gate evaluation occurred already
-        self.next_state = "" # only used for sequential components
-
-    def setInputNets(self, inNet):
-        # associate wire with input of logic gate
-        self.inputNets.append(inNet)
-        for i in inNet.left:
-            self.dependsOn.append(i)
-
-    def setOutputNet(self, outNet):
-        # associate wire with output of logic gate
-        self.outputNets.append(outNet)
-
-
-class Net:
-    def __init__(self, name):
-        self.name = name # identifier assigned by Yosys
-        self.left = [] # this net is the output of these gates
-        self.right = [] # gates for which this net is an input
-        self.encValue = 0 # points to the ciphertext on the current wire
-        self.value = "" # plaintext input (only applicable for input nets)
-
-    def setLeft(self, leftGate):
-        # associate wire as the output of a gate
-        self.left.append(leftGate)
-
-    def setRight(self, rightGate):
-        # associate wire as the input of a gate
-        self.right.append(rightGate)
+import time
+
+from netlist import isFlipFlop, linkNetlist
+from edif_parser import readNetlist
+from optimize import optimizeNetlist
+from remap import remapNetlist
+from balance import balanceNetlist, bootstrapDepth
+from partition import partitionNetlist
+from analysis import analyzeNetlist, CIPHERTEXT_BYTES
+from codegen import parallelHelpers, bundleHelpers, declareCiphertexts, deleteCiphertexts, writeEvaluation, \
+    importInputs, exportOutputs, releaseInputs, batchFunction, batchMain, exchangeHelpers, openExchange, closeExchange, \
+    profileHelpers, profileStart, profileStop
+from binary_circuit import writeCircuit
+from port_map import writePortMap
+from estimate import estimateCost, printEstimate, writeEstimate, readEstimate, loadGateCosts
+from cache import cacheKey, lookup, restore, store
+from units import TranslationUnits
 
 def encryptInputs(netList):
     # prompts user for initial values of inputs
@@ -70,37 +30,10 @@ def encryptInputs(netList):
             subprocess.call("./encrconst.bashrc " + net.value, shell=True)
             net.encValue = int(subprocess.check_output(['grep', '-c', '$', 'ctxtMem.txt']))
 
-def checkFFDependency(gate, gateList):
-    # check if gate is a FF
-    if "dff" in gate.function:
-        return True
-
-    # check if gate is an input
-    elif len(gate.dependsOn) == 0:
-        return False
-
-    else:
-        for prev_gate in gate.dependsOn: # check if direct descendants are FFs
-            if "dff" in prev_gate.function:
-                return True
-
-        for prev_gate in gate.dependsOn: # second pass, checks deeper using recursion
-            if checkFFDependency(prev_gate, gateList) == True:
-                return True
-
-    return False
-
-def main():
-    inputFile = str(input("Please enter the filename of an EDIF netlist: "))
-    outputFile = str(input("Please enter a filename for the generated circuit (.cpp): "))
-    edif_file = open(inputFile, "r")
-    tfhe_file = open(outputFile, "w")
-    timeSteps = int(input("Enter the number of timesteps: ")) # number of cycles
-    currentTime = 0
-
-    # populate preamble
-    print("populating preamble...")
+# partition i listens on port EXCHANGE_PORT + i in the default partitions.txt
+EXCHANGE_PORT = 7600
 
+def writePreamble(tfhe_file):
     tfhe_file.write("#include <iostream>\n")
     tfhe_file.write("#include <tfhe/tfhe.h>\n")
     tfhe_file.write("#include <tfhe/tfhe_io.h>\n")
@@ -109,409 +42,493 @@ def main():
     tfhe_file.write("#include <string.h>\n\n")
 
     tfhe_file.write("using namespace std;\n\n")
+
+def writeHelpers(tfhe_file, parallel, bundle, profile, units=None):
+    # programs split into translation units get the gate table types from
+    # the shared header
+    if units is not None:
+        tfhe_file.write('#include "' + units.header() + '"\n\n')
+    if profile:
+        tfhe_file.write(profileHelpers())
+    if parallel:
+        tfhe_file.write(parallelHelpers(profile, units is None))
+    if bundle:
+        tfhe_file.write(bundleHelpers())
+
+def writeKeyLoading(tfhe_file, profile=False):
     tfhe_file.write("int main(int argc, char** argv) {\n\n")
+    if profile:
+        tfhe_file.write(profileStart("key_load"))
     tfhe_file.write('''   FILE* cloud_key = fopen("clouds.key", "rb");\n''')
     tfhe_file.write('''   TFheGateBootstrappingCloudKeySet* bk = new_tfheGateBootstrappingCloudKeySet_fromFile(cloud_key);\n''')
-    tfhe_file.write('''   fclose(cloud_key);\n\n''')
+    tfhe_file.write('''   fclose(cloud_key);\n''')
+    if profile:
+        tfhe_file.write(profileStop("key_load"))
+    tfhe_file.write("\n")
     tfhe_file.write('''   const TFheGateBootstrappingParameterSet* params = bk->params;\n\n''')
 
-
-    flag = 0
-    interfaceFlag = 0
-    cellDFFFlag = 0
-    indexFlag = 0
-    portFlag = 0
-    genericCounter = 0
-    wireMapFlag = 0
-    renameFlag = 1
-    mapFlag = 0
-    arrayFlag = 0
-    cellCounter = 0
-    nameFlag = 0
-    prevWord = "ERROR"
-    tempName = ""
-    gateList = []
-    portList = []
-    cellList = []
-    netList = []
-
-    print("parsing EDIF netlist...")
-    print("Declaring nets and gates...")
-    for line in edif_file:
-        isRight = 0
-        isLeft = 0
-
-        # ignore certain declarations
-        if "GND" in line or "VCC" in line or "VDD" in line or "CK" in line:
-            continue
-
-        # get names of cells
-        if "cell" in line and not flag and ("GENERIC" not in line) and (cellDFFFlag == 0):
-            cellName = False
-            if "(rename" not in line:
-                cellName = True
-            for word in line.split():
-                if "id" in word:
-                    cellName = True
-                    continue
-                elif "cell" in word:
-                    continue
-                elif cellName:
-                    tempWord = word
-                    tempWord = ''.join([i for i in tempWord if i.isalpha()])
-                    cellList.append(tempWord)
-                    cellName = False
-
-        if "DESIGN" in line:
-            flag = 1
-
-        if "cell dff" in line: # special case for flip flops
-            flag = 0
-            cellDFFFlag = 1
-            continue
-
-        if "GENERIC" in line and cellDFFFlag:
-            genericCounter = genericCounter + 1
-
-        if genericCounter == 2:
-            flag = 1
-
-        if flag and "portRef" in line: # check if port is being referenced
-            if ("instanceRef" not in line) and ("member" not in line):
-                wireMapFlag = 1
-
-        if flag and "interface" in line:
-            interfaceFlag = 1
-
-        # map net to port
-        if ("net" in line) and ("rename" in line) and ("$" not in line) and flag:
-            mapFlag = 1
-        elif ("portRef" in line) and ("(member" in line) and flag:
-            mapFlag = 1
-        elif ("net" in line) and ("rename" not in line) and ("joined" in line):
-            mapFlag = 1
-            renameFlag = 0
-
-        if flag and "GENERIC" in line:
-            cellCounter = cellCounter + 1
-        if cellCounter > 1: # ignore subsequent cells
-            break
-        if "net" in line or "portRef" in line:
-            isNet = 1
-            isInstance = 0
-            isDeclare = 0
-        elif "instance" in line:
-            isInstance = 1
-            isNet = 0
-            isDeclare = 0
-        elif "cellRef" in line and "GENERIC" not in line:
-            isInstance = 0
-            isNet = 0
-            isDeclare = 1
+def writePartition(filename, partition, gateOrder, flipFlops, allocateSlots, portList, timeSteps, parallel, runtimeLoop, bundle,
+                   profile):
+    # one program evaluating the gates of a partition; partition 0 also
+    # writes the outputs. Profiled partitions write profile_<index>.json.
+    tfhe_file = open(filename, "w")
+    writePreamble(tfhe_file)
+    writeHelpers(tfhe_file, parallel, bundle, profile)
+    tfhe_file.write(exchangeHelpers())
+    writeKeyLoading(tfhe_file, profile)
+
+    gates = set(partition.gates)
+    localOrder = [gate for gate in gateOrder if gate in gates]
+    localFlipFlops = [gate for gate in flipFlops if gate in gates]
+    slots, slotCount = allocateSlots(parallel, partition)
+    tfhe_file.write(declareCiphertexts(partition.nets, slots, slotCount))
+    writePhase(tfhe_file, "exchange_setup", openExchange(partition), profile)
+    writePhase(tfhe_file, "input_import", importInputs(portList, bundle, nets=set(net.name for net in partition.nets)),
+               profile)
+
+    if profile:
+        tfhe_file.write(profileStart("evaluation"))
+    writeEvaluation(tfhe_file, localOrder, localFlipFlops, timeSteps, parallel, runtimeLoop, partition=partition,
+                    profile=profile)
+    if profile:
+        tfhe_file.write(profileStop("evaluation"))
+
+    tfhe_file.write(closeExchange())
+    if partition.index == 0:
+        writePhase(tfhe_file, "output_export", exportOutputs(portList, bundle), profile)
+    tfhe_file.write(releaseInputs(bundle))
+    tfhe_file.write(deleteCiphertexts(slotCount))
+    if profile:
+        tfhe_file.write('   writeProfile("profile_' + str(partition.index) + '.json");\n')
+    tfhe_file.write("   return 0;\n")
+    tfhe_file.write("}\n")
+    tfhe_file.close()
+
+def writePhase(tfhe_file, phase, code, profile):
+    # writes code, timed as phase if profiling
+    if profile:
+        tfhe_file.write(profileStart(phase))
+    tfhe_file.write(code)
+    if profile:
+        tfhe_file.write(profileStop(phase))
+
+def writeEndpoints(outputFile, partitionCount):
+    # default partitions.txt running every partition on localhost
+    endpointFile = os.path.join(os.path.dirname(outputFile), "partitions.txt")
+    if os.path.exists(endpointFile):
+        print("Keeping the existing", endpointFile)
+        return
+    endpoints = open(endpointFile, "w")
+    endpoints.write("# one endpoint (host:port or unix:path) per partition, in order\n")
+    for index in range(partitionCount):
+        endpoints.write("127.0.0.1:" + str(EXCHANGE_PORT + index) + "\n")
+    endpoints.close()
+
+def compileCircuit(source, program, openmp, partitioned):
+    # the compiler and extra flags can be set with CXX and CXXFLAGS
+    command = [os.environ.get("CXX", "g++"), "-O2"] + os.environ.get("CXXFLAGS", "").split()
+    if openmp:
+        command.append("-fopenmp")
+    if partitioned:
+        command.append("-pthread")
+    command += ["-o", program, source, "-ltfhe-spqlios-fma"]
+    print(" ".join(command))
+    subprocess.check_call(command)
+
+def compileUnits(makefile, program):
+    # builds a program split into translation units with its makefile, one
+    # unit per core; CXX and CXXFLAGS are honoured like in compileCircuit()
+    command = ["make", "-C", os.path.dirname(os.path.abspath(makefile)), "-f", os.path.basename(makefile),
+               "-j", str(os.cpu_count() or 1), "PROGRAM=" + os.path.abspath(program)]
+    if "CXX" in os.environ:
+        command.append("CXX=" + os.environ["CXX"])
+    if "CXXFLAGS" in os.environ:
+        command.append("EXTRA_CXXFLAGS=" + os.environ["CXXFLAGS"])
+    print(" ".join(command))
+    subprocess.check_call(command)
+
+def compilePrograms(sources, programs, openmp, partitioned):
+    # sources and programs map cache roles to filenames
+    for role in programs:
+        if "circuit.mk" in sources and role == "circuit":
+            compileUnits(sources["circuit.mk"], programs[role])
         else:
-            isInstance = 0
-            isNet = 0
-            isDeclare = 0
-
-        for word in line.split():
-
-            if wireMapFlag:
-                prevWord_2 = ""
-                for word_2 in prevLine.split():
-                    if "id" in word_2:
-                        tempName = word_2.strip(')')
-                    elif "net" in prevWord_2:
-                        tempName = word_2.strip(')')
-                    prevWord_2 = word_2
-
-                if "portRef" in prevWord:
-                    for i in portList:
-                        if i.name == word.strip(')'):
-                            if "(instanceRef" in prevLine:
-                                i.nets[0] = word.strip(')')
-                            else:
-                                i.nets[0] = tempName
-
-                    wireMapFlag = 0
-
-            # identify input and output ports
-            if interfaceFlag and "port" in word:
-                portFlag = 1
-            elif interfaceFlag and portFlag and "array" in word:
-                arrayFlag = 1
-            elif interfaceFlag and portFlag and ("array" not in word) and ("port" in prevWord):
-                tempName = word
-                tempLength = 1
-            elif interfaceFlag and portFlag and arrayFlag and not nameFlag:
-                tempName = word
-                nameFlag = 1
-            elif interfaceFlag and portFlag and arrayFlag and nameFlag and "direction" not in word and \
-                    "INPUT" not in word and "OUTPUT" not in word:
-                tempLength = int(word.strip(')'))
-            elif interfaceFlag and "direction" in prevWord:
-                newPort = Port(tempName, word.strip(')'), tempLength)
-                portList.append(newPort)
-                portFlag = 0
-                arrayFlag = 0
-                nameFlag = 0
-
-            # port mapping
-            if mapFlag and (not renameFlag) and ("net" in prevWord):
-                for i in portList:
-                    if i.name == word:
-                        i.nets[0] = word
-                        break
-                mapFlag = 0
-                renameFlag = 1
-
-            if mapFlag and "id" in word:
-                tempName = word
-            elif mapFlag and "member" in prevWord:
-                portName = word
-                indexFlag = 1
-            elif mapFlag and indexFlag:
-                index = word.strip(')')
-                indexFlag = 0
-
-                for word_2 in prevLine.split():
-                    if "id" in word_2:
-                        tempName = word_2
-
-                for i in portList:
-                    if i.name == portName:
-                        i.nets[int(index)] = tempName
-                        break
-                mapFlag = 0
-
-            elif mapFlag and "id" in prevWord:
-                portName = word.strip('"')
-                portName = portName.strip(')')
-                index = ""
-                inBrackets = False
-                for character in portName:
-                    if character == '[':
-                        inBrackets = True
-                    elif character == ']':
-                        inBrackets = False
-                    elif inBrackets:
-                        index = index + character
-
-                for i in portList:
-                    if i.name == word:
-                        i.nets[int(index)] = tempName
-                        break
-
-                mapFlag = 0
-
-            if "contents" in word:
-                interfaceFlag = 0
-
-            if isInstance and "id" in word:
-                prevID = word
-            elif isInstance and "rename" not in line and "instance" not in word:
-                prevID = word
-            elif "id" in word and flag and isDeclare:
-                index = int(word[-1]) - 1
-                newGate = LogicGate(cellList[index], prevID)
-                gateList.append(newGate)
-            elif isDeclare and "(cellRef" in prevWord and flag and "DESIGN" not in line:
-                newGate = LogicGate(word.strip(')'), prevID)
-                gateList.append(newGate)
-
-            elif isNet and ("net" in prevWord) and ("rename" not in word):
-                newNet = Net(word)
-                tfhe_file.write("   LweSample* " + word + " = new_gate_bootstrapping_ciphertext_array(1, params);\n")
-                netList.append(newNet)
-            elif isNet and ("rename" in prevWord):
-                newNet = Net(word)
-                tfhe_file.write("   LweSample* " + word + " = new_gate_bootstrapping_ciphertext_array(1, params);\n")
-                netList.append(newNet)
-            elif isNet and (word == "A" or word == "B" or word == "C" or word == "D"):
-                isRight = 1
-                isLeft = 0
-            elif isNet and (word == "Y" or word == "Q"):
-                isLeft = 1
-                isRight = 0
-            elif isNet and ("instanceRef" in prevWord):
-                for gate in gateList:
-                    if (gate.id in word):
-                        if (isLeft):
-                            newNet.setLeft(gate)
-                        elif (isRight):
-                            newNet.setRight(gate)
-            prevWord = word
-        prevLine = line
+            compileCircuit(sources[role + ".cpp"], programs[role], openmp, partitioned)
+
+# answers to the prompts of main(), used when generateCircuit() is called
+# from other scripts
+DEFAULT_OPTIONS = {
+    "timesteps": 1, "parallel": False, "loop": False, "rebalance": False, "duplicate": False, "bundle": False,
+    "batch": False, "partitions": 1, "binary": "", "ports": "", "program": "", "estimate": "", "cache": False,
+    "profile": False, "units": 0,
+}
+
+def generateCircuit(inputFile, outputFile, options, stats=None):
+    # generates the TFHE program for an EDIF netlist. If stats is a dict, the
+    # time spent parsing, analyzing and emitting, the cost estimate and the
+    # effect of rebalancing are recorded in it.
+    timeSteps = options["timesteps"] # number of cycles
+    parallel = options["parallel"]
+    runtimeLoop = options["loop"]
+    rebalance = options["rebalance"]
+    duplicate = rebalance and options["duplicate"]
+    bundle = options["bundle"]
+    batch = bundle and options["batch"]
+    partitionCount = 1 if batch else options["partitions"]
+    binaryFile = options["binary"]
+    portMapFile = options["ports"]
+    programFile = options["program"]
+    estimateFile = options["estimate"]
+    useCache = options["cache"]
+    profile = options["profile"]
+    unitCount = options["units"] if partitionCount == 1 else 0
+    started = time.perf_counter()
+
+    # generated files and programs by their role in the cache
+    base, extension = os.path.splitext(outputFile)
+    sources = {"circuit.cpp": outputFile}
+    if binaryFile != "":
+        sources["circuit.bin"] = binaryFile
+    if portMapFile != "":
+        sources["circuit.ports"] = portMapFile
+    if estimateFile != "":
+        sources["circuit.estimate.json"] = estimateFile
+    programs = {}
+    if programFile != "" and partitionCount == 1:
+        programs["circuit"] = programFile
+    if partitionCount > 1:
+        for index in range(partitionCount):
+            sources["partition_" + str(index) + ".cpp"] = base + "_" + str(index) + extension
+            if programFile != "":
+                programs["partition_" + str(index)] = programFile + "_" + str(index)
+    units = None
+    if unitCount > 0:
+        units = TranslationUnits(base, unitCount, parallel, profile, parallel or batch)
+        sources["circuit.h"] = os.path.join(os.path.dirname(base), units.header())
+        sources["circuit.mk"] = units.makefile()
+        for index in range(unitCount):
+            sources["unit_" + str(index) + ".cpp"] = units.unitFile(index)
+
+    if useCache:
+        options = {"timesteps": timeSteps, "parallel": parallel, "loop": runtimeLoop, "rebalance": rebalance,
+                   "duplicate": duplicate, "bundle": bundle, "batch": batch, "partitions": partitionCount,
+                   "profile": profile, "units": unitCount}
+        if units is not None:
+            # the main file includes the header by name
+            options["header"] = units.header()
+        if estimateFile != "":
+            # the predicted runtime depends on the measured gate costs
+            costs, speedup, measured = loadGateCosts()
+            options["gate_costs"] = {"seconds": costs, "speedup": speedup}
+        key = cacheKey(inputFile, options)
+        description = {"netlist": os.path.basename(inputFile), "options": options}
+        entry = lookup(key, sources)
+        if entry is not None:
+            print("Found the circuit in the cache, skipping generation.")
+            restore(entry, sources)
+            if estimateFile != "":
+                estimate = readEstimate(estimateFile)
+                printEstimate(estimate)
+                if stats is not None:
+                    stats["estimate"] = estimate
+            if partitionCount > 1:
+                writeEndpoints(outputFile, partitionCount)
+            if lookup(key, programs) is not None:
+                print("Found the compiled program in the cache.")
+                restore(entry, programs)
+            elif programs:
+                compilePrograms(sources, programs, parallel or batch, partitionCount > 1)
+                store(key, programs, description)
+            print("Finished generating TFHE circuit!")
+            if stats is not None:
+                stats["cached"] = True
+            return
+
+    tfhe_file = open(outputFile, "w")
+
+    # populate preamble
+    print("populating preamble...")
+
+    writePreamble(tfhe_file)
+    writeHelpers(tfhe_file, parallel, bundle, profile, units)
+    if batch:
+        tfhe_file.write(batchFunction())
+    else:
+        writeKeyLoading(tfhe_file, profile)
+
+
+    print("parsing netlist...")
+    parseStart = time.perf_counter()
+    gateList, netList, portList = readNetlist(inputFile)
 
     print("Establishing connections between nets and gates...")
-    print(cellList)
-    for gate in gateList:
-        for net in netList:
-            for leftGate in net.left:
-                if (leftGate.id == gate.id):
-                    gate.setOutputNet(net)
-            for rightGate in net.right:
-                if (rightGate.id == gate.id):
-                    gate.setInputNets(net)
-
-    edif_file.close()
+    gateDict, netDict, portDict = linkNetlist(gateList, netList, portList)
+    analysisStart = time.perf_counter()
+
+    print("Optimizing netlist...")
+    gateList, netList, removedBootstraps = optimizeNetlist(gateList, netList, portList, netDict)
+    print("Removed", removedBootstraps, "bootstrapped gates.")
+
+    print("Remapping gates...")
+    gateList, netList, bootstrapsBefore, bootstrapsAfter = remapNetlist(gateList, netList, portList, netDict)
+    print("Bootstrapped gates before remapping:", bootstrapsBefore, "after:", bootstrapsAfter)
+
+    if rebalance:
+        print("Rebalancing gates...")
+        depthBefore, gatesBefore = bootstrapDepth(gateList), len(gateList)
+        gateList, netList = balanceNetlist(gateList, netList, portList, netDict, duplicate)
+        depthAfter = bootstrapDepth(gateList)
+        print("Depth before rebalancing:", depthBefore, "after:", depthAfter)
+        print("Gates before rebalancing:", gatesBefore, "after:", len(gateList))
+        if stats is not None:
+            stats["rebalance"] = {"depth_before": depthBefore, "depth_after": depthAfter, "gates_before": gatesBefore}
 
     print("Finished parsing netlist!")
     print("Removing redundancies...")
 
-    for gate in gateList:
-        gate.dependsOnFF = checkFFDependency(gate, gateList)
-
-    redundancyCounter = 0
-    for gate in gateList:
-        if gate.dependsOnFF == False:
-            redundancyCounter += 1
+    # gates that do not depend on a flip flop are only evaluated once; the
+    # gates are ordered once and the order is reused for every clock cycle
+    redundancyCounter, gateOrder, allocateSlots = analyzeNetlist(gateList, netList, portList)
 
     print("Removed",redundancyCounter,"gate redundancies.")
 
+    flipFlops = [gate for gate in gateList if isFlipFlop(gate)]
+
+    print("Declaring nets and gates...")
+    slots, slotCount = allocateSlots(parallel)
+    emissionStart = time.perf_counter()
+    tfhe_file.write(declareCiphertexts(netList, slots, slotCount, not batch))
+    savedBytes = (len(netList) - slotCount) * CIPHERTEXT_BYTES
+    print("Peak live ciphertexts:", slotCount, "of", len(netList), "nets, saving", savedBytes // 1024, "KB.")
+
+    if binaryFile != "":
+        print("Writing binary circuit...")
+        binarySlots, binarySlotCount = allocateSlots(True)
+        writeCircuit(binaryFile, gateOrder, flipFlops, portList, netDict, binarySlots, binarySlotCount, timeSteps)
+
+    if portMapFile != "":
+        print("Writing port map...")
+        writePortMap(portMapFile, portList)
+
     print("Preparing input values: ")
 
-    for port in portList:
-        isValid = False
-        userInput = ""
-        if "INPUT" in port.direction:
-            counter = port.length - 1
-            tfhe_file.write('\n')
-            for i in range(port.length):
-                tfhe_file.write('''   FILE* ''' + port.nets[counter] + '''_file = fopen("inputs/''' + port.nets[counter] + '''.ctxt", "rb");\n''')
-                tfhe_file.write('''   import_gate_bootstrapping_ciphertext_fromFile(''' + port.nets[counter] + '''_file, &''' + port.nets[counter] + '''[0], params);\n''')
-                tfhe_file.write('''   fclose(''' + port.nets[counter] + '''_file);\n''')
-                counter = counter - 1
+    if batch:
+        writePhase(tfhe_file, "input_import", importInputs(portList, bundle, "input_file"), profile)
+    else:
+        writePhase(tfhe_file, "input_import", importInputs(portList, bundle), profile)
 
 
     print("Encrypting gates...")
 
-    for gate in gateList:
-        # print(gate.id)
-        print(gate.function)
-        # print(gate.inputNets)
-        # print(gate.outputNets)
-        print(gate.dependsOnFF)
-        print()
     #encrypt all gates
-    for clock in range(timeSteps):
-        print("Timestep",clock)
-        if clock == 0:
-            encCounter = 0
-            for logicGate in gateList:
-                logicGate.isEncrypted = False
-                if "dff" in logicGate.function or logicGate.function == "FD1":
-                    if clock == 0:
-                        tfhe_file.write("   bootsCONSTANT(&" + gate.outputNets[0].name + "[0], 0, bk);\n")
-                        logicGate.isEncrypted = True
-                        encCounter += 1
-                    else:
-                        tfhe_file.write("   bootsCOPY(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[
-                            0].name + "[0], bk);\n")
-                        logicGate.isEncrypted = True
-                        encCounter += 1
-
-        else: # exclude redundant gates
-            encCounter = redundancyCounter
-            for logicGate in gateList:
-                if logicGate.dependsOnFF:
-                    logicGate.isEncrypted = False
-                if "dff" in logicGate.function or logicGate.function == "FD1":
-                    if clock == 0:
-                        tfhe_file.write("   bootsCONSTANT(&" + gate.outputNets[0].name + "[0], 0, bk);\n")
-                        logicGate.isEncrypted = True
-                        encCounter += 1
-                    else:
-                        tfhe_file.write("   bootsCOPY(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[
-                            0].name + "[0], bk);\n")
-                        logicGate.isEncrypted = True
-                        encCounter += 1
-
-
-        while encCounter < len(gateList):
-            for gate in gateList:
-                if (gate.isEncrypted == True):
-                    continue
-                if (len(gate.dependsOn) == 0):
-
-                    if (gate.function == "AND" or gate.function == "AN2"):
-                        tfhe_file.write("   bootsAND(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-                    elif (gate.function == "OR"):
-                        tfhe_file.write("   bootsOR(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-                    elif (gate.function == "NOT" or gate.function == "IV"):
-                        tfhe_file.write("   bootsNOT(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], bk);\n")
-                    elif (gate.function == "NAND" or gate.function == "ND2"):
-                        tfhe_file.write("   bootsNAND(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-                    elif (gate.function == "NOR" or gate.function == "NR2"):
-                        tfhe_file.write("   bootsNOR(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-                    elif (gate.function == "XOR"):
-                        tfhe_file.write("   bootsXOR(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-                    elif (gate.function == "XNOR"):
-                        tfhe_file.write("   bootsXNOR(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-
-                    gate.isEncrypted = True
-
-                    encCounter = encCounter + 1
-
-                else:
-                    encflag = 0
-                    for prevGate in gate.dependsOn:
-                        if (prevGate.isEncrypted == False):
-                            encflag = 1
-                            break
-
-                    if (encflag == 1):
-                        continue
-
-                    if (gate.function == "AND" or gate.function == "AN2"):
-                        tfhe_file.write("   bootsAND(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-                    elif (gate.function == "OR"):
-                        tfhe_file.write("   bootsOR(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-                    elif (gate.function == "NOT" or gate.function == "IV"):
-                        tfhe_file.write("   bootsNOT(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], bk);\n")
-                    elif (gate.function == "NAND" or gate.function == "ND2"):
-                        tfhe_file.write("   bootsNAND(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-                    elif (gate.function == "NOR" or gate.function == "NR2"):
-                        tfhe_file.write("   bootsNOR(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-                    elif (gate.function == "XOR"):
-                        tfhe_file.write("   bootsXOR(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-                    elif (gate.function == "XNOR"):
-                        tfhe_file.write("   bootsXNOR(&" + gate.outputNets[0].name + "[0], &" + gate.inputNets[0].name +
-                                        "[0], &" + gate.inputNets[1].name + "[0], bk);\n")
-
-
-                    gate.isEncrypted = True
-
-                    encCounter = encCounter + 1
-
-    tfhe_file.write('\n')
-    for port in portList:
-        if "OUTPUT" in port.direction:
-            for i in range(port.length):
-                tfhe_file.write('''   FILE* ''' + port.nets[i] + '''_file = fopen("outputs/''' + port.nets[i] + '''.ctxt","wb");\n''')
-                tfhe_file.write('''   export_gate_bootstrapping_ciphertext_toFile(''' + port.nets[i] + '''_file, &''' + port.nets[i] + '''[0], params);\n''')
-                tfhe_file.write("   fclose(" + port.nets[i] + "_file);\n")
-    tfhe_file.write('\n')
-
-    for net in netList:
-        tfhe_file.write("   delete_gate_bootstrapping_ciphertext_array(1, " + net.name + ");\n")
-
-    tfhe_file.write("   return 0;\n")
-    tfhe_file.write("}\n")
+    if profile:
+        tfhe_file.write(profileStart("evaluation"))
+    writeEvaluation(tfhe_file, gateOrder, flipFlops, timeSteps, parallel, runtimeLoop, batch, profile=profile,
+                    units=units)
+    if profile:
+        tfhe_file.write(profileStop("evaluation"))
+
+    if batch:
+        writePhase(tfhe_file, "output_export", exportOutputs(portList, bundle, "output_file"), profile)
+        tfhe_file.write(releaseInputs(bundle))
+        tfhe_file.write("}\n\n")
+        tfhe_file.write(batchMain(slotCount, timeSteps, runtimeLoop, profile))
+    else:
+        writePhase(tfhe_file, "output_export", exportOutputs(portList, bundle), profile)
+        tfhe_file.write(releaseInputs(bundle))
+        tfhe_file.write(deleteCiphertexts(slotCount))
+        if profile:
+            tfhe_file.write('   writeProfile("profile.json");\n')
+        tfhe_file.write("   return 0;\n")
+        tfhe_file.write("}\n")
     tfhe_file.close();
+    codeBytes = os.path.getsize(outputFile)
+    if units is not None:
+        units.write(slots, slotCount)
+        codeBytes += sum(os.path.getsize(filename) for filename in units.files())
+        print("Split", len(units.chunks), "functions over", unitCount, "translation units, build them with: make -f",
+              units.makefile(), "-j")
+    emissionEnd = time.perf_counter()
+
+    estimate = estimateCost(gateOrder, flipFlops, timeSteps, slotCount, parallel, runtimeLoop, codeBytes)
+    printEstimate(estimate)
+    if estimateFile != "":
+        writeEstimate(estimateFile, estimate)
+    if stats is not None:
+        stats["parse_seconds"] = analysisStart - parseStart
+        stats["analysis_seconds"] = emissionStart - analysisStart
+        # the preamble is written before parsing
+        stats["emission_seconds"] = emissionEnd - emissionStart + parseStart - started
+        stats["gates"] = len(gateList)
+        stats["estimate"] = estimate
+
+    if partitionCount > 1:
+        print("Partitioning the circuit...")
+        partitions, cut = partitionNetlist(gateOrder, flipFlops, netList, portList, netDict, partitionCount)
+        for partition in partitions:
+            writePartition(sources["partition_" + str(partition.index) + ".cpp"], partition, gateOrder, flipFlops,
+                           allocateSlots, portList, timeSteps, parallel, runtimeLoop, bundle, profile)
+            print("Partition", partition.index, "evaluates", len(partition.gates), "gates and receives",
+                  len(partition.remoteNets), "nets.")
+        print("Ciphertexts exchanged per evaluation of the gates:", cut)
+        writeEndpoints(outputFile, partitionCount)
+
+    if programs:
+        print("Compiling...")
+        compilePrograms(sources, programs, parallel or batch, partitionCount > 1)
+    if useCache:
+        files = dict(sources)
+        files.update(programs)
+        store(key, files, description)
 
     print("Finished generating TFHE circuit!")
 
-main()
+def compile(netlist, options=None):
+    # generates the program for a netlist without prompting. options holds
+    # any of the DEFAULT_OPTIONS keys and "output", the generated .cpp file
+    # (by default the netlist's name with .cpp). Returns the statistics
+    # recorded by generateCircuit().
+    generatorOptions = dict(DEFAULT_OPTIONS)
+    outputFile = os.path.splitext(netlist)[0] + ".cpp"
+    for key in options or {}:
+        if key == "output":
+            outputFile = options[key]
+        elif key in DEFAULT_OPTIONS:
+            generatorOptions[key] = options[key]
+        else:
+            raise ValueError("unknown option " + key)
+    stats = {"output": outputFile}
+    generateCircuit(netlist, outputFile, generatorOptions, stats)
+    return stats
+
+NETLIST_EXTENSIONS = (".txt", ".edif", ".edf", ".aig", ".aag")
+
+def findNetlists(paths):
+    # the netlists among paths, directories are searched (not recursively)
+    netlists = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if os.path.splitext(name)[1] in NETLIST_EXTENSIONS:
+                    netlists.append(os.path.join(path, name))
+        else:
+            netlists.append(path)
+    return netlists
+
+def compileJob(job):
+    # compiles one netlist of a directory build, logging to a file instead of
+    # interleaving with the other processes
+    netlist, options, logFile = job
+    log = open(logFile, "w")
+    try:
+        with contextlib.redirect_stdout(log):
+            stats = compile(netlist, options)
+    except Exception as error:
+        log.write(repr(error) + "\n")
+        return netlist, None, str(error)
+    finally:
+        log.close()
+    return netlist, stats, None
+
+def commandLine(arguments):
+    parser = argparse.ArgumentParser(description="Generate TFHE programs from EDIF or AIGER netlists.")
+    parser.add_argument("netlists", nargs="+", help="EDIF or AIGER netlists or directories of netlists")
+    parser.add_argument("-o", "--output", help="generated program, for a single netlist")
+    parser.add_argument("--output-dir", help="directory of the generated files (default: next to each netlist)")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1,
+                        help="netlists compiled concurrently (default: one per core)")
+    parser.add_argument("--timesteps", type=int, default=1)
+    parser.add_argument("--parallel", action="store_true", help="evaluate independent gates in parallel")
+    parser.add_argument("--loop", action="store_true", help="emit clock cycles as a runtime loop")
+    parser.add_argument("--rebalance", action="store_true", help="rebalance gates to reduce the depth")
+    parser.add_argument("--duplicate", action="store_true", help="duplicate shared gates while rebalancing")
+    parser.add_argument("--bundle", action="store_true", help="read and write ciphertext bundles")
+    parser.add_argument("--batch", action="store_true", help="evaluate several input bundles in one run")
+    parser.add_argument("--partitions", type=int, default=1)
+    parser.add_argument("--units", type=int, default=0, help="split the gates over this many extra .cpp files")
+    parser.add_argument("--binary", action="store_true", help="also write <name>.bin")
+    parser.add_argument("--ports", action="store_true", help="also write <name>.ports")
+    parser.add_argument("--program", action="store_true", help="compile <name>.cpp into <name>")
+    parser.add_argument("--estimate", action="store_true", help="also write <name>.estimate.json")
+    parser.add_argument("--profile", action="store_true", help="instrument the program to write profile.json")
+    parser.add_argument("--cache", action="store_true", help="reuse cached circuits")
+    args = parser.parse_args(arguments)
+
+    netlists = findNetlists(args.netlists)
+    if len(netlists) == 0:
+        parser.error("no netlists found")
+    if args.output and len(netlists) > 1:
+        parser.error("--output needs a single netlist, use --output-dir")
+
+    jobs = []
+    for netlist in netlists:
+        name = os.path.splitext(os.path.basename(netlist))[0]
+        base = os.path.join(args.output_dir or os.path.dirname(netlist), name)
+        if args.output:
+            base = os.path.splitext(args.output)[0]
+        options = {
+            "output": args.output or base + ".cpp", "timesteps": args.timesteps, "parallel": args.parallel,
+            "loop": args.loop, "rebalance": args.rebalance, "duplicate": args.duplicate, "bundle": args.bundle,
+            "batch": args.batch, "partitions": args.partitions, "binary": base + ".bin" if args.binary else "",
+            "ports": base + ".ports" if args.ports else "", "program": base if args.program else "",
+            "estimate": base + ".estimate.json" if args.estimate else "", "profile": args.profile,
+            "cache": args.cache, "units": args.units,
+        }
+        jobs.append((netlist, options, base + ".log"))
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    if len(jobs) == 1:
+        compile(jobs[0][0], jobs[0][1])
+        return
+
+    failed = 0
+    started = time.perf_counter()
+    pool = multiprocessing.Pool(min(args.jobs, len(jobs)))
+    for netlist, stats, error in pool.imap_unordered(compileJob, jobs):
+        if error is not None:
+            failed += 1
+            print(netlist + ": failed,", error)
+        elif stats.get("cached"):
+            print(netlist + ": cached ->", stats["output"])
+        else:
+            seconds = stats["parse_seconds"] + stats["analysis_seconds"] + stats["emission_seconds"]
+            print(netlist + ":", stats["gates"], "gates,", stats["estimate"]["bootstraps"], "bootstraps,",
+                  round(seconds, 2), "s ->", stats["output"])
+    pool.close()
+    pool.join()
+    print("Generated", len(jobs) - failed, "of", len(jobs), "netlists in", round(time.perf_counter() - started, 1),
+          "s; logs are next to the generated files.")
+    if failed > 0:
+        sys.exit(1)
+
+def main():
+    if len(sys.argv) > 1:
+        commandLine(sys.argv[1:])
+        return
+    inputFile = str(input("Please enter the filename of an EDIF or AIGER netlist: "))
+    outputFile = str(input("Please enter a filename for the generated circuit (.cpp): "))
+    options = dict(DEFAULT_OPTIONS)
+    options["timesteps"] = int(input("Enter the number of timesteps: "))
+    options["parallel"] = "y" in str(input("Evaluate independent gates in parallel? (y/n): ")).lower()
+    options["loop"] = "y" in str(input("Emit clock cycles as a runtime loop? (y/n): ")).lower()
+    options["rebalance"] = "y" in str(input("Rebalance gates to reduce the circuit depth? (y/n): ")).lower()
+    if options["rebalance"]:
+        options["duplicate"] = "y" in str(input("Duplicate shared gates to reduce the depth further? (y/n): ")).lower()
+    options["bundle"] = "y" in str(input("Pack inputs and outputs into single bundle files? (y/n): ")).lower()
+    if options["bundle"]:
+        options["batch"] = "y" in str(input("Evaluate several input bundles in one run (batch mode)? (y/n): ")).lower()
+    if not options["batch"]:
+        options["partitions"] = int(input("Enter the number of partitions to split the circuit into (1 for a single program): "))
+    if options["partitions"] == 1:
+        options["units"] = int(input("Enter the number of extra .cpp files to split the gates into (0 for a single file): "))
+    options["binary"] = str(input("Enter a filename for the binary circuit (leave empty to skip): "))
+    options["ports"] = str(input("Enter a filename for the port map (leave empty to skip): "))
+    options["program"] = str(input("Enter a filename for the compiled program (leave empty to skip compiling): "))
+    options["estimate"] = str(input("Enter a filename for the cost estimate (.json, leave empty to skip): "))
+    options["profile"] = "y" in str(input("Instrument the program to write a timing profile (profile.json)? (y/n): ")).lower()
+    options["cache"] = "y" in str(input("Reuse the cached circuit if this netlist was generated before? (y/n): ")).lower()
+    generateCircuit(inputFile, outputFile, options)
+
+if __name__ == "__main__":
+    main()
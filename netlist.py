@@ -0,0 +1,125 @@
+class Port:
+    # Defines input and output ports
+    def __init__(self, name, direction, length):
+        self.name = name
+        self.direction = direction # input or output
+        self.length = length # number of wires/bits
+        self.nets = [""] * self.length # wires in the port
+
+    def mapNet(self, net): # associate wires with ports
+        for i in nets:
+            if self.nets[i] == "":
+                self.nets[i] = net.name
+
+    def printPort(self): # debugging function
+        print("\nPort ID: " + self.name)
+        print("Direction: " + self.direction)
+        print("# of Wires: " + str(self.length))
+        index = 0
+        for i in self.nets:
+            if i != "":
+                print(str(index) + ": " + i)
+            index = index + 1
+
+class LogicGate:
+    # no per instance dictionary: netlists hold hundreds of thousands of gates
+    __slots__ = ("function", "id", "inputNets", "outputNets", "dependsOnFF", "next_state", "pins", "level")
+
+    def __init__(self, function, id):
+        self.function = function # operation (i.e. XOR, AND, ...)
+        self.id = id # identifier assigned by Yosys
+        self.inputNets = [] # input wires (usually 2, but 1 for NOT, and 3 for MUX)
+        self.outputNets = [] # output wires (usually 1)
+        self.dependsOnFF = False # used to determine if evaluation needs to repeat each clock cycle
+        self.next_state = "" # only used for sequential components
+        self.pins = {} # cell pin name (A, B, S, Y, ...) -> connected net, until linked
+        self.level = 0 # logic level, assigned when the gates are scheduled
+
+    def setInputNets(self, inNet):
+        # associate wire with input of logic gate
+        self.inputNets.append(inNet)
+
+    def setOutputNet(self, outNet):
+        # associate wire with output of logic gate
+        self.outputNets.append(outNet)
+
+
+class Net:
+    __slots__ = ("name", "left", "right", "encValue", "value")
+
+    def __init__(self, name):
+        self.name = name # identifier assigned by Yosys
+        self.left = [] # this net is the output of these gates
+        self.right = [] # gates for which this net is an input
+        self.encValue = 0 # points to the ciphertext on the current wire
+        self.value = "" # plaintext input (only applicable for input nets)
+
+    def setLeft(self, leftGate):
+        # associate wire as the output of a gate
+        self.left.append(leftGate)
+
+    def setRight(self, rightGate):
+        # associate wire as the input of a gate
+        self.right.append(rightGate)
+
+# cell function -> operation evaluated for it
+CELL_OPS = {
+    "AND": "AND", "AN2": "AND",
+    "OR": "OR",
+    "NOT": "NOT", "IV": "NOT",
+    "NAND": "NAND", "ND2": "NAND",
+    "NOR": "NOR", "NR2": "NOR",
+    "XOR": "XOR",
+    "XNOR": "XNOR",
+    "GND": "ZERO",
+    "VCC": "ONE",
+    "ANDNY": "ANDNY", "ANDYN": "ANDYN", "ANDNOT": "ANDYN",
+    "ORNY": "ORNY", "ORYN": "ORYN", "ORNOT": "ORYN",
+    "MUX": "MUX",
+    "BUF": "COPY",
+}
+
+# operations in opcode order; the binary circuit format and evaluator.cpp use
+# the same numbering
+OPCODES = ["AND", "OR", "NOT", "NAND", "NOR", "XOR", "XNOR", "ZERO", "ONE",
+           "ANDNY", "ANDYN", "ORNY", "ORYN", "MUX", "COPY"]
+
+# operand order of cells whose inputs are not interchangeable, it matches the
+# TFHE call (i.e. Yosys' $_MUX_ Y = S ? B : A becomes bootsMUX(Y, S, B, A))
+INPUT_PIN_ORDER = {
+    "ANDNOT": ("A", "B"),
+    "ORNOT": ("A", "B"),
+    "MUX": ("S", "B", "A"),
+}
+
+def isFlipFlop(gate):
+    # flip flops hold state between clock cycles
+    return "DFF" in gate.function or gate.function == "FD1"
+
+def linkNetlist(gateList, netList, portList):
+    # connect every gate to its nets in a single pass over the nets and
+    # return the gates, nets and ports keyed by their identifiers
+    gateDict = {}
+    for gate in gateList:
+        gateDict[gate.id] = gate
+
+    netDict = {}
+    for net in netList:
+        netDict[net.name] = net
+        for leftGate in net.left:
+            leftGate.setOutputNet(net)
+        for rightGate in net.right:
+            rightGate.setInputNets(net)
+
+    # the pins are only needed to order the operands, drop them to save a
+    # dictionary per gate
+    for gate in gateList:
+        if gate.function in INPUT_PIN_ORDER:
+            gate.inputNets = [gate.pins[pin] for pin in INPUT_PIN_ORDER[gate.function]]
+        gate.pins = None
+
+    portDict = {}
+    for port in portList:
+        portDict[port.name] = port
+
+    return gateDict, netDict, portDict
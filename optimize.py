@@ -0,0 +1,190 @@
+from netlist import isFlipFlop
+from analysis import scheduleGates
+
+# cells that need no bootstrapping in TFHE
+FREE_CELLS = ("NOT", "IV", "GND", "VCC", "BUF")
+
+# bootstrapped gates needed by a cell that is not free, 1 unless listed.
+# bootsMUX bootstraps twice before its single key switch.
+BOOTSTRAP_COST = {"MUX": 2}
+
+# value of a gate when one of its inputs is the given constant: either a
+# constant, "BUF" (the other input) or "NOT" (the inverted other input)
+CONSTANT_RULES = {
+    "AND": {0: 0, 1: "BUF"}, "AN2": {0: 0, 1: "BUF"},
+    "NAND": {0: 1, 1: "NOT"}, "ND2": {0: 1, 1: "NOT"},
+    "OR": {0: "BUF", 1: 1},
+    "NOR": {0: "NOT", 1: 0}, "NR2": {0: "NOT", 1: 0},
+    "XOR": {0: "BUF", 1: "NOT"},
+    "XNOR": {0: "NOT", 1: "BUF"},
+    "NOT": {0: 1, 1: 0}, "IV": {0: 1, 1: 0},
+    "BUF": {0: 0, 1: 1},
+}
+
+def bootstrapCost(gate):
+    if isFlipFlop(gate) or gate.function in FREE_CELLS:
+        return 0
+    return BOOTSTRAP_COST.get(gate.function, 1)
+
+def countBootstraps(gateList):
+    # number of (slow) bootstrapping operations needed to evaluate the gates once
+    count = 0
+    for gate in gateList:
+        count += bootstrapCost(gate)
+    return count
+
+def constantValue(net):
+    # 0 or 1 for nets driven by a tie cell, None otherwise
+    if len(net.left) == 1:
+        if net.left[0].function == "GND":
+            return 0
+        if net.left[0].function == "VCC":
+            return 1
+    return None
+
+def detachInputs(gate):
+    for net in gate.inputNets:
+        if gate in net.right:
+            net.right.remove(gate)
+    gate.inputNets = []
+
+def removeGate(gate):
+    detachInputs(gate)
+    for net in gate.outputNets:
+        net.left.remove(gate)
+    gate.outputNets = []
+
+def makeConstant(gate, value):
+    detachInputs(gate)
+    gate.function = "VCC" if value else "GND"
+
+def makeInverter(gate, net):
+    detachInputs(gate)
+    gate.function = "NOT"
+    gate.inputNets = [net]
+    net.right.append(gate)
+
+def makeBuffer(gate, net):
+    detachInputs(gate)
+    gate.function = "BUF"
+    gate.inputNets = [net]
+    net.right.append(gate)
+
+def bypassGate(gate, net, portList):
+    # readers of the gate's output read net instead and the gate disappears.
+    # Port nets keep their names (they name the ciphertext files), so a gate
+    # driving one becomes a copy of net instead.
+    output = gate.outputNets[0]
+    for port in portList:
+        if output.name in port.nets:
+            makeBuffer(gate, net)
+            return
+    for reader in list(output.right):
+        for index in range(len(reader.inputNets)):
+            if reader.inputNets[index] is output:
+                reader.inputNets[index] = net
+                output.right.remove(reader)
+                net.right.append(reader)
+    removeGate(gate)
+
+def removeOverwrittenGates(gateList):
+    # when several gates drive the same net, the readers always see the gate
+    # scheduled last, so the other drivers' results are overwritten. Flip
+    # flops are not scheduled: they write their net when they latch, and in
+    # cycles where the other drivers are not evaluated (loop-invariant logic)
+    # readers see that value, so flip flops are always kept.
+    position = {}
+    for index, gate in enumerate(scheduleGates(gateList)):
+        position[gate] = index
+
+    removed = 0
+    for gate in gateList:
+        if isFlipFlop(gate):
+            continue
+        for net in list(gate.outputNets):
+            if len(net.left) < 2:
+                continue
+            last = max([driver for driver in net.left if not isFlipFlop(driver)], key=lambda driver: position[driver])
+            if gate is not last:
+                net.left.remove(gate)
+                gate.outputNets.remove(net)
+                removed += 1
+    return removed
+
+def propagateConstants(gateList, portList):
+    # folds tie cells into the gates they feed, in topological order so that
+    # folded gates are constant before their readers are visited
+    for gate in scheduleGates(gateList):
+        if len(gate.outputNets) == 0 or gate.function not in CONSTANT_RULES:
+            continue
+        if gate.function == "BUF" and constantValue(gate.inputNets[0]) is None:
+            bypassGate(gate, gate.inputNets[0], portList)
+            continue
+
+        values = [constantValue(net) for net in gate.inputNets]
+        if None not in values and len(values) > 0:
+            result = CONSTANT_RULES[gate.function][values[0]]
+            if len(values) == 2: # both inputs are constant
+                other = values[1]
+                result = {"BUF": other, "NOT": 1 - other}.get(result, result)
+            elif gate.function not in ("NOT", "IV", "BUF"):
+                continue
+            makeConstant(gate, result)
+            continue
+
+        for index, value in enumerate(values):
+            if value is None:
+                continue
+            result = CONSTANT_RULES[gate.function][value]
+            other = gate.inputNets[1 - index]
+            if result == "BUF":
+                bypassGate(gate, other, portList)
+            elif result == "NOT":
+                makeInverter(gate, other)
+            else:
+                makeConstant(gate, result)
+            break
+
+def removeDeadGates(gateList, netList, portList, netDict):
+    # keeps only the gates that can reach an output port, directly or
+    # through flip flops, and the nets still connected to something
+    live = set()
+    pending = []
+    for port in portList:
+        if "OUTPUT" in port.direction:
+            for name in port.nets:
+                if name in netDict:
+                    pending.append(netDict[name])
+
+    visited = set(pending)
+    while pending:
+        net = pending.pop()
+        for gate in net.left:
+            if gate in live:
+                continue
+            live.add(gate)
+            for inputNet in gate.inputNets:
+                if inputNet not in visited:
+                    visited.add(inputNet)
+                    pending.append(inputNet)
+
+    for gate in gateList:
+        if gate not in live:
+            removeGate(gate)
+
+    portNets = set()
+    for port in portList:
+        portNets.update(port.nets)
+
+    newGateList = [gate for gate in gateList if gate in live]
+    newNetList = [net for net in netList if net.left or net.right or net.name in portNets]
+    return newGateList, newNetList
+
+def optimizeNetlist(gateList, netList, portList, netDict):
+    # constant propagation and dead logic elimination. Returns the remaining
+    # gates and nets and the number of bootstrapped gates that were removed.
+    before = countBootstraps(gateList)
+    removeOverwrittenGates(gateList)
+    propagateConstants(gateList, portList)
+    gateList, netList = removeDeadGates(gateList, netList, portList, netDict)
+    return gateList, netList, before - countBootstraps(gateList)
@@ -0,0 +1,190 @@
+from netlist import isFlipFlop
+from optimize import bootstrapCost
+
+# The gates are split into partitions that are evaluated by separate programs
+# and exchange the ciphertexts of the nets crossing partitions (see
+# exchange.h). Every partition gets an equal share of the bootstrapped gates
+# of each logic level, so the programs work concurrently instead of waiting
+# for each other, and gates are kept next to the gates they share nets with.
+# Refinement passes then move single gates between partitions as long as
+# that reduces the number of ciphertexts sent (Fiduccia-Mattheyses style
+# min-cut) without breaking the balance of a level.
+
+# a partition may exceed its share of a level's bootstraps by this fraction
+BALANCE_SLACK = 0.1
+MAX_PASSES = 10
+
+class Partition:
+    def __init__(self, index):
+        self.index = index
+        self.gates = [] # gates evaluated by this partition
+        self.nets = [] # nets with a ciphertext in this partition's program
+        self.remoteNets = set() # nets read here but computed by another partition
+        self.endNets = [] # remote nets needed at the end of a clock cycle (flip flop inputs, outputs)
+        self.sendTo = {} # net computed here -> partitions reading it
+        self.peers = [] # partitions this one sends to
+        self.incoming = 0 # number of partitions sending to this one
+        self.netIds = {} # net -> id of its messages, shared by all partitions
+
+def isExchanged(net):
+    # nets without a driving gate (inputs) are loaded by every partition that
+    # reads them, only computed nets are sent
+    return len(net.left) == 1
+
+def netPins(gate):
+    # nets a gate is connected to; a flip flop only reads its D input
+    return gate.outputNets + gate.inputNets
+
+def cutCost(pins):
+    # ciphertexts sent per evaluation of a net whose pins are counted per partition
+    return len([partition for partition in pins if pins[partition] > 0]) - 1
+
+def moveGain(gate, source, target, pins):
+    # reduction of the cut when gate moves from source to target
+    gain = 0
+    for net in set(netPins(gate)):
+        if not isExchanged(net):
+            continue
+        count = netPins(gate).count(net)
+        before = cutCost(pins[net])
+        pins[net][source] -= count
+        pins[net][target] = pins[net].get(target, 0) + count
+        gain += before - cutCost(pins[net])
+        pins[net][target] -= count
+        pins[net][source] += count
+    return gain
+
+def assignGates(gateOrder, flipFlops, count):
+    # greedy assignment in schedule order: a gate joins the partition holding
+    # most of its inputs unless that partition has its share of the level
+    capacity = {}
+    for gate in gateOrder:
+        capacity[gate.level] = capacity.get(gate.level, 0) + bootstrapCost(gate)
+    for level in capacity:
+        capacity[level] = max(1, int(capacity[level] * (1 + BALANCE_SLACK) / count + 0.999))
+
+    owner = {}
+    load = {}
+    for gate in gateOrder:
+        affinity = [0] * count
+        for net in gate.inputNets:
+            if isExchanged(net) and net.left[0] in owner:
+                affinity[owner[net.left[0]]] += 1
+        weight = bootstrapCost(gate)
+        fits = [partition for partition in range(count) if load.get((partition, gate.level), 0) + weight <= capacity[gate.level]]
+        if not fits:
+            fits = list(range(count))
+        owner[gate] = max(fits, key=lambda partition: (affinity[partition], -load.get((partition, gate.level), 0), -partition))
+        load[(owner[gate], gate.level)] = load.get((owner[gate], gate.level), 0) + weight
+
+    # flip flops do not bootstrap, they stay with the gate computing their input
+    for gate in flipFlops:
+        data = gate.inputNets[0] if gate.inputNets else None
+        owner[gate] = owner.get(data.left[0], 0) if data is not None and isExchanged(data) else 0
+    return owner, load, capacity
+
+def refinePartitions(gates, owner, load, capacity, outputNets):
+    # moves single gates to the partition that reduces the cut the most
+    pins = {}
+    for gate in gates:
+        for net in netPins(gate):
+            if isExchanged(net):
+                pins.setdefault(net, {})
+                pins[net][owner[gate]] = pins[net].get(owner[gate], 0) + 1
+    for net in pins:
+        if net in outputNets:
+            pins[net][0] = pins[net].get(0, 0) + 1 # exported by partition 0
+
+    for rounds in range(MAX_PASSES):
+        moved = False
+        for gate in gates:
+            source = owner[gate]
+            weight = bootstrapCost(gate)
+            candidates = set()
+            for net in netPins(gate):
+                if net in pins:
+                    candidates.update(partition for partition in pins[net] if pins[net][partition] > 0)
+            candidates.discard(source)
+            best = None
+            for target in sorted(candidates):
+                if not isFlipFlop(gate) and load.get((target, gate.level), 0) + weight > capacity[gate.level]:
+                    continue
+                gain = moveGain(gate, source, target, pins)
+                if gain > 0 and (best is None or gain > best[0]):
+                    best = (gain, target)
+            if best is None:
+                continue
+
+            target = best[1]
+            for net in netPins(gate):
+                if net in pins:
+                    pins[net][source] -= 1
+                    pins[net][target] = pins[net].get(target, 0) + 1
+            if not isFlipFlop(gate):
+                load[(source, gate.level)] -= weight
+                load[(target, gate.level)] = load.get((target, gate.level), 0) + weight
+            owner[gate] = target
+            moved = True
+        if not moved:
+            break
+    return sum(cutCost(pins[net]) for net in pins)
+
+def partitionNetlist(gateOrder, flipFlops, netList, portList, netDict, count):
+    # splits the scheduled gates into count partitions; returns the partitions
+    # and the number of ciphertexts sent per evaluation of the circuit
+    outputNets = set()
+    for port in portList:
+        if "OUTPUT" in port.direction:
+            outputNets.update(netDict[name] for name in port.nets if name in netDict)
+
+    owner, load, capacity = assignGates(gateOrder, flipFlops, count)
+    cut = refinePartitions(gateOrder + flipFlops, owner, load, capacity, outputNets)
+
+    partitions = [Partition(index) for index in range(count)]
+    for gate in gateOrder + flipFlops:
+        partitions[owner[gate]].gates.append(gate)
+
+    # partitions reading every computed net; flip flops read their input at
+    # the end of a clock cycle and partition 0 exports the outputs at the end
+    readers = {}
+    atEnd = {}
+    for gate in gateOrder + flipFlops:
+        for net in gate.inputNets:
+            readers.setdefault(net, set()).add(owner[gate])
+            if isFlipFlop(gate):
+                atEnd.setdefault(net, set()).add(owner[gate])
+    for net in outputNets:
+        readers.setdefault(net, set()).add(0)
+        atEnd.setdefault(net, set()).add(0)
+
+    netIds = {}
+    for net in netList:
+        if not isExchanged(net) or net.left[0] not in owner:
+            continue
+        writer = owner[net.left[0]]
+        remote = sorted(readers.get(net, set()) - set([writer]))
+        if not remote:
+            continue
+        netIds[net] = len(netIds)
+        partitions[writer].sendTo[net] = remote
+        for index in remote:
+            partitions[index].remoteNets.add(net)
+            if index in atEnd.get(net, set()):
+                partitions[index].endNets.append(net)
+
+    for partition in partitions:
+        partition.netIds = netIds
+        local = set(partition.remoteNets)
+        for gate in partition.gates:
+            local.update(gate.outputNets)
+            local.update(gate.inputNets)
+        if partition.index == 0:
+            local.update(outputNets)
+        partition.nets = [net for net in netList if net in local]
+        peers = set()
+        for net in partition.sendTo:
+            peers.update(partition.sendTo[net])
+        partition.peers = sorted(peers)
+    for partition in partitions:
+        partition.incoming = len([other for other in partitions if partition.index in other.peers])
+    return partitions, cut
@@ -0,0 +1,13 @@
+# Text description of the circuit's ports for encrypt.cpp, one port per line:
+#
+#   <input|output> <port name> <width>
+#
+# Bit i of a port is the ciphertext stored under (port name, i) in a bundle.
+
+def writePortMap(filename, portList):
+    port_file = open(filename, "w")
+    port_file.write("# direction name width\n")
+    for port in portList:
+        direction = "output" if "OUTPUT" in port.direction else "input"
+        port_file.write(direction + " " + port.name + " " + str(port.length) + "\n")
+    port_file.close()
@@ -0,0 +1,144 @@
+// Timers and gate counters of profiled programs. The generators embed a copy
+// of this file only when profiling is turned on, so programs generated
+// without it contain no timers at all.
+//
+// A profiled program records the time spent loading the key, importing the
+// inputs, evaluating the gates and exporting the outputs, the time and
+// number of evaluations of every gate type, the time of every logic level
+// and of every clock cycle, and writes them as JSON when it exits:
+//
+//   {"total_seconds": ..., "threads": ...,
+//    "phases": {"key_load": ..., "input_import": ..., ...},
+//    "gates": {"AND": {"count": ..., "seconds": ...}, ...},
+//    "levels": [{"level": 1, "gates": ..., "seconds": ...}, ...],
+//    "cycles": [...]}
+//
+// Gate seconds add up the time of every thread, level seconds are wall time.
+// In batch mode, the numbers of all input bundles are added up. Programs
+// split into several translation units include this file in the main unit
+// only; the others call the gate and level timers through declarations in
+// the shared header (PROFILE_DECLARATIONS in codegen.py).
+#include <stdio.h>
+#include <chrono>
+#include <string>
+#include <vector>
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
+// same numbering as the opcodes of codegen.py
+const int PROFILE_OPS = 15;
+static const char* PROFILE_OP_NAMES[] = {"AND", "OR", "NOT", "NAND", "NOR", "XOR", "XNOR", "ZERO", "ONE",
+                                         "ANDNY", "ANDYN", "ORNY", "ORYN", "MUX", "COPY"};
+
+struct ProfileData {
+   std::chrono::steady_clock::time_point started = std::chrono::steady_clock::now();
+   std::vector<std::string> phase_names;
+   std::vector<double> phase_seconds;
+   long long gate_counts[PROFILE_OPS] = {0};
+   double gate_seconds[PROFILE_OPS] = {0};
+   std::vector<long long> level_gates;
+   std::vector<double> level_seconds;
+   std::vector<double> cycle_seconds;
+};
+
+static ProfileData profile_data;
+
+// seconds since the program started
+double profileClock() {
+   return std::chrono::duration<double>(std::chrono::steady_clock::now() - profile_data.started).count();
+}
+
+static void profilePhase(const char* name, double start) {
+   double seconds = profileClock() - start;
+   #pragma omp critical(profile)
+   {
+      size_t i = 0;
+      while (i < profile_data.phase_names.size() && profile_data.phase_names[i] != name) {
+         i++;
+      }
+      if (i == profile_data.phase_names.size()) {
+         profile_data.phase_names.push_back(name);
+         profile_data.phase_seconds.push_back(0);
+      }
+      profile_data.phase_seconds[i] += seconds;
+   }
+}
+
+static void addToLevel(int level, long long gates, double seconds) {
+   if ((int) profile_data.level_seconds.size() < level) {
+      profile_data.level_seconds.resize(level, 0);
+      profile_data.level_gates.resize(level, 0);
+   }
+   profile_data.level_seconds[level - 1] += seconds;
+   profile_data.level_gates[level - 1] += gates;
+}
+
+// a gate of opcode op started at start; level 0 leaves the level times alone
+void profileGate(int op, int level, double start) {
+   double seconds = profileClock() - start;
+   #pragma omp critical(profile)
+   {
+      profile_data.gate_counts[op]++;
+      profile_data.gate_seconds[op] += seconds;
+      if (level > 0) {
+         addToLevel(level, 1, seconds);
+      }
+   }
+}
+
+// a level of count gates evaluated concurrently, started at start
+void profileLevel(int level, int count, double start) {
+   double seconds = profileClock() - start;
+   #pragma omp critical(profile)
+   addToLevel(level, count, seconds);
+}
+
+static void profileCycle(int clock, double start) {
+   double seconds = profileClock() - start;
+   #pragma omp critical(profile)
+   {
+      if ((int) profile_data.cycle_seconds.size() <= clock) {
+         profile_data.cycle_seconds.resize(clock + 1, 0);
+      }
+      profile_data.cycle_seconds[clock] += seconds;
+   }
+}
+
+static void writeProfile(const char* filename) {
+   int threads = 1;
+#ifdef _OPENMP
+   threads = omp_get_max_threads();
+#endif
+   FILE* profile_file = fopen(filename, "w");
+   if (profile_file == NULL) {
+      fprintf(stderr, "cannot write %s\n", filename);
+      return;
+   }
+   fprintf(profile_file, "{\"total_seconds\": %.6f, \"threads\": %d,\n \"phases\": {", profileClock(), threads);
+   for (size_t i = 0; i < profile_data.phase_names.size(); i++) {
+      fprintf(profile_file, "%s\"%s\": %.6f", i > 0 ? ", " : "", profile_data.phase_names[i].c_str(),
+              profile_data.phase_seconds[i]);
+   }
+   fprintf(profile_file, "},\n \"gates\": {");
+   bool first = true;
+   for (int op = 0; op < PROFILE_OPS; op++) {
+      if (profile_data.gate_counts[op] == 0) {
+         continue;
+      }
+      fprintf(profile_file, "%s\"%s\": {\"count\": %lld, \"seconds\": %.6f}", first ? "" : ", ", PROFILE_OP_NAMES[op],
+              profile_data.gate_counts[op], profile_data.gate_seconds[op]);
+      first = false;
+   }
+   fprintf(profile_file, "},\n \"levels\": [");
+   for (size_t i = 0; i < profile_data.level_seconds.size(); i++) {
+      fprintf(profile_file, "%s{\"level\": %d, \"gates\": %lld, \"seconds\": %.6f}", i > 0 ? ", " : "", (int) i + 1,
+              profile_data.level_gates[i], profile_data.level_seconds[i]);
+   }
+   fprintf(profile_file, "],\n \"cycles\": [");
+   for (size_t i = 0; i < profile_data.cycle_seconds.size(); i++) {
+      fprintf(profile_file, "%s%.6f", i > 0 ? ", " : "", profile_data.cycle_seconds[i]);
+   }
+   fprintf(profile_file, "]}\n");
+   fclose(profile_file);
+}
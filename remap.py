@@ -0,0 +1,175 @@
+from itertools import permutations
+
+from netlist import CELL_OPS, isFlipFlop
+from analysis import scheduleGates
+from optimize import FREE_CELLS, BOOTSTRAP_COST, bootstrapCost, countBootstraps, detachInputs, removeGate, \
+    makeConstant, makeInverter, bypassGate, removeDeadGates
+
+# Every gate is re-expressed over small cuts (sets of at most MAX_CUT_SIZE nets
+# that separate it from the inputs) using truth tables. When a single TFHE
+# gate computes the same function over a cut, and the logic it replaces is not
+# shared with other gates, the gate is rewritten. This absorbs inverters into
+# ANDNY/ANDYN/ORNY/ORYN (bootsNOT needs no bootstrapping), collapses NAND
+# networks into XOR/XNOR and recognizes 2:1 multiplexers.
+
+MAX_CUT_SIZE = 3
+MAX_CUTS = 12 # cuts kept per net
+
+# truth tables of the cut leaves, bit i is the value for input combination i
+FULL = 0xFF
+VARIABLES = (0xAA, 0xCC, 0xF0)
+
+# truth table of every operation from the truth tables of its operands
+OP_FUNCTIONS = {
+    "AND": lambda a, b: a & b,
+    "OR": lambda a, b: a | b,
+    "NOT": lambda a: FULL & ~a,
+    "NAND": lambda a, b: FULL & ~(a & b),
+    "NOR": lambda a, b: FULL & ~(a | b),
+    "XOR": lambda a, b: a ^ b,
+    "XNOR": lambda a, b: FULL & ~(a ^ b),
+    "ANDNY": lambda a, b: FULL & ~a & b,
+    "ANDYN": lambda a, b: a & FULL & ~b,
+    "ORNY": lambda a, b: FULL & (~a | b),
+    "ORYN": lambda a, b: FULL & (a | ~b),
+    "MUX": lambda a, b, c: (a & b) | (FULL & ~a & c),
+}
+
+def buildImplementations():
+    # truth table -> (cell function, operand order) for functions that need a
+    # single TFHE gate. Operand order lists positions in the sorted cut.
+    implementations = {0: ("GND", ()), FULL: ("VCC", ())}
+    implementations[VARIABLES[0]] = ("BUF", (0,))
+    implementations[FULL & ~VARIABLES[0]] = ("NOT", (0,))
+    for op, function in OP_FUNCTIONS.items():
+        if op == "NOT":
+            continue
+        arity = function.__code__.co_argcount
+        for order in permutations(range(arity)):
+            table = function(*[VARIABLES[i] for i in order])
+            if table not in implementations:
+                implementations[table] = (op, order)
+    return implementations
+
+IMPLEMENTATIONS = buildImplementations()
+
+def drivingGate(net):
+    # the gate computing a net if it can be looked through, None for inputs,
+    # flip flops and constants
+    if len(net.left) != 1:
+        return None
+    gate = net.left[0]
+    if isFlipFlop(gate) or CELL_OPS.get(gate.function) not in OP_FUNCTIONS:
+        return None
+    return gate
+
+def enumerateCuts(gate, cuts):
+    # merges the cuts of the gate's inputs, smallest cuts first
+    merged = [frozenset()]
+    for net in gate.inputNets:
+        merged = [cut | other for cut in merged for other in cuts[net] if len(cut | other) <= MAX_CUT_SIZE]
+    unique = sorted(set(merged), key=lambda cut: (len(cut), sorted(net.name for net in cut)))
+    return unique[:MAX_CUTS]
+
+def truthTable(net, values):
+    # function of net over the leaves in values (net -> truth table)
+    if net not in values:
+        gate = net.left[0]
+        operands = [truthTable(inputNet, values) for inputNet in gate.inputNets]
+        values[net] = OP_FUNCTIONS[CELL_OPS[gate.function]](*operands)
+    return values[net]
+
+def replacedCost(gate, cut, position, portNets):
+    # bootstraps and gates that disappear when gate is computed from cut
+    # directly: the gate itself and the logic between the cut and the gate
+    # that feeds nothing else
+    cone = set()
+    pending = list(gate.inputNets)
+    while pending:
+        net = pending.pop()
+        if net in cut or drivingGate(net) is None or drivingGate(net) in cone:
+            continue
+        cone.add(drivingGate(net))
+        pending.extend(drivingGate(net).inputNets)
+
+    freed = set([gate])
+    for inner in sorted(cone, key=lambda inner: position[inner], reverse=True):
+        output = inner.outputNets[0]
+        if output.name not in portNets and all(reader in freed for reader in output.right):
+            freed.add(inner)
+    return sum(bootstrapCost(inner) for inner in freed), len(freed)
+
+def releaseNet(net, portNets):
+    # removes gates whose results are no longer read by anything
+    gate = drivingGate(net)
+    if gate is None or len(net.right) > 0 or net.name in portNets:
+        return
+    inputNets = list(gate.inputNets)
+    removeGate(gate)
+    for inputNet in inputNets:
+        releaseNet(inputNet, portNets)
+
+def rewriteGate(gate, function, operands, portList, portNets):
+    oldInputs = list(gate.inputNets)
+    if function == "BUF":
+        bypassGate(gate, operands[0], portList)
+    elif function == "NOT":
+        makeInverter(gate, operands[0])
+    elif function in ("GND", "VCC"):
+        makeConstant(gate, function == "VCC")
+    else:
+        detachInputs(gate)
+        gate.function = function
+        gate.inputNets = operands
+        for net in operands:
+            net.right.append(gate)
+    for net in oldInputs:
+        releaseNet(net, portNets)
+
+def remapNetlist(gateList, netList, portList, netDict):
+    # rewrites the netlist onto the full TFHE gate set, returning the remaining
+    # gates and nets and the bootstrap counts before and after remapping
+    before = countBootstraps(gateList)
+    portNets = set()
+    for port in portList:
+        portNets.update(port.nets)
+
+    gateOrder = scheduleGates(gateList)
+    position = {}
+    for index, gate in enumerate(gateOrder):
+        position[gate] = index
+
+    cuts = {}
+    for net in netList:
+        cuts[net] = [frozenset([net])]
+
+    for gate in gateOrder:
+        if len(gate.outputNets) != 1 or drivingGate(gate.outputNets[0]) is not gate:
+            continue
+
+        best = None
+        for cut in enumerateCuts(gate, cuts):
+            leaves = sorted(cut, key=lambda net: net.name)
+            values = {}
+            for index, net in enumerate(leaves):
+                values[net] = VARIABLES[index]
+            table = truthTable(gate.outputNets[0], values)
+            if table not in IMPLEMENTATIONS:
+                continue
+
+            function, order = IMPLEMENTATIONS[table]
+            newCost = 0 if function in FREE_CELLS else BOOTSTRAP_COST.get(function, 1)
+            bootstraps, gates = replacedCost(gate, cut, position, portNets)
+            gain = (bootstraps - newCost, gates - 1)
+            if gain > (0, 0) and (best is None or gain > best[0]):
+                best = (gain, function, [leaves[index] for index in order])
+
+        if best is not None:
+            rewriteGate(gate, best[1], best[2], portList, portNets)
+
+        output = gate.outputNets[0] if gate.outputNets else None
+        if output is not None and drivingGate(output) is gate:
+            cuts[output] = [frozenset([output])] + enumerateCuts(gate, cuts)
+
+    gateList, netList = removeDeadGates(gateList, netList, portList, netDict)
+    return gateList, netList, before, countBootstraps(gateList)
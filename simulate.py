@@ -0,0 +1,321 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from netlist import isFlipFlop, linkNetlist
+from edif_parser import readNetlist
+from optimize import optimizeNetlist
+from remap import remapNetlist
+from balance import balanceNetlist
+from analysis import analyzeNetlist
+from codegen import gateOp
+
+# Plaintext simulation of a netlist for functional checks in milliseconds
+# instead of bootstrapping every gate. Every net holds its bit of all test
+# vectors packed 64 per uint64 word, so a gate is one NumPy operation over
+# all vectors. Gates run in the order and with the clock cycle semantics of
+# the generated programs: flip flops start at 0, the first cycle evaluates
+# every gate and every later cycle latches the flip flops and evaluates the
+# gates depending on them.
+#
+#   python3 simulate.py NETLIST [--timesteps T] [--vectors N] [--inputs FILE]
+#                       [--output FILE] [--rebalance] [--duplicate] [--check]
+#                       [--reference FILE]
+#
+# Without --inputs, N random vectors are simulated. Input and output files
+# hold one vector per line: the binary value of every input (or output) port
+# in port order, most significant bit first, like the prompts of
+# gen_circuit_verif.py. --check also simulates the netlist as parsed, before
+# optimization, and reports the vectors whose outputs differ. Both sides come
+# from the same parser, so --check only validates optimize/remap/balance.
+#
+# --reference checks the parse as well: it simulates the vectors of a known
+# answer file, whose outputs were computed without the parsers (e.g. by hand
+# from the Verilog source, see ISCAS_85/c17.vectors), and reports the
+# vectors whose outputs differ. The file holds a "timesteps T" line, a line
+# naming the ports ("A B -> Y") and one vector per line in the same layout.
+
+WORD_BITS = 64
+
+# operation -> value of the packed operands a, b, c
+OP_FUNCTIONS = {
+    "AND": lambda a, b, c: a & b,
+    "OR": lambda a, b, c: a | b,
+    "NOT": lambda a, b, c: ~a,
+    "NAND": lambda a, b, c: ~(a & b),
+    "NOR": lambda a, b, c: ~(a | b),
+    "XOR": lambda a, b, c: a ^ b,
+    "XNOR": lambda a, b, c: ~(a ^ b),
+    "ANDNY": lambda a, b, c: ~a & b,
+    "ANDYN": lambda a, b, c: a & ~b,
+    "ORNY": lambda a, b, c: ~a | b,
+    "ORYN": lambda a, b, c: a | ~b,
+    "MUX": lambda a, b, c: (a & b) | (~a & c),
+    "COPY": lambda a, b, c: a,
+}
+
+def packBits(bits):
+    # (vectors, nets) array of 0/1 -> (nets, words) array of uint64 holding
+    # vector v in bit v % 64 of word v // 64
+    vectors, nets = bits.shape
+    words = max(1, (vectors + WORD_BITS - 1) // WORD_BITS)
+    padded = np.zeros((nets, words * WORD_BITS), dtype=np.uint8)
+    padded[:, :vectors] = bits.T
+    return np.packbits(padded, axis=1, bitorder="little").view("<u8")
+
+def unpackBits(packed, vectors):
+    # inverse of packBits
+    bits = np.unpackbits(np.ascontiguousarray(packed).view(np.uint8), axis=1, bitorder="little")
+    return bits[:, :vectors].T
+
+def loadCircuit(inputFile, transform=True, rebalance=False, duplicate=False):
+    # parses the netlist and, with transform, applies the generators'
+    # optimizations; returns the scheduled gates, flip flops, nets, ports and
+    # nets by name
+    gateList, netList, portList = readNetlist(inputFile)
+    gateDict, netDict, portDict = linkNetlist(gateList, netList, portList)
+    if transform:
+        gateList, netList, removedBootstraps = optimizeNetlist(gateList, netList, portList, netDict)
+        gateList, netList, bootstrapsBefore, bootstrapsAfter = remapNetlist(gateList, netList, portList, netDict)
+        if rebalance:
+            gateList, netList = balanceNetlist(gateList, netList, portList, netDict, duplicate)
+    gateOrder = analyzeNetlist(gateList, netList, portList)[1]
+    flipFlops = [gate for gate in gateList if isFlipFlop(gate)]
+    return gateOrder, flipFlops, netList, portList, netDict
+
+def simulateGates(gateOrder, flipFlops, netList, inputs, words, timeSteps):
+    # inputs: net -> packed values; nets nothing drives are 0. Returns the
+    # packed value of every net after timeSteps clock cycles.
+    zero = np.zeros(words, dtype=np.uint64)
+    one = ~zero
+    values = {}
+    for net in netList:
+        values[net] = inputs.get(net, zero)
+    for gate in flipFlops:
+        values[gate.outputNets[0]] = zero
+
+    changing = [gate for gate in gateOrder if gate.dependsOnFF]
+    for clock in range(timeSteps):
+        gates = gateOrder
+        if clock > 0:
+            # every flip flop latches the value its input had before the edge
+            latched = [values[gate.inputNets[0]] for gate in flipFlops]
+            for gate, value in zip(flipFlops, latched):
+                values[gate.outputNets[0]] = value
+            gates = changing
+        for gate in gates:
+            if len(gate.outputNets) == 0:
+                continue # unconnected cells of netlists that were not optimized
+            op = gateOp(gate)
+            if op == "ZERO":
+                values[gate.outputNets[0]] = zero
+            elif op == "ONE":
+                values[gate.outputNets[0]] = one
+            else:
+                operands = [values[net] for net in gate.inputNets] + [None] * (3 - len(gate.inputNets))
+                values[gate.outputNets[0]] = OP_FUNCTIONS[op](operands[0], operands[1], operands[2])
+    return values
+
+def simulatePorts(circuit, inputs, timeSteps):
+    # inputs: input port name -> (vectors, port length) array of 0/1 where
+    # column i is bit i of the port; returns the same for every output port
+    gateOrder, flipFlops, netList, portList, netDict = circuit
+    vectors = len(next(iter(inputs.values()))) if inputs else 1
+    words = max(1, (vectors + WORD_BITS - 1) // WORD_BITS)
+    packedInputs = {}
+    for port in portList:
+        if "INPUT" in port.direction and port.name in inputs:
+            packed = packBits(np.asarray(inputs[port.name], dtype=np.uint8))
+            for i in range(port.length):
+                if port.nets[i] in netDict:
+                    packedInputs[netDict[port.nets[i]]] = packed[i]
+
+    values = simulateGates(gateOrder, flipFlops, netList, packedInputs, words, timeSteps)
+    zero = np.zeros(words, dtype=np.uint64)
+    outputs = {}
+    for port in portList:
+        if "OUTPUT" in port.direction:
+            packed = np.stack([values.get(netDict.get(name), zero) for name in port.nets])
+            outputs[port.name] = unpackBits(packed, vectors)
+    return outputs
+
+def differingVectors(inputFile, inputs, outputs, timeSteps):
+    # bool per vector, set where outputs (of the optimized netlist) differ
+    # from the outputs of the netlist as parsed, before optimization
+    parsed = loadCircuit(inputFile, False)
+    reference = simulatePorts(parsed, inputs, timeSteps)
+    vectors = len(next(iter(inputs.values()))) if inputs else 1
+    mismatches = np.zeros(vectors, dtype=bool)
+    for port in parsed[3]:
+        if "OUTPUT" in port.direction:
+            mismatches |= (outputs[port.name] != reference[port.name]).any(axis=1)
+    return mismatches
+
+def checkNetlist(inputFile, timeSteps, vectors, seed=1, rebalance=False, duplicate=False):
+    # number of random vectors whose outputs over timeSteps clock cycles
+    # change when the netlist is optimized
+    circuit = loadCircuit(inputFile, True, rebalance, duplicate)
+    inputs = randomVectors([port for port in circuit[3] if "INPUT" in port.direction], vectors, seed)
+    outputs = simulatePorts(circuit, inputs, timeSteps)
+    return int(differingVectors(inputFile, inputs, outputs, timeSteps).sum())
+
+def portBits(strings, length):
+    # binary strings, most significant bit first -> (vectors, length) array
+    bits = np.zeros((len(strings), length), dtype=np.uint8)
+    for row, value in enumerate(strings):
+        if len(value) != length or value.strip("01") != "":
+            raise ValueError("expected " + str(length) + " binary digits, got " + value)
+        bits[row] = [int(character) for character in reversed(value)]
+    return bits
+
+def portStrings(bits):
+    return ["".join(str(bit) for bit in reversed(row)) for row in bits]
+
+def readVectors(filename, ports):
+    # one line per vector holding the value of every port
+    strings = [[] for port in ports]
+    vector_file = open(filename, "r")
+    for line in vector_file:
+        fields = line.split()
+        if len(fields) == 0:
+            continue
+        if len(fields) != len(ports):
+            raise ValueError("expected " + str(len(ports)) + " port values per line: " + line.strip())
+        for index, value in enumerate(fields):
+            strings[index].append(value)
+    vector_file.close()
+    inputs = {}
+    for index, port in enumerate(ports):
+        inputs[port.name] = portBits(strings[index], port.length)
+    return inputs
+
+def randomVectors(ports, count, seed):
+    generator = np.random.default_rng(seed)
+    inputs = {}
+    for port in ports:
+        inputs[port.name] = generator.integers(0, 2, size=(count, port.length), dtype=np.uint8)
+    return inputs
+
+def writeVectors(filename, ports, outputs):
+    columns = [portStrings(outputs[port.name]) for port in ports]
+    vector_file = open(filename, "w")
+    for row in zip(*columns):
+        vector_file.write(" ".join(row) + "\n")
+    vector_file.close()
+
+def readReference(filename):
+    # returns the timesteps, input and output port names and vectors
+    # (input values, output values) of a known answer file
+    timeSteps = 1
+    names = None
+    vectors = []
+    reference_file = open(filename, "r")
+    for line in reference_file:
+        line = line.split("#")[0].strip()
+        if line == "":
+            continue
+        if line.startswith("timesteps"):
+            timeSteps = int(line.split()[1])
+        elif names is None:
+            names = [side.split() for side in line.split("->")]
+        else:
+            values = [side.split() for side in line.split("->")]
+            if len(values) != 2 or [len(side) for side in values] != [len(side) for side in names]:
+                raise ValueError("expected " + " -> ".join(" ".join(side) for side in names) + ": " + line)
+            vectors.append(values)
+    reference_file.close()
+    if names is None or len(names) != 2:
+        raise ValueError(filename + " names no ports")
+    return timeSteps, names[0], names[1], vectors
+
+def checkReference(circuit, filename):
+    # simulates the vectors of a known answer file; returns the number of
+    # vectors and the mismatches as printable lines. Every input port of the
+    # netlist needs a column, columns of ports the netlist does not have
+    # (i.e. clocks the parser dropped) are ignored.
+    timeSteps, inputNames, outputNames, vectors = readReference(filename)
+    portList = circuit[3]
+    ports = {}
+    for port in portList:
+        ports[port.name] = port
+    inputs = {}
+    for port in portList:
+        if "INPUT" not in port.direction:
+            continue
+        if port.name not in inputNames:
+            raise ValueError("input " + port.name + " has no value in " + filename)
+        column = inputNames.index(port.name)
+        inputs[port.name] = portBits([values[0][column] for values in vectors], port.length)
+    for name in outputNames:
+        if name not in ports or "OUTPUT" not in ports[name].direction:
+            raise ValueError("the netlist has no output " + name)
+
+    outputs = simulatePorts(circuit, inputs, timeSteps)
+    mismatches = []
+    for index, (inputValues, outputValues) in enumerate(vectors):
+        got = [portStrings(outputs[name][index:index + 1])[0] for name in outputNames]
+        if got != outputValues:
+            mismatches.append(" ".join(inputValues) + " -> " + " ".join(got) + ", expected " + " ".join(outputValues))
+    return len(vectors), mismatches
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a netlist on plaintext test vectors.")
+    parser.add_argument("netlist", help="EDIF or AIGER netlist")
+    parser.add_argument("--timesteps", type=int, default=1)
+    parser.add_argument("--vectors", type=int, default=1000, help="number of random vectors (default: 1000)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--inputs", help="file of input vectors, instead of random ones")
+    parser.add_argument("--output", help="write the output vectors to this file")
+    parser.add_argument("--rebalance", action="store_true")
+    parser.add_argument("--duplicate", action="store_true")
+    parser.add_argument("--check", action="store_true", help="compare with the netlist before optimization")
+    parser.add_argument("--reference", help="compare with the known answers in this file")
+    args = parser.parse_args()
+
+    circuit = loadCircuit(args.netlist, True, args.rebalance, args.duplicate)
+    if args.reference:
+        try:
+            count, mismatches = checkReference(circuit, args.reference)
+        except ValueError as error:
+            # ports that differ from the reference are a failed check too
+            print("Cannot check against", args.reference + ":", error)
+            sys.exit(1)
+        for line in mismatches:
+            print("differs:", line)
+        if mismatches:
+            print(len(mismatches), "of", count, "known answers differ.")
+            sys.exit(1)
+        print("All", count, "known answers match.")
+        return
+    portList = circuit[3]
+    inputPorts = [port for port in portList if "INPUT" in port.direction]
+    outputPorts = [port for port in portList if "OUTPUT" in port.direction]
+    if args.inputs:
+        inputs = readVectors(args.inputs, inputPorts)
+    else:
+        inputs = randomVectors(inputPorts, args.vectors, args.seed)
+    vectors = len(next(iter(inputs.values()))) if inputs else 1
+
+    start = time.perf_counter()
+    outputs = simulatePorts(circuit, inputs, args.timesteps)
+    seconds = time.perf_counter() - start
+    print("Simulated", vectors, "vectors over", args.timesteps, "clock cycles of", len(circuit[0]), "gates in",
+          round(seconds * 1000, 1), "ms.")
+    if args.output:
+        writeVectors(args.output, outputPorts, outputs)
+    elif args.inputs:
+        for row in zip(*[portStrings(outputs[port.name]) for port in outputPorts]):
+            print(" ".join(row))
+
+    if args.check:
+        mismatches = differingVectors(args.netlist, inputs, outputs, args.timesteps)
+        if mismatches.any():
+            print("Outputs differ from the unoptimized netlist for", int(mismatches.sum()), "of", vectors,
+                  "vectors, the first is vector", int(np.argmax(mismatches)))
+            sys.exit(1)
+        print("Outputs match the unoptimized netlist.")
+
+if __name__ == "__main__":
+    main()
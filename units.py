@@ -0,0 +1,134 @@
+import os
+import re
+
+from codegen import parallelTypes, PROFILE_DECLARATIONS
+
+# Large circuits can be split over several translation units, since g++
+# compiles one huge main() serially and with a lot of memory. The gate
+# statements are cut into functions of about CHUNK_GATES gates each (gate
+# calls or rows of the level tables of the parallel mode), spread over
+# <base>_unit<i>.cpp. Every function gets the ciphertext array and declares
+# the nets it uses; the shared header <base>.h describes the array and
+# declares the functions. The generated makefile <base>.mk builds the units
+# in parallel:
+#
+#   make -f <base>.mk -j
+
+CHUNK_GATES = 1000
+
+IDENTIFIER = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+LEVEL_CALL = re.compile(r"(?:\{ double start = profileClock\(\); )?evalLevel\((\w+),")
+
+class TranslationUnits:
+    def __init__(self, base, count, parallel, profile, openmp):
+        self.base = base # path of the main .cpp file without its extension
+        self.count = count # number of unit files besides the main one
+        self.slots = {} # net name -> ciphertext slot, known once allocated
+        self.parallel = parallel
+        self.profile = profile
+        self.openmp = openmp
+        self.tables = {} # level table name -> C++ declaring it
+        self.chunks = [] # statements of every function, in call order
+
+    def header(self):
+        return os.path.basename(self.base) + ".h"
+
+    def unitFile(self, index):
+        return self.base + "_unit" + str(index) + ".cpp"
+
+    def makefile(self):
+        return self.base + ".mk"
+
+    def gates(self, statement):
+        match = LEVEL_CALL.match(statement)
+        if match:
+            return self.tables[match.group(1)].count("\n") - 2
+        return 1
+
+    def split(self, statements):
+        # moves the statements into functions and returns the calls
+        calls = []
+        chunk = []
+        size = 0
+        for statement in statements + [None]:
+            if chunk and (statement is None or size + self.gates(statement) > CHUNK_GATES):
+                calls.append("evaluate_" + str(len(self.chunks)) + "(ciphertexts, bk);")
+                self.chunks.append(chunk)
+                chunk = []
+                size = 0
+            if statement is not None:
+                chunk.append(statement)
+                size += self.gates(statement)
+        return calls
+
+    def chunkFunction(self, index):
+        statements = self.chunks[index]
+        body = ""
+        for statement in statements:
+            match = LEVEL_CALL.match(statement)
+            if match:
+                body += self.tables[match.group(1)]
+        for statement in statements:
+            body += "   " + statement + "\n"
+
+        # declares the nets used, in slot order
+        names = set(IDENTIFIER.findall(body))
+        nets = sorted([name for name in names if name in self.slots], key=lambda name: self.slots[name])
+        code = "void evaluate_" + str(index) + "(LweSample* ciphertexts, const TFheGateBootstrappingCloudKeySet* bk) {\n"
+        for name in nets:
+            code += "   LweSample* " + name + " = &ciphertexts[" + str(self.slots[name]) + "];\n"
+        return code + body + "}\n\n"
+
+    def headerCode(self, slotCount):
+        code = "// shared declarations of the translation units of " + os.path.basename(self.base) + ".cpp\n"
+        code += "#include <tfhe/tfhe.h>\n\n"
+        code += "// every net is a slot of one array of CIPHERTEXT_SLOTS ciphertexts, passed to the functions\n"
+        code += "const int CIPHERTEXT_SLOTS = " + str(slotCount) + ";\n\n"
+        if self.parallel:
+            code += parallelTypes()
+            code += "void evalLevel(const Gate* gates, int count, const TFheGateBootstrappingCloudKeySet* bk);\n\n"
+        if self.profile:
+            code += PROFILE_DECLARATIONS + "\n"
+        for index in range(len(self.chunks)):
+            code += "void evaluate_" + str(index) + "(LweSample* ciphertexts, const TFheGateBootstrappingCloudKeySet* bk);\n"
+        return code
+
+    def makefileCode(self):
+        name = os.path.basename(self.base)
+        objects = [name + ".o"] + [name + "_unit" + str(index) + ".o" for index in range(self.count)]
+        code = "# builds " + name + " from its translation units: make -f " + name + ".mk -j\n"
+        code += "CXX = g++\n"
+        code += "CXXFLAGS = -O2" + (" -fopenmp" if self.openmp else "") + " $(EXTRA_CXXFLAGS)\n"
+        code += "LDLIBS = -ltfhe-spqlios-fma\n"
+        code += "PROGRAM = " + name + "\n"
+        code += "OBJECTS = " + " ".join(objects) + "\n\n"
+        code += "$(PROGRAM): $(OBJECTS)\n"
+        code += "\t$(CXX) $(CXXFLAGS) -o $@ $(OBJECTS) $(LDLIBS)\n\n"
+        code += "%.o: %.cpp " + self.header() + "\n"
+        code += "\t$(CXX) $(CXXFLAGS) -c -o $@ $<\n\n"
+        code += "clean:\n"
+        code += "\trm -f $(PROGRAM) $(OBJECTS)\n"
+        return code
+
+    def write(self, slots, slotCount):
+        # writes the header, the unit files and the makefile once every
+        # statement has been split off; functions are spread evenly
+        for net in slots:
+            self.slots[net.name] = slots[net]
+        header_file = open(os.path.join(os.path.dirname(self.base), self.header()), "w")
+        header_file.write(self.headerCode(slotCount))
+        header_file.close()
+        for unit in range(self.count):
+            unit_file = open(self.unitFile(unit), "w")
+            unit_file.write('#include "' + self.header() + '"\n\n')
+            for index in range(len(self.chunks)):
+                if index * self.count // max(len(self.chunks), 1) == unit:
+                    unit_file.write(self.chunkFunction(index))
+            unit_file.close()
+        make_file = open(self.makefile(), "w")
+        make_file.write(self.makefileCode())
+        make_file.close()
+
+    def files(self):
+        return [os.path.join(os.path.dirname(self.base), self.header()), self.makefile()] + \
+            [self.unitFile(unit) for unit in range(self.count)]